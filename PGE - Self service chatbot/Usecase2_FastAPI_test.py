@@ -1,97 +1,123 @@
 import os
 import json
+import time
 from datetime import datetime
 from tempfile import TemporaryDirectory
 from websockets.sync.client import connect as ws_connect
 from contextlib import asynccontextmanager
 from pathlib import Path
 from fastapi import FastAPI
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse
 import uvicorn
 import asyncio
 
 import autogen
 from autogen import AssistantAgent, UserProxyAgent
+from autogen.io.base import IOStream
 from autogen.io.websockets import IOWebsockets
 from langchain_openai import AzureChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
-from docx import Document as DocxDocument
-from PyPDF2 import PdfReader
 from dotenv import load_dotenv
 
-from prompt import data_collection_prompt, estimation_prompt
+from agent_factory import ESTIMATION_REQUEST, AgentFactory, AgentPool
+from events import RESULT, EventIOStream
+from context_window import CONTEXT_TOKEN_BUDGET
+from deployment_router import deployment_stats
+from metrics import llm_metrics
+from prompt_cache import prompt_meter
+from rate_limiter import limiter_stats
+from response_cache import default_response_cache, response_cache_config
+from semantic_cache import default_semantic_cache
+from speculation import speculation_stats
+from session_runtime import create_session_pool, live_sessions, serve_sessions
+from session_store import SessionStore
 
 # WebSocket Server Port
 PORT = 8080
 
+# "async" serves each client as a task on the event loop (session_runtime.py);
+# "thread" keeps the original one-thread-per-client IOWebsockets server.
+SESSION_RUNTIME = os.getenv("SESSION_RUNTIME", "async")
+
+# Worker processes sharing both ports (async runtime only); session records live in SESSION_DB
+WORKERS = int(os.getenv("WORKERS", "1"))
+
 # LLM Configuration
 llm_config = {
     "timeout": 600,
     "config_list": autogen.config_list_from_json("OAI_CONFIG_LIST"),
     "temperature": 0,
+    **response_cache_config(),
 }
 
+# Agent Pool: prototypes and their OpenAI clients are built once at startup
+if SESSION_RUNTIME == "async":
+    agent_pool = create_session_pool(llm_config)
+    session_store = SessionStore()
+else:
+    agent_pool = AgentPool(
+        AgentFactory(
+            llm_config,
+            stream=True,
+            rate_limit=True,
+            route=True,
+            semantic_cache=default_semantic_cache(),
+            running_summary=True,
+            context_budget=CONTEXT_TOKEN_BUDGET,
+            meter_prompts=True,
+            speculate=True,
+            instrument=True,
+        )
+    )
+
 # Connection Handler Function
 def on_connect(iostream: IOWebsockets) -> None:
     """
     Handles a new WebSocket connection, receives the initial message,
     and starts the chat interaction with Autogen agents.
     """
+    connected_at = time.monotonic()
     print(f" - on_connect(): Connected to client using IOWebsockets {iostream}", flush=True)
     print(" - on_connect(): Receiving message from client.", flush=True)
     
     # 1. Receive Initial Message
     initial_msg = iostream.input()
     
-    # 2. Instantiate Autogen Agents
-    
-    # Data Collection Agent for technical details and estimations
-    data_collection_agent = AssistantAgent(
-        name="data_collection_agent",
-        system_message=data_collection_prompt,
-        llm_config=llm_config,
-    )
-    
-    # Estimation Agent to process collected data and generate estimates
-    estimation_agent = AssistantAgent(
-        name="estimation_agent",
-        system_message=estimation_prompt,
-        llm_config=llm_config,
-        human_input_mode="NEVER",
-    )
-    
-    # 3. Define User Proxy Agent for managing the chat interface
-    user_proxy = UserProxyAgent(
-        name="user_proxy",
-        human_input_mode="ALWAYS",
-        llm_config=llm_config,
-        code_execution_config=False,
-        system_message="You are a helpful assistant."
-    )
+    # 2. Take warm Autogen Agents from the pool
+    session = agent_pool.acquire(connected_at)
+    data_collection_agent, estimation_agent, user_proxy = session
 
-    # 4. Initiate conversation
+    # 3. Initiate conversation
     print(
         f" - on_connect(): Initiating chat with agent {data_collection_agent} using message '{initial_msg}'",
         flush=True,
     )
 
-    # Start sequential chat between agents using `initiate_chats`
-    chat_results = user_proxy.initiate_chats(
-        [
-            {
-                "recipient": data_collection_agent,
-                "message": "You are a Technical architect. Your job is to arrive at the tech stack for a problem statement and also arrive at estimates for the application in scope.",
-                "clear_history": True,
-                "silent": False,
-                "summary_method": "last_msg",
-            },
-            {
-                "recipient": estimation_agent,
-                "message": "Please generate estimates based on the collected information.",
-                "summary_method": "reflection_with_llm",
-            },
-        ]
-    )
+    # Start sequential chat between agents using `initiate_chats`; the client only
+    # receives typed events, not autogen's console output
+    events = EventIOStream(iostream)
+    try:
+        with IOStream.set_default(events):
+            chat_results = user_proxy.initiate_chats(
+                [
+                    {
+                        "recipient": data_collection_agent,
+                        "message": "You are a Technical architect. Your job is to arrive at the tech stack for a problem statement and also arrive at estimates for the application in scope.",
+                        "clear_history": True,
+                        "silent": False,
+                        "summary_method": session.summary_method(),
+                    },
+                    {
+                        "recipient": estimation_agent,
+                        "message": ESTIMATION_REQUEST,
+                        "summary_method": "last_msg",
+                    },
+                ]
+            )
+        events.emit(RESULT, data=session.final_data())
+        print(f" - on_connect(): Session cost {session.cost.snapshot()}", flush=True)
+    finally:
+        agent_pool.release(session)
 
 # HTML Client for WebSocket Communication
 html = """
@@ -210,30 +236,45 @@ html = """
         const ws = new WebSocket('ws://localhost:8080');  
         const userIcon = '<i class="fas fa-user message-icon"></i>';  
         const systemIcon = '<i class="fas fa-robot message-icon"></i>';  
-        sendmess  = ""
+        const streaming = {};
+        // The server sends one typed JSON event per frame (see events.py)
         ws.onmessage = function(event) {  
-            // const data = JSON.parse(event.data);
-            message = event.data
-            console.log( `----${message.trim()}------${sendmess}-----`)
-            console.log("comp  -- ",message==sendmess)
-            if(
-            message.includes("********************************************************************************") ||
-             message.includes("user_proxy")||
-            //  message.includes("--------------------------------------------------------------------------------") ||
-             message.includes("Starting a new chat....")||
-             message.includes("Replying as") 
-             || message.trim()===sendmess.trim()
-        ){
-                console.log("message", message)
-
-                return
-            } 
-            // console.log(event.data)
-            displayMessage(event.data,"system");  
+            const frame = JSON.parse(event.data);
+            switch (frame.type) {
+                case "token":
+                    appendToken(frame);
+                    break;
+                case "agent_message":
+                    showAgentMessage(frame);
+                    break;
+                case "stage":
+                    displayMessage(`*Stage: ${frame.stage.replace("_", " ")}*`, "system");
+                    break;
+                case "input_request":
+                    chatInput.placeholder = "Type your answer...";
+                    chatInput.focus();
+                    break;
+                case "session":
+                    localStorage.setItem('sessionId', frame.session_id);
+                    if (frame.resumed) displayMessage("*Session resumed.*", "system");
+                    break;
+                case "result":
+                    localStorage.removeItem('sessionId');
+                    displayMessage("*Estimation complete.*", "system");
+                    break;
+                case "error":
+                    if (frame.error === "resume_failed") localStorage.removeItem('sessionId');
+                    if (frame.error === "idle_timeout") frame.error = "Session paused after inactivity; reload to resume.";
+                    displayMessage(`*${frame.error}*`, "system");
+                    break;
+            }
         };  
   
         ws.onopen = function() {  
             displayMessage('Connected to the server', 'system');  
+            // Pick up an unfinished interview where it left off
+            const sessionId = localStorage.getItem('sessionId');
+            if (sessionId) ws.send(JSON.stringify({ type: "resume", session_id: sessionId }));
         };  
   
         ws.onclose = function() {  
@@ -247,10 +288,33 @@ html = """
                 displayMessage(message, 'user');  
                 chatInput.value = '';  
                 saveMessage(message, 'user');  
-                sendmess=message
             }  
         }  
   
+        function appendToken(frame) {
+            let entry = streaming[frame.message_id];
+            if (!entry) {
+                const messageElement = document.createElement('div');
+                messageElement.classList.add('message', 'system');
+                messageElement.innerHTML = `${systemIcon}<div class="message-content"></div>`;
+                chatMessages.appendChild(messageElement);
+                entry = streaming[frame.message_id] = { container: messageElement, element: messageElement.lastElementChild, text: "" };
+            }
+            entry.text += frame.delta;
+            entry.element.textContent = entry.text;
+            chatMessages.scrollTop = chatMessages.scrollHeight;
+        }
+
+        function showAgentMessage(frame) {
+            // A streamed reply already has a plain-text bubble; swap it for the rendered message
+            const entry = streaming[frame.message_id];
+            if (entry) {
+                delete streaming[frame.message_id];
+                entry.container.remove();
+            }
+            displayMessage(frame.content, "system");
+        }
+
         function displayMessage(message, type) {  
             const messageElement = document.createElement('div');  
             messageElement.classList.add('message', type);  
@@ -267,6 +331,7 @@ html = """
         function clearMessages() {  
             chatMessages.innerHTML = '';  
             localStorage.removeItem('chatMessages');  
+            localStorage.removeItem('sessionId');
         }  
   
         function saveMessage(message, type) {  
@@ -301,9 +366,14 @@ async def run_websocket_server(app):
     Asynchronously runs the WebSocket server for handling chat communication
     using FastAPI.
     """
-    with IOWebsockets.run_server_in_thread(on_connect=on_connect, port=8080) as uri:
-        print(f"Websocket server started at {uri}.", flush=True)
-        yield
+    if SESSION_RUNTIME == "async":
+        async with serve_sessions(agent_pool, port=PORT, store=session_store, reuse_port=WORKERS > 1):
+            print(f"Async websocket server started at ws://0.0.0.0:{PORT}.", flush=True)
+            yield
+    else:
+        with IOWebsockets.run_server_in_thread(on_connect=on_connect, port=PORT) as uri:
+            print(f"Websocket server started at {uri}.", flush=True)
+            yield
 
 # FastAPI App Configuration
 app = FastAPI(lifespan=run_websocket_server)
@@ -313,6 +383,45 @@ app = FastAPI(lifespan=run_websocket_server)
 async def get():
     return HTMLResponse(html)
 
+# Route to report connection-to-first-question latency
+@app.get("/stats/latency")
+async def latency():
+    return agent_pool.factory.latency_stats()
+
+# Route to report the live sessions of this worker and the memory their histories hold
+@app.get("/stats/sessions")
+async def sessions():
+    stats = {**live_sessions.snapshot(), "speculation": speculation_stats()}
+    if SESSION_RUNTIME == "async":
+        stats["stored"] = session_store.counts()
+    return stats
+
+# Route to report the rate limiter's budgets and queue wait per deployment
+@app.get("/stats/rate_limit")
+async def rate_limit():
+    return limiter_stats()
+
+# Route to report latency, error rate and breaker state of each deployment
+@app.get("/stats/deployments")
+async def deployments():
+    return deployment_stats()
+
+# Route to expose per-agent LLM call metrics to Prometheus
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(llm_metrics.render(), media_type="text/plain; version=0.0.4")
+
+# Route to report response cache size and hit rates, and prompt tokens the provider could serve from its cache
+@app.get("/stats/cache")
+async def cache():
+    response_cache = default_response_cache()
+    semantic_cache = default_semantic_cache()
+    return {
+        "responses": response_cache.stats() if response_cache is not None else {"enabled": False},
+        "openings": semantic_cache.stats() if semantic_cache is not None else {"enabled": False},
+        "prompt_prefix": prompt_meter.stats(),
+    }
+
 # Main Function to Run FastAPI Server
 async def main():
     """
@@ -323,4 +432,10 @@ async def main():
     await server.serve()
 
 # Start the WebSocket Server
-asyncio.run(main())
+if __name__ == "__main__":
+    if WORKERS > 1 and SESSION_RUNTIME == "async":
+        # uvicorn forks the workers and shares the HTTP port; each worker's lifespan
+        # binds the websocket port with SO_REUSEPORT
+        uvicorn.run("Usecase2_FastAPI_test:app", workers=WORKERS)
+    else:
+        asyncio.run(main())
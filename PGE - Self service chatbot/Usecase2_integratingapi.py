@@ -11,12 +11,11 @@ import uvicorn
 import asyncio
 
 import autogen
+from response_cache import response_cache_config
 from autogen import AssistantAgent, UserProxyAgent
 from autogen.io.websockets import IOWebsockets
 from langchain_openai import AzureChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
-from docx import Document as DocxDocument
-from PyPDF2 import PdfReader
 from dotenv import load_dotenv
 
 # WebSocket Server Port
@@ -27,6 +26,7 @@ llm_config = {
     "timeout": 600,
     "config_list": autogen.config_list_from_json("OAI_CONFIG_LIST"),
     "temperature": 0,
+    **response_cache_config(),
 }
 
 # Connection Handler Function
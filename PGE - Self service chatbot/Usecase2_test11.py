@@ -2,11 +2,12 @@ import os
 import json
 from langchain_openai import AzureChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
-from docx import Document as DocxDocument
-from PyPDF2 import PdfReader
 from dotenv import load_dotenv
 from autogen import AssistantAgent, UserProxyAgent
 import autogen
+from document_formats import read_document
+from response_cache import response_cache_config
+from stage_graph import Stage, StageGraph, with_carryover
 
 # -------------------- Load Environment Variables --------------------
 load_dotenv()
@@ -25,31 +26,9 @@ llm_config = {
     "timeout": 600,
     "config_list": autogen.config_list_from_json("OAI_CONFIG_LIST"),
     "temperature": 0,
+    **response_cache_config(),
 }
 
-# -------------------- Define Helper Functions --------------------
-def extract_text_from_docx(docx_path):
-    doc = DocxDocument(docx_path)
-    return "\n".join([para.text for para in doc.paragraphs])
-
-def extract_text_from_pdf(pdf_path):
-    reader = PdfReader(pdf_path)
-    return "\n".join(page.extract_text() for page in reader.pages)
-
-def read_document(file_path):
-    if not file_path or not os.path.exists(file_path):
-        return None
-
-    if file_path.endswith(".txt"):
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return f.read()
-    elif file_path.endswith(".docx"):
-        return extract_text_from_docx(file_path)
-    elif file_path.endswith(".pdf"):
-        return extract_text_from_pdf(file_path)
-    else:
-        return "Unsupported file format. Please provide a valid TXT, DOCX, or PDF file."
-
 # -------------------- Define Individual Agents for Each Section --------------------
 wbs_agent = AssistantAgent(
     name="wbs_agent",
@@ -118,6 +97,57 @@ user_proxy = UserProxyAgent(
     },
 )
 
+# -------------------- Section Graph --------------------
+# Agent -> (opening message, agents whose chat summary it needs as carryover).
+SECTIONS = {
+    wbs_agent: (None, ()),
+    assumptions_agent: ("Please gather project assumptions based on this data.", (wbs_agent,)),
+    resource_types_agent: ("Please identify the types of resources required based on this data.", (wbs_agent,)),
+    user_volume_agent: ("Please estimate the user volume and deployment scope based on this data.", (wbs_agent,)),
+    resource_cost_agent: ("Please estimate the resource costs based on this data.", (resource_types_agent,)),
+    tech_stack_cost_agent: ("Please gather the tech stack costs based on this data.", (wbs_agent,)),
+    infrastructure_cost_agent: ("Please gather the infrastructure costs based on this data.", (user_volume_agent,)),
+    total_ownership_cost_agent: (
+        "Please estimate the total cost of ownership over three years based on this data.",
+        (resource_cost_agent, tech_stack_cost_agent, infrastructure_cost_agent),
+    ),
+    excel_cost_estimation_agent: (
+        "Please gather the detailed cost estimation for the Excel artifact based on this data.",
+        (wbs_agent, assumptions_agent, total_ownership_cost_agent),
+    ),
+}
+
+# Keys of the final report, by agent name.
+SECTION_KEYS = {
+    "WBS": wbs_agent.name,
+    "Assumptions": assumptions_agent.name,
+    "Resource Cost": resource_cost_agent.name,
+    "Tech Stack Cost": tech_stack_cost_agent.name,
+    "Infrastructure Cost": infrastructure_cost_agent.name,
+    "Total Ownership Cost": total_ownership_cost_agent.name,
+    "Excel Cost Estimation": excel_cost_estimation_agent.name,
+    "Resource Types": resource_types_agent.name,
+    "User Volume": user_volume_agent.name,
+}
+
+def _section_chat(agent, message):
+    def run(upstream):
+        chat_result = user_proxy.initiate_chat(
+            recipient=agent,
+            message=with_carryover(message, upstream),
+            summary_method="reflection_with_llm",
+        )
+        return chat_result.summary
+
+    return run
+
+def build_section_graph(content):
+    # wbs_agent opens with the document itself.
+    return StageGraph(
+        Stage(agent.name, _section_chat(agent, message or content), after=[dependency.name for dependency in after])
+        for agent, (message, after) in SECTIONS.items()
+    )
+
 # -------------------- Main Logic --------------------
 def process_document_or_summary(doc_path=None):
     """Process document or initiate with user-provided summary."""
@@ -129,53 +159,21 @@ def process_document_or_summary(doc_path=None):
         print("No document provided. Please enter a summary.\n")
         content = input("Enter a summary of the process: ")
 
-    # Define initial task messages for each agent, passing `content` to `wbs_agent`
-    tasks = [
-        {
-            "recipient": wbs_agent,
-            "message": content,
-            "summary_method": "reflection_with_llm",
-        },
-        {
-            "recipient": assumptions_agent,
-            "message": "Please gather project assumptions based on this data.",
-            "summary_method": "reflection_with_llm",
-        },
-    ]
-
-    # Initiate chats sequentially with each agent
-    chat_results = user_proxy.initiate_chats(tasks)
-
-    # Display final collected and processed data
-    final_data = {}
-    
-    # Collect responses from each agent's chat messages
-    #final_data["summary"] = content  # Add the initial content summary
-
-    # Retrieve the final response messages from each agent and store them in the final data dictionary
-    test = wbs_agent.chat_messages
-    print(test)
-
-    test2 = chat_results
-    print(test2)
-
-    test3 = chat_results.summary
-    print(test3)
-    
-    # final_data["WBS"] = wbs_agent.chat_messages#[user_proxy][-2]["content"]
-    # final_data["Assumptions"] = assumptions_agent.chat_messages[user_proxy][-2]["content"]
-    # final_data["Resource Cost"] = resource_cost_agent.chat_messages[user_proxy][-2]["content"]
-    # final_data["Tech Stack Cost"] = tech_stack_cost_agent.chat_messages[user_proxy][-2]["content"]
-    # final_data["Infrastructure Cost"] = infrastructure_cost_agent.chat_messages[user_proxy][-2]["content"]
-    # final_data["Total Ownership Cost"] = total_ownership_cost_agent.chat_messages[user_proxy][-2]["content"]
-    # final_data["Excel Cost Estimation"] = excel_cost_estimation_agent.chat_messages[user_proxy][-2]["content"]
-    # final_data["Resource Types"] = resource_types_agent.chat_messages[user_proxy][-2]["content"]
-    # final_data["User Volume"] = user_volume_agent.chat_messages[user_proxy][-2]["content"]
+    # Run the section chats in dependency order; each starts from its inputs' summaries as carryover
+    graph = build_section_graph(content)
+    # The agents question the user on the console, so one chat at a time.
+    summaries = graph.run(max_concurrency=1)
+    print("\n" + graph.report())
+
+    final_data = {"summary": content}
+    for key, name in SECTION_KEYS.items():
+        final_data[key] = summaries[name]
 
     # Print the final data for verification
     print("\n*************************Final Project Estimation*****************************")
 
     print(json.dumps(final_data, indent=2))
+    return final_data
 
 
 # -------------------- Execution --------------------
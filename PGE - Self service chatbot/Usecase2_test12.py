@@ -9,9 +9,9 @@ from autogen import AssistantAgent, UserProxyAgent
 from websockets.sync.client import connect as ws_connect
 from autogen.io.websockets import IOWebsockets
 import autogen
+from document_formats import read_document
+from response_cache import response_cache_config
 from dotenv import load_dotenv
-from docx import Document as DocxDocument
-from PyPDF2 import PdfReader
 import uvicorn
 
 from contextlib import asynccontextmanager  # noqa: E402
@@ -37,6 +37,7 @@ llm_config = {
     "timeout": 600,
     "config_list": autogen.config_list_from_json("OAI_CONFIG_LIST"),
     "temperature": 0,
+    **response_cache_config(),
 }
 
 # -------------------- Define Agents --------------------
@@ -63,28 +64,6 @@ user_proxy = UserProxyAgent(
     system_message="You are a helpful assistant."
 )
 
-# -------------------- Helper Functions --------------------
-def extract_text_from_docx(docx_path):
-    doc = DocxDocument(docx_path)
-    return "\n".join([para.text for para in doc.paragraphs])
-
-def extract_text_from_pdf(pdf_path):
-    reader = PdfReader(pdf_path)
-    return "\n".join(page.extract_text() for page in reader.pages)
-
-def read_document(file_path):
-    if not file_path or not os.path.exists(file_path):
-        return None
-    if file_path.endswith(".txt"):
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return f.read()
-    elif file_path.endswith(".docx"):
-        return extract_text_from_docx(file_path)
-    elif file_path.endswith(".pdf"):
-        return extract_text_from_pdf(file_path)
-    else:
-        return "Unsupported file format. Please provide a valid TXT, DOCX, or PDF file."
-
 # -------------------- Main Logic --------------------
 def analyze_and_start_autogen_qa(content):
     """Use Autogen to analyze content and initiate Q&A."""
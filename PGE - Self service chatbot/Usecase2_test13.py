@@ -6,6 +6,7 @@ from fastapi.responses import HTMLResponse
 from autogen import AssistantAgent, UserProxyAgent
 from autogen.io.websockets import IOWebsockets
 import autogen
+from response_cache import response_cache_config
 import uvicorn
 from contextlib import asynccontextmanager
 import asyncio
@@ -26,6 +27,7 @@ llm_config = {
     "timeout": 600,
     "config_list": autogen.config_list_from_json("OAI_CONFIG_LIST"),
     "temperature": 0,
+    **response_cache_config(),
 }
 
 # Initialize FastAPI app
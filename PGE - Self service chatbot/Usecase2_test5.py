@@ -2,11 +2,11 @@ import os
 import json
 from langchain_openai import AzureChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
-from docx import Document as DocxDocument
-from PyPDF2 import PdfReader
 from dotenv import load_dotenv
 from autogen import AssistantAgent, UserProxyAgent
 import autogen
+from document_formats import read_document
+from response_cache import response_cache_config
 
 # -------------------- Load Environment Variables --------------------
 load_dotenv()
@@ -25,6 +25,7 @@ llm_config = {
     "timeout": 600,
     "config_list": autogen.config_list_from_json("OAI_CONFIG_LIST"),
     "temperature": 0,
+    **response_cache_config(),
 }
 
 # Initialize Autogen Agents
@@ -56,29 +57,6 @@ user_proxy = UserProxyAgent(
     system_message="You are a helpful assistant."
 )
 
-# -------------------- Helper Functions --------------------
-def extract_text_from_docx(docx_path):
-    doc = DocxDocument(docx_path)
-    return "\n".join([para.text for para in doc.paragraphs])
-
-def extract_text_from_pdf(pdf_path):
-    reader = PdfReader(pdf_path)
-    return "\n".join(page.extract_text() for page in reader.pages)
-
-def read_document(file_path):
-    if not file_path or not os.path.exists(file_path):
-        return None
-
-    if file_path.endswith(".txt"):
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return f.read()
-    elif file_path.endswith(".docx"):
-        return extract_text_from_docx(file_path)
-    elif file_path.endswith(".pdf"):
-        return extract_text_from_pdf(file_path)
-    else:
-        return "Unsupported file format. Please provide a valid TXT, DOCX, or PDF file."
-
 # -------------------- Main Logic --------------------
 def analyze_and_start_autogen_qa(content):
     """Use Autogen to analyze content and initiate Q&A."""
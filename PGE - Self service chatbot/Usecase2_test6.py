@@ -2,11 +2,13 @@ import os
 import json
 from langchain_openai import AzureChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
-from docx import Document as DocxDocument
-from PyPDF2 import PdfReader
 from dotenv import load_dotenv
 from autogen import AssistantAgent, UserProxyAgent
 import autogen
+from document_formats import read_document
+from rate_limiter import rate_limit_agents, without_sdk_retries
+from response_cache import response_cache_config
+from stage_graph import Stage, StageGraph, with_carryover
 
 # -------------------- Load Environment Variables --------------------
 load_dotenv()
@@ -20,61 +22,69 @@ llm_model = os.getenv("LLM_MODEL")
 if not all([api_version, endpoint, api_key, deployment_name, llm_model]):
     raise ValueError("Some environment variables are missing. Check your .env file.")
 
+# Specialist agents called at once; 1 runs them one after another.
+AGENT_CONCURRENCY = int(os.getenv("AGENT_CONCURRENCY", "10"))
+
 # Configure Autogen LLM
 llm_config = {
     "timeout": 600,
     "config_list": autogen.config_list_from_json("OAI_CONFIG_LIST"),
     "temperature": 0,
+    **response_cache_config(),
 }
+# The specialists' clients are rate limited, which retries 429s itself.
+specialist_llm_config = without_sdk_retries(llm_config)
 
 # -------------------- Initialize Autogen Agents --------------------
 agents = {
     "wbs_effort_agent": AssistantAgent(
         name="wbs_effort_agent",
         system_message="Analyze the provided information and produce a detailed work breakdown structure (WBS) and effort estimation for the project without asking further questions.",
-        llm_config=llm_config,
+        llm_config=specialist_llm_config,
     ),
     "assumptions_agent": AssistantAgent(
         name="assumptions_agent",
         system_message="Based on the collected information, list all assumptions made in the project as a text format. Do not ask any additional questions.",
-        llm_config=llm_config,
+        llm_config=specialist_llm_config,
     ),
     "resource_cost_agent": AssistantAgent(
         name="resource_cost_agent",
         system_message="Using the collected data, provide an estimation of the resource costs required for the project. Avoid asking any further questions.",
-        llm_config=llm_config,
+        llm_config=specialist_llm_config,
     ),
     "tech_stack_cost_agent": AssistantAgent(
         name="tech_stack_cost_agent",
         system_message="Calculate the estimated costs associated with the tech stack involved in the project using only the provided data. Do not initiate further questions.",
-        llm_config=llm_config,
+        llm_config=specialist_llm_config,
     ),
     "infra_cost_agent": AssistantAgent(
         name="infra_cost_agent",
         system_message="Estimate the infrastructure costs required for the project based solely on the collected information. Do not ask any questions.",
-        llm_config=llm_config,
+        llm_config=specialist_llm_config,
     ),
     "tco_agent": AssistantAgent(
         name="tco_agent",
         system_message="Using the collected data, provide the total cost of ownership for three years, covering all expenses. Avoid asking any further questions.",
-        llm_config=llm_config,
+        llm_config=specialist_llm_config,
     ),
     "cost_estimation_agent": AssistantAgent(
         name="cost_estimation_agent",
         system_message="Generate a detailed cost estimation artifact as an Excel document for the project based on the information collected. Do not ask any additional questions.",
-        llm_config=llm_config,
+        llm_config=specialist_llm_config,
     ),
     "resource_type_agent": AssistantAgent(
         name="resource_type_agent",
         system_message="Specify the types of resources required for the project using only the provided data. Avoid further questioning.",
-        llm_config=llm_config,
+        llm_config=specialist_llm_config,
     ),
     "usage_volume_agent": AssistantAgent(
         name="usage_volume_agent",
         system_message="Based on the collected information, determine the intended user base and estimated usage volume for the deployment of the project. Do not ask any additional questions.",
-        llm_config=llm_config,
+        llm_config=specialist_llm_config,
     ),
 }
+# The specialists run concurrently; pace them so they share the deployment quota without 429s.
+rate_limit_agents(*agents.values())
 
 user_proxy = UserProxyAgent(
     "user_proxy",
@@ -102,29 +112,6 @@ data_collection_agent = AssistantAgent(
     llm_config=llm_config,
 )
 
-# -------------------- Helper Functions --------------------
-def extract_text_from_docx(docx_path):
-    doc = DocxDocument(docx_path)
-    return "\n".join([para.text for para in doc.paragraphs])
-
-def extract_text_from_pdf(pdf_path):
-    reader = PdfReader(pdf_path)
-    return "\n".join(page.extract_text() for page in reader.pages)
-
-def read_document(file_path):
-    if not file_path or not os.path.exists(file_path):
-        return None
-
-    if file_path.endswith(".txt"):
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return f.read()
-    elif file_path.endswith(".docx"):
-        return extract_text_from_docx(file_path)
-    elif file_path.endswith(".pdf"):
-        return extract_text_from_pdf(file_path)
-    else:
-        return "Unsupported file format. Please provide a valid TXT, DOCX, or PDF file."
-
 # -------------------- Main Logic --------------------
 def collect_data_with_data_collection_agent(content):
     """Use data collection agent to ask sequential questions and gather responses."""
@@ -159,23 +146,40 @@ def collect_data_with_data_collection_agent(content):
 
     return collected_data
 
-def process_with_agents(collected_data):
-    """Send collected data to each agent and gather their responses."""
-    results = {}
-
-    for key, agent in agents.items():
-        input_message = collected_data.get(data_collection_agent.name, "")
-        if input_message:
-            response = agent.initiate_chat(
-                recipient=agent,
-                message=input_message,
-                silent=True,
-            )
-            # Capture the response and add to results dictionary
-            agent_response = agent.chat_messages[user_proxy][-2]["content"]
-            results[key] = agent_response
-            print(f"\nResponse from {agent.name}: {agent_response}")
+# Stages whose answer builds on other specialists' answers; every other agent only reads the collected data.
+AGENT_INPUTS = {
+    "tco_agent": ("resource_cost_agent", "tech_stack_cost_agent", "infra_cost_agent"),
+}
 
+def _agent_stage(agent, input_message):
+    async def run(upstream):
+        # Answers of the stages it depends on are carried over after the collected data.
+        reply = await agent.a_generate_reply(
+            messages=[{"role": "user", "content": with_carryover(input_message, upstream)}],
+            sender=user_proxy,
+        )
+        content = reply.get("content") if isinstance(reply, dict) else reply
+        print(f"\nResponse from {agent.name}: {content}")
+        return content
+
+    return run
+
+def build_agent_graph(input_message):
+    return StageGraph(
+        Stage(key, _agent_stage(agent, input_message), after=AGENT_INPUTS.get(key, ()))
+        for key, agent in agents.items()
+    )
+
+def process_with_agents(collected_data, concurrency=AGENT_CONCURRENCY):
+    """Send collected data to each agent and gather their responses."""
+    input_message = collected_data.get(data_collection_agent.name, "")
+    if not input_message:
+        return {}
+
+    graph = build_agent_graph(input_message)
+    # Same order as the agents dict, whichever finished first.
+    results = graph.run(max_concurrency=concurrency)
+    print("\n" + graph.report())
     return results
 
 def process_document_or_summary(doc_path=None):
@@ -2,11 +2,13 @@ import os
 import json
 from langchain_openai import AzureChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
-from docx import Document as DocxDocument
-from PyPDF2 import PdfReader
 from dotenv import load_dotenv
 from autogen import AssistantAgent, UserProxyAgent
 import autogen
+from openai import APIError
+from document_formats import read_document
+from response_cache import response_cache_config
+from stage_graph import Stage, StageGraph, with_carryover
 
 # -------------------- Load Environment Variables --------------------
 load_dotenv()
@@ -25,6 +27,7 @@ llm_config = {
     "timeout": 600,
     "config_list": autogen.config_list_from_json("OAI_CONFIG_LIST"),
     "temperature": 0,
+    **response_cache_config(),
 }
 
 # -------------------- Initialize Single Data Collection Agent --------------------
@@ -54,29 +57,6 @@ user_proxy = UserProxyAgent(
     system_message="You are a helpful assistant."
 )
 
-# -------------------- Helper Functions --------------------
-def extract_text_from_docx(docx_path):
-    doc = DocxDocument(docx_path)
-    return "\n".join([para.text for para in doc.paragraphs])
-
-def extract_text_from_pdf(pdf_path):
-    reader = PdfReader(pdf_path)
-    return "\n".join(page.extract_text() for page in reader.pages)
-
-def read_document(file_path):
-    if not file_path or not os.path.exists(file_path):
-        return None
-
-    if file_path.endswith(".txt"):
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return f.read()
-    elif file_path.endswith(".docx"):
-        return extract_text_from_docx(file_path)
-    elif file_path.endswith(".pdf"):
-        return extract_text_from_pdf(file_path)
-    else:
-        return "Unsupported file format. Please provide a valid TXT, DOCX, or PDF file."
-
 # -------------------- Data Collection Process --------------------
 def collect_data_with_data_collection_agent(content):
     """Use data collection agent to ask sequential questions and gather responses."""
@@ -113,55 +93,173 @@ def collect_data_with_data_collection_agent(content):
     return collected_data
 
 # -------------------- Specialized Prompts for Each Section --------------------
-def generate_wbs(data):
-    prompt = f"Based on the following project details, generate a detailed Work Breakdown Structure (WBS):\n\n{data}"
-    response = data_collection_agent.initiate_chat(
-        recipient=data_collection_agent,
-        message=prompt,
-        silent=True,
-        human_input_mode="NEVER",
+def _generate_section(prompt):
+    # One stateless turn per section, so sections can be generated at the same time.
+    reply = data_collection_agent.generate_reply(
+        messages=[{"role": "user", "content": prompt}],
+        sender=user_proxy,
     )
-    return response.chat_messages[user_proxy][-1]["content"]
+    return reply.get("content") if isinstance(reply, dict) else reply
+
+def generate_wbs(data, upstream=None):
+    prompt = f"Based on the following project details, generate a detailed Work Breakdown Structure (WBS):\n\n{data}"
+    return _generate_section(with_carryover(prompt, upstream or {}))
 
-def generate_cost_estimation(data):
+def generate_cost_estimation(data, upstream=None):
     prompt = f"Using the project information provided, estimate the costs including resource costs, tech stack costs, infrastructure costs, and provide a total cost of ownership for three years:\n\n{data}"
-    response = data_collection_agent.initiate_chat(
-        recipient=data_collection_agent,
-        message=prompt,
-        silent=True,
-        human_input_mode="NEVER",
-    )
-    return response.chat_messages[user_proxy][-1]["content"]
+    return _generate_section(with_carryover(prompt, upstream or {}))
 
-def generate_assumptions(data):
+def generate_assumptions(data, upstream=None):
     prompt = f"List any assumptions made in the project planning based on the provided information:\n\n{data}"
-    response = data_collection_agent.initiate_chat(
-        recipient=data_collection_agent,
-        message=prompt,
-        silent=True,
-        human_input_mode="NEVER",
-    )
-    return response.chat_messages[user_proxy][-1]["content"]
+    return _generate_section(with_carryover(prompt, upstream or {}))
 
-def generate_resource_types(data):
+def generate_resource_types(data, upstream=None):
     prompt = f"Based on the provided project data, specify the types of resources required:\n\n{data}"
-    response = data_collection_agent.initiate_chat(
-        recipient=data_collection_agent,
-        message=prompt,
-        silent=True,
-        human_input_mode="NEVER",
-    )
-    return response.chat_messages[user_proxy][-1]["content"]
+    return _generate_section(with_carryover(prompt, upstream or {}))
 
-def generate_usage_volume(data):
+def generate_usage_volume(data, upstream=None):
     prompt = f"Determine the estimated user volume and expected deployment requirements from the following data:\n\n{data}"
-    response = data_collection_agent.initiate_chat(
-        recipient=data_collection_agent,
-        message=prompt,
-        silent=True,
-        human_input_mode="NEVER",
+    return _generate_section(with_carryover(prompt, upstream or {}))
+
+# Section -> (generator, sections whose output it builds on). Costs are derived from
+# the WBS effort, the resource mix and the deployment volume; the rest only read the data.
+SECTIONS = {
+    "WBS": (generate_wbs, ()),
+    "Cost Estimation": (generate_cost_estimation, ("WBS", "Resource Types", "Usage Volume")),
+    "Assumptions": (generate_assumptions, ()),
+    "Resource Types": (generate_resource_types, ()),
+    "Usage Volume": (generate_usage_volume, ()),
+}
+
+def build_section_graph(data):
+    return StageGraph(
+        Stage(name, lambda upstream, generate=generate: generate(data, upstream), after=after)
+        for name, (generate, after) in SECTIONS.items()
+    )
+
+# -------------------- Single-Call Structured Sections --------------------
+# "graph" asks for each section separately; "combined" asks for all of them in one JSON reply,
+# so the collected data is sent (and paid for) once instead of once per section.
+SECTION_MODE = os.getenv("SECTION_MODE", "graph")
+# Follow-up calls for sections that come back missing or too thin.
+SECTION_RETRIES = int(os.getenv("SECTION_RETRIES", "1"))
+# Shortest acceptable section, in characters.
+SECTION_MIN_CHARS = int(os.getenv("SECTION_MIN_CHARS", "40"))
+# How combined mode asks for JSON. "json_schema" (structured outputs) needs Azure api_version
+# 2024-08-01-preview or later, "json_object" 2023-12-01-preview or later; "prompt" only asks
+# for JSON in the prompt and works with any version, including the 2023-07-01-preview in
+# OAI_CONFIG_LIST. "auto" picks the strictest one every configured deployment supports.
+# Replies are validated either way.
+SECTION_RESPONSE_FORMAT = os.getenv("SECTION_RESPONSE_FORMAT", "auto")
+
+def supported_response_format(config_list):
+    """The strictest JSON mode that every deployment in config_list accepts."""
+    # Azure versions are dated ("2024-08-01-preview"); the OpenAI API has none and takes all of them.
+    versions = [config["api_version"][:10] for config in config_list if config.get("api_version")]
+    oldest = min(versions, default=None)
+    if oldest is None or oldest >= "2024-08-01":
+        return "json_schema"
+    if oldest >= "2023-12-01":
+        return "json_object"
+    return "prompt"
+
+if SECTION_RESPONSE_FORMAT == "auto":
+    SECTION_RESPONSE_FORMAT = supported_response_format(llm_config["config_list"])
+
+# Section -> (JSON field, what it must contain). Cost estimation comes last so the model
+# writes it after the WBS, resource types and usage volume it builds on.
+SECTION_FIELDS = {
+    "WBS": ("wbs", "A detailed Work Breakdown Structure (WBS) with effort estimates."),
+    "Resource Types": ("resource_types", "The types of resources required."),
+    "Usage Volume": ("usage_volume", "The estimated user volume and expected deployment requirements."),
+    "Assumptions": ("assumptions", "Assumptions made in the project planning."),
+    "Cost Estimation": (
+        "cost_estimation",
+        "Cost estimate including resource costs, tech stack costs, infrastructure costs and a total cost of ownership for three years.",
+    ),
+}
+
+def _section_response_format(names):
+    """The response_format for SECTION_RESPONSE_FORMAT, or None to rely on the prompt alone."""
+    if SECTION_RESPONSE_FORMAT == "prompt":
+        return None
+    if SECTION_RESPONSE_FORMAT == "json_object":
+        return {"type": "json_object"}
+    fields = {SECTION_FIELDS[name][0]: {"type": "string", "description": SECTION_FIELDS[name][1]} for name in names}
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "project_estimation",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": fields,
+                "required": list(fields),
+                "additionalProperties": False,
+            },
+        },
+    }
+
+def validate_sections(reply, names):
+    """(valid sections by name, names that failed) for a JSON reply covering `names`."""
+    try:
+        payload = json.loads(reply)
+    except (TypeError, ValueError):
+        return {}, list(names)
+    if not isinstance(payload, dict):
+        return {}, list(names)
+    valid, failed = {}, []
+    for name in names:
+        value = payload.get(SECTION_FIELDS[name][0])
+        if isinstance(value, str) and len(value.strip()) >= SECTION_MIN_CHARS:
+            valid[name] = value.strip()
+        else:
+            failed.append(name)
+    return valid, failed
+
+def _request_sections(data, names, done):
+    fields = "\n".join(f"- {SECTION_FIELDS[name][0]}: {SECTION_FIELDS[name][1]}" for name in names)
+    prompt = (
+        f"Based on the following project details, reply with a JSON object with these fields, "
+        f"each a complete markdown section:\n{fields}\n\nProject details:\n\n{data}"
     )
-    return response.chat_messages[user_proxy][-1]["content"]
+    # Sections that already passed stay as context, so a retry stays consistent with them.
+    messages = [{"role": "user", "content": with_carryover(prompt, done)}]
+    client = data_collection_agent.client
+    response_format = _section_response_format(names)
+    try:
+        response = client.create(
+            messages=data_collection_agent._oai_system_message + messages,
+            **({"response_format": response_format} if response_format else {}),
+        )
+    except APIError as err:
+        # E.g. an api_version without this response_format: every section falls back to its own call.
+        print(f" - sections {', '.join(names)}: request failed ({err})", flush=True)
+        return None
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        print(f" - sections {', '.join(names)}: {usage.prompt_tokens} prompt tokens", flush=True)
+    return client.extract_text_or_completion_object(response)[0]
+
+def generate_sections_combined(data):
+    """All sections from one structured reply; only sections that fail validation are asked for again."""
+    sections, pending = {}, list(SECTION_FIELDS)
+    for attempt in range(1 + SECTION_RETRIES):
+        if not pending:
+            break
+        reply = _request_sections(data, pending, sections)
+        if reply is None:
+            # Rejected by the API: the same request would fail again.
+            break
+        valid, pending = validate_sections(reply, pending)
+        sections.update(valid)
+        if pending:
+            print(f" - attempt {attempt + 1}: sections failed validation: {', '.join(pending)}", flush=True)
+    # Still missing after the retries: fall back to one plain call per section.
+    for name in pending:
+        generate, after = SECTIONS[name]
+        sections[name] = generate(data, {dependency: sections[dependency] for dependency in after if dependency in sections})
+    return {name: sections[name] for name in SECTIONS}
 
 # -------------------- Main Logic --------------------
 def process_document_or_summary(doc_path=None):
@@ -178,21 +276,19 @@ def process_document_or_summary(doc_path=None):
     collected_data = collect_data_with_data_collection_agent(content)
     
     # Use collected data to generate responses for each topic
-    wbs = generate_wbs(collected_data)
-    cost_estimation = generate_cost_estimation(collected_data)
-    assumptions = generate_assumptions(collected_data)
-    resource_types = generate_resource_types(collected_data)
-    usage_volume = generate_usage_volume(collected_data)
+    if SECTION_MODE == "combined":
+        sections = generate_sections_combined(collected_data)
+    else:
+        # Independent sections at the same time
+        graph = build_section_graph(collected_data)
+        sections = graph.run()
+        print("\n" + graph.report())
 
     # Display final collected and processed data
     final_data = {
         "summary": content,
         "collected_data": collected_data,
-        "WBS": wbs,
-        "Cost Estimation": cost_estimation,
-        "Assumptions": assumptions,
-        "Resource Types": resource_types,
-        "Usage Volume": usage_volume,
+        **sections,
     }
     print("\nFinal Project Estimation:\n", json.dumps(final_data, indent=2))
     return final_data
@@ -0,0 +1,377 @@
+import json
+import threading
+import time
+import uuid
+from collections import deque
+
+import autogen
+from autogen import AssistantAgent, OpenAIWrapper, UserProxyAgent
+
+from prompt import data_collection_prompt, estimation_prompt
+from events import AGENT_MESSAGE, STAGE, STAGE_NAMES, send_event
+from context_window import enable_context_window
+from deployment_router import route_wrapper
+from metrics import SessionCost, instrument_wrapper, track_session_cost
+from prompt_cache import meter_wrapper
+from rate_limiter import rate_limit_wrapper, without_sdk_retries
+from running_summary import RunningSummary, attach_running_summary
+from response_cache import response_cache_config
+from semantic_cache import enable_semantic_first_turn
+from speculation import enable_speculative_estimate
+from streaming import enable_token_streaming, pop_streamed_message_id, streaming_llm_config
+
+
+# -------------------- Agent Prototypes --------------------
+PROTOTYPES = {
+    "data_collection_agent": {
+        "system_message": data_collection_prompt,
+    },
+    "estimation_agent": {
+        "system_message": estimation_prompt,
+        "human_input_mode": "NEVER",
+    },
+}
+
+# Opening message of the estimation chat; the interview summary follows it as carryover.
+ESTIMATION_REQUEST = "Please generate estimates based on the collected information."
+
+USER_PROXY_PROTOTYPE = {
+    "name": "user_proxy",
+    "human_input_mode": "ALWAYS",
+    "code_execution_config": False,
+    "system_message": "You are a helpful assistant.",
+}
+
+
+def default_llm_config(config_file="OAI_CONFIG_LIST"):
+    """The llm_config every script builds from OAI_CONFIG_LIST."""
+    return {
+        "timeout": 600,
+        "config_list": autogen.config_list_from_json(config_file),
+        "temperature": 0,
+        **response_cache_config(),
+    }
+
+
+class SessionAgents:
+    """The agents that make up one interview session."""
+
+    def __init__(self, data_collection_agent, estimation_agent, user_proxy):
+        self.data_collection_agent = data_collection_agent
+        self.estimation_agent = estimation_agent
+        self.user_proxy = user_proxy
+        self.connected_at = None
+        self.first_question_at = None
+        self.stage = None
+        self.on_stage = None
+        self.on_message = None
+        self.skip_checkpoints = 0
+        self.summary = None
+        self.speculation = None
+        self.cost = None
+
+    def __iter__(self):
+        return iter((self.data_collection_agent, self.estimation_agent, self.user_proxy))
+
+    def mark_connected(self, connected_at=None):
+        self.connected_at = connected_at or time.monotonic()
+        self.first_question_at = None
+
+    def load_history(self, turns) -> None:
+        """
+        Rebuild chat_messages from checkpointed turns the way autogen records them:
+        the sender keeps the message as "assistant", the recipient as "user".
+        """
+        agents = {agent.name: agent for agent in self}
+        for turn in turns:
+            sender, recipient = agents[turn["sender"]], agents[turn["recipient"]]
+            sender.chat_messages[recipient].append({"content": turn["content"], "role": "assistant", "name": sender.name})
+            recipient.chat_messages[sender].append({"content": turn["content"], "role": "user", "name": sender.name})
+
+    def trim_history(self, max_messages=None, max_chars=None) -> int:
+        """
+        Cap every conversation this session holds in memory. The first message (the task,
+        or the carried-over summary) is kept, followed by as many of the most recent
+        messages as fit. Returns the number of messages dropped.
+        """
+        dropped = 0
+        for agent in self:
+            for messages in agent.chat_messages.values():
+                keep = len(messages) - 1
+                if max_messages is not None:
+                    keep = min(keep, max_messages - 1)
+                if max_chars is not None:
+                    budget = max_chars - len(str(messages[0].get("content") or "")) if messages else 0
+                    fit = 0
+                    for message in reversed(messages[1:]):
+                        budget -= len(str(message.get("content") or ""))
+                        if budget < 0:
+                            break
+                        fit += 1
+                    keep = min(keep, fit)
+                excess = len(messages) - 1 - max(keep, 0)
+                if excess > 0:
+                    del messages[1 : 1 + excess]
+                    dropped += excess
+        return dropped
+
+    def history_size(self):
+        """Messages held across the session's agents and their approximate size in bytes."""
+        histories = [messages for agent in self for messages in agent.chat_messages.values()]
+        return {
+            "messages": sum(len(messages) for messages in histories),
+            "bytes": sum(len(json.dumps(messages, default=str)) for messages in histories),
+        }
+
+    def summary_method(self):
+        """
+        Carryover of the data collection chat: the running summary when there is one, as
+        it was when a pending speculative estimate started, so that estimate can be served.
+        """
+        if self.summary is None:
+            return "last_msg"
+        if self.speculation is None:
+            return self.summary.summary_method
+
+        def carryover(sender, recipient, summary_args):
+            frozen = self.speculation.carryover
+            return frozen if frozen is not None else self.summary.current()
+
+        return carryover
+
+    def final_data(self):
+        """Last message of each stage, as returned to API clients."""
+        final_data = {}
+        data_collection_messages = self.data_collection_agent.chat_messages[self.user_proxy]
+        if data_collection_messages:
+            final_data["data_collection_response"] = data_collection_messages[-1]["content"]
+        estimation_messages = self.estimation_agent.chat_messages[self.user_proxy]
+        if estimation_messages:
+            final_data["estimation_response"] = estimation_messages[-1]["content"]
+        return final_data
+
+
+# -------------------- Event Hooks --------------------
+def _emit_agent_message(sender, message, recipient, silent):
+    content = message.get("content") if isinstance(message, dict) else message
+    message_id = pop_streamed_message_id(sender) or uuid.uuid4().hex
+    send_event(AGENT_MESSAGE, agent=sender.name, message_id=message_id, content=content)
+    return message
+
+
+def _checkpoint_message(session, sender, message, recipient):
+    if session.skip_checkpoints:
+        session.skip_checkpoints -= 1
+    elif session.on_message is not None:
+        content = message.get("content") if isinstance(message, dict) else message
+        session.on_message(sender.name, recipient.name, content)
+    return message
+
+
+def _emit_stage(session, message, recipient):
+    if recipient.name != session.stage:
+        session.stage = recipient.name
+        stage = STAGE_NAMES.get(recipient.name, recipient.name)
+        send_event(STAGE, stage=stage)
+        if session.on_stage is not None:
+            session.on_stage(stage)
+    return message
+
+
+class AgentFactory:
+    """
+    Builds the OpenAI client wrappers once per agent role and hands out per-session
+    agents that share them, so a new connection only pays for plain object construction.
+    """
+
+    def __init__(
+        self,
+        llm_config=None,
+        user_proxy_cls=UserProxyAgent,
+        prototypes=None,
+        stream=False,
+        latency_window=500,
+        max_history_messages=None,
+        max_history_chars=None,
+        rate_limit=False,
+        route=False,
+        semantic_cache=None,
+        running_summary=False,
+        context_budget=None,
+        meter_prompts=False,
+        speculate=False,
+        instrument=False,
+    ):
+        self.llm_config = llm_config or default_llm_config()
+        if rate_limit:
+            self.llm_config = without_sdk_retries(self.llm_config)
+        self.user_proxy_cls = user_proxy_cls
+        self.prototypes = prototypes or PROTOTYPES
+        self.stream = stream
+        self.max_history_messages = max_history_messages
+        self.max_history_chars = max_history_chars
+        self.semantic_cache = semantic_cache
+        self.running_summary = running_summary
+        self.context_budget = context_budget
+        self.speculate = speculate
+        self.instrument = instrument
+        # Assistants stream their completions token by token when enabled; the user proxy never does.
+        self._llm_configs = {
+            name: streaming_llm_config(self.llm_config) if stream else self.llm_config for name in self.prototypes
+        }
+        self._llm_configs[USER_PROXY_PROTOTYPE["name"]] = self.llm_config
+        self._wrapping = {"instrument": instrument, "rate_limit": rate_limit, "route": route, "meter_prompts": meter_prompts}
+        self._clients = {
+            name: self._wrap_client(OpenAIWrapper(**config), name) for name, config in self._llm_configs.items()
+        }
+        # Speculative estimates are never watched live. Keys of a config_list entry override
+        # create() arguments, so passing stream=False to a streaming client would not stop it.
+        self._speculation_client = None
+        if speculate:
+            estimation_config = {**self._llm_configs["estimation_agent"], "stream": False}
+            self._speculation_client = self._wrap_client(OpenAIWrapper(**estimation_config), "estimation_agent")
+        self._latencies = deque(maxlen=latency_window)
+        self._lock = threading.Lock()
+
+    def _wrap_client(self, client, name):
+        if self._wrapping["instrument"]:
+            # First, so the request probe ends up under the limiter and router and sees every retry.
+            instrument_wrapper(client, name)
+        if self._wrapping["rate_limit"]:
+            # All roles call the same deployment(s), so they share its limiter and budget.
+            rate_limit_wrapper(client)
+        if self._wrapping["route"]:
+            # Spread calls over every deployment in the config_list instead of the first healthy one.
+            route_wrapper(client)
+        if self._wrapping["meter_prompts"]:
+            # Outermost, so the meter sees exactly the prompts that leave for the provider.
+            meter_wrapper(client, name)
+        return client
+
+    def _attach_client(self, agent):
+        # Agents are built with llm_config=False and then pointed at the shared wrapper,
+        # which skips the per-agent deepcopy of llm_config and the OpenAI client setup.
+        agent.llm_config = self._llm_configs[agent.name]
+        agent.client = self._clients[agent.name]
+        return agent
+
+    def new_session(self, **user_proxy_kwargs) -> SessionAgents:
+        """Create a fresh set of session agents backed by the shared clients."""
+        agents = {
+            name: self._attach_client(AssistantAgent(name=name, llm_config=False, **spec))
+            for name, spec in self.prototypes.items()
+        }
+        if self.stream:
+            for agent in agents.values():
+                enable_token_streaming(agent)
+        if self.semantic_cache is not None and "data_collection_agent" in agents:
+            enable_semantic_first_turn(agents["data_collection_agent"], self.semantic_cache)
+        user_proxy = self._attach_client(
+            self.user_proxy_cls(llm_config=False, **USER_PROXY_PROTOTYPE, **user_proxy_kwargs)
+        )
+        session = SessionAgents(agents["data_collection_agent"], agents["estimation_agent"], user_proxy)
+        if self.instrument:
+            session.cost = track_session_cost(session, SessionCost())
+        session.data_collection_agent.register_hook(
+            "process_message_before_send", lambda sender, message, recipient, silent: self._on_question(session, message)
+        )
+        for agent in agents.values():
+            agent.register_hook("process_message_before_send", _emit_agent_message)
+        user_proxy.register_hook(
+            "process_message_before_send", lambda sender, message, recipient, silent: _emit_stage(session, message, recipient)
+        )
+        for agent in session:
+            agent.register_hook(
+                "process_message_before_send",
+                lambda sender, message, recipient, silent: _checkpoint_message(session, sender, message, recipient),
+            )
+        if self.running_summary or self.context_budget:
+            session.summary = attach_running_summary(
+                RunningSummary(self._clients[USER_PROXY_PROTOTYPE["name"]]), user_proxy, session.data_collection_agent
+            )
+        if self.context_budget:
+            # The interview is the only long conversation; the estimation chat is a single turn.
+            enable_context_window(session.data_collection_agent, session.summary, budget=self.context_budget)
+        if self.speculate:
+            # After the summary hooks, so the carryover already includes the summary message.
+            session.speculation = enable_speculative_estimate(session, ESTIMATION_REQUEST, self._speculation_client)
+        if self.max_history_messages is not None or self.max_history_chars is not None:
+            for agent in session:
+                agent.register_hook(
+                    "process_message_before_send",
+                    lambda sender, message, recipient, silent: self._cap_history(session, message),
+                )
+        return session
+
+    def _cap_history(self, session, message):
+        # Runs before each message is appended, so a conversation briefly holds one over the cap.
+        session.trim_history(self.max_history_messages, self.max_history_chars)
+        return message
+
+    def _on_question(self, session, message):
+        if session.connected_at is not None and session.first_question_at is None:
+            session.first_question_at = time.monotonic()
+            latency = session.first_question_at - session.connected_at
+            with self._lock:
+                self._latencies.append(latency)
+            print(f" - connection-to-first-question latency: {latency * 1000:.0f} ms", flush=True)
+        return message
+
+    def latency_stats(self):
+        """Connection-to-first-question latency over the recent sessions, in milliseconds."""
+        with self._lock:
+            samples = sorted(self._latencies)
+        if not samples:
+            return {"count": 0}
+        return {
+            "count": len(samples),
+            "p50_ms": round(samples[len(samples) // 2] * 1000, 1),
+            "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 1),
+            "max_ms": round(samples[-1] * 1000, 1),
+        }
+
+
+def reset_session(session: SessionAgents) -> None:
+    """Clear conversation state so pooled agents can serve the next session."""
+    for agent in session:
+        agent.clear_history()
+        agent.reset_consecutive_auto_reply_counter()
+        agent.stop_reply_at_receive()
+        agent._human_input = []
+    session.connected_at = None
+    session.first_question_at = None
+    session.stage = None
+    session.on_stage = None
+    session.on_message = None
+    session.skip_checkpoints = 0
+    if session.summary is not None:
+        session.summary.reset()
+    if session.speculation is not None:
+        session.speculation.cancel()
+    if session.cost is not None:
+        session.cost.reset()
+
+
+class AgentPool:
+    """A warm pool of session agents that are reset and reused between connections."""
+
+    def __init__(self, factory: AgentFactory, size=8, **user_proxy_kwargs):
+        self.factory = factory
+        self.size = size
+        self._user_proxy_kwargs = user_proxy_kwargs
+        self._idle = deque(factory.new_session(**user_proxy_kwargs) for _ in range(size))
+        self._lock = threading.Lock()
+
+    def acquire(self, connected_at=None) -> SessionAgents:
+        with self._lock:
+            session = self._idle.popleft() if self._idle else None
+        if session is None:
+            session = self.factory.new_session(**self._user_proxy_kwargs)
+        session.mark_connected(connected_at)
+        return session
+
+    def release(self, session: SessionAgents) -> None:
+        reset_session(session)
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(session)
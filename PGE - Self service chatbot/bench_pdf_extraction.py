@@ -0,0 +1,55 @@
+import argparse
+import os
+import tempfile
+import time
+
+from PyPDF2 import PdfReader, PdfWriter
+
+from document_reader import PDF_WORKERS, extract_text_from_pdf
+
+SAMPLE_PDF = os.path.join(os.path.dirname(os.path.abspath(__file__)), "MRBR followups _Sweden_ PDD_V1.pdf")
+
+
+def build_scaled_pdf(source, copies, path) -> int:
+    """Write the source PDF's pages `copies` times over into path; returns the page count."""
+    reader = PdfReader(source)
+    writer = PdfWriter()
+    for _ in range(copies):
+        for page in reader.pages:
+            writer.add_page(page)
+    with open(path, "wb") as f:
+        writer.write(f)
+    return len(reader.pages) * copies
+
+
+def timed(label, fn):
+    started = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<28} {elapsed:8.2f}s", flush=True)
+    return result, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sequential vs process-pool PDF text extraction.")
+    parser.add_argument("--source", default=SAMPLE_PDF)
+    parser.add_argument("--copies", type=int, default=20, help="times the source's pages are repeated")
+    parser.add_argument("--workers", type=int, default=PDF_WORKERS)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "scaled.pdf")
+        pages = build_scaled_pdf(args.source, args.copies, path)
+        print(f"{pages} pages, {os.path.getsize(path) / 2**20:.1f} MB, {args.workers} workers", flush=True)
+
+        sequential, sequential_seconds = timed("sequential", lambda: extract_text_from_pdf(path, workers=1))
+        # The first parallel run also starts the worker processes.
+        timed("parallel (cold pool)", lambda: extract_text_from_pdf(path, workers=args.workers))
+        parallel, parallel_seconds = timed("parallel (warm pool)", lambda: extract_text_from_pdf(path, workers=args.workers))
+
+    assert parallel == sequential, "parallel extraction changed the text"
+    print(f"speedup: {sequential_seconds / parallel_seconds:.2f}x", flush=True)
+
+
+if __name__ == "__main__":
+    main()
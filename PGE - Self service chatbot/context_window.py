@@ -0,0 +1,78 @@
+import os
+
+from running_summary import RunningSummary
+from tokens import count_message_tokens, count_tokens
+
+# Prompt tokens an agent may send per turn, system prompt included.
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+# Most recent messages that are always sent verbatim (while they fit the budget).
+CONTEXT_KEEP_MESSAGES = int(os.getenv("CONTEXT_KEEP_MESSAGES", "12"))
+# Older messages are folded this many at a time, so the prompt prefix only changes once per block.
+CONTEXT_FOLD_BLOCK = int(os.getenv("CONTEXT_FOLD_BLOCK", "6"))
+
+
+class ContextWindow:
+    """
+    Bounds the prompt an agent sends on each turn. The system prompt and the chat's
+    first message (the task) stay pinned, the last keep messages go verbatim, and
+    everything older is replaced by the interview's running summary.
+
+    Older messages are folded a block at a time and the summary text is frozen until
+    the next block folds. Between folds each prompt is the previous one plus the new
+    turns, so the provider's prompt cache keeps hitting on the whole prefix.
+    """
+
+    def __init__(
+        self,
+        agent,
+        summary: RunningSummary,
+        budget=CONTEXT_TOKEN_BUDGET,
+        keep=CONTEXT_KEEP_MESSAGES,
+        block=CONTEXT_FOLD_BLOCK,
+    ):
+        self.agent = agent
+        self.summary = summary
+        self.budget = budget
+        self.keep = keep
+        self.block = max(1, min(block, keep))
+        self._frozen = {}
+
+    def _summary_message(self, folded, recent):
+        # Frozen per session and fold point; recomputing it every turn would move the prefix.
+        if not folded:
+            return []
+        generation = self.summary.generation
+        if self._frozen.get("generation") != generation:
+            self._frozen = {"generation": generation}
+        text = self._frozen.get(folded)
+        if text is None:
+            text = self._frozen[folded] = self.summary.current(exclude={message.get("content") for message in recent})
+        if not text:
+            return []
+        return [{"role": "system", "content": f"Summary of the earlier conversation:\n{text}"}]
+
+    def apply(self, messages):
+        system_tokens = count_tokens(self.agent.system_message)
+        before = system_tokens + count_message_tokens(messages)
+        windowed = messages
+        if before > self.budget or len(messages) > self.keep + 1:
+            head, rest = messages[:1], messages[1:]
+            # Fold whole blocks: between folds the verbatim part only grows at the end.
+            folded = -(-max(0, len(rest) - self.keep) // self.block) * self.block
+            windowed = head + self._summary_message(folded, rest[folded:]) + rest[folded:]
+            # Over budget even so: fold further blocks into the summary.
+            while len(rest) - folded > 1 and system_tokens + count_message_tokens(windowed) > self.budget:
+                folded = min(len(rest) - 1, folded + self.block)
+                windowed = head + self._summary_message(folded, rest[folded:]) + rest[folded:]
+        after = system_tokens + count_message_tokens(windowed)
+        print(
+            f" - {self.agent.name}: prompt {before} -> {after} tokens ({len(messages)} -> {len(windowed)} messages)",
+            flush=True,
+        )
+        return windowed
+
+
+def enable_context_window(agent, summary: RunningSummary, **kwargs) -> ContextWindow:
+    window = ContextWindow(agent, summary, **kwargs)
+    agent.register_hook("process_all_messages_before_reply", window.apply)
+    return window
@@ -0,0 +1,216 @@
+import threading
+import time
+
+from openai import BadRequestError
+
+from rate_limiter import deployment_key
+
+# Consecutive failures that eject a deployment, and how long it stays out (doubling per re-trip).
+BREAKER_THRESHOLD = 3
+BREAKER_COOLDOWN = 30.0
+BREAKER_MAX_COOLDOWN = 300.0
+
+
+# -------------------- Deployment Health --------------------
+class DeploymentHealth:
+    """Observed latency, error rate and circuit-breaker state of one deployment."""
+
+    def __init__(self, name, alpha=0.2):
+        self.name = name
+        self.alpha = alpha
+        self.latency = None
+        self.error_rate = 0.0
+        self.in_flight = 0
+        self.calls = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.cooldown = BREAKER_COOLDOWN
+        self.trial = False
+        self._lock = threading.Lock()
+
+    def available(self, now) -> bool:
+        """Closed, or open but due a single half-open trial call."""
+        with self._lock:
+            if self.open_until == 0.0:
+                return True
+            if now >= self.open_until and not self.trial:
+                return True
+            return False
+
+    def try_start(self, now, force=False) -> bool:
+        """
+        Count a call in if the deployment is available, taking the half-open trial when
+        that is what it is due; checked and taken under one lock, so only one caller gets
+        the trial. force lets a call through an open breaker.
+        """
+        with self._lock:
+            if self.open_until and now >= self.open_until and not self.trial:
+                self.trial = True
+            elif self.open_until and not force:
+                return False
+            self.in_flight += 1
+            return True
+
+    def released(self) -> None:
+        """The call ended without telling anything about the deployment (e.g. a 400)."""
+        with self._lock:
+            self.in_flight -= 1
+            # A half-open trial ended this way says nothing either: let the next call probe.
+            self.trial = False
+
+    def succeeded(self, seconds) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self.calls += 1
+            self.latency = seconds if self.latency is None else (1 - self.alpha) * self.latency + self.alpha * seconds
+            self.error_rate *= 1 - self.alpha
+            self.consecutive_failures = 0
+            self.open_until, self.cooldown, self.trial = 0.0, BREAKER_COOLDOWN, False
+
+    def failed(self, now) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self.calls += 1
+            self.failures += 1
+            self.error_rate = (1 - self.alpha) * self.error_rate + self.alpha
+            self.consecutive_failures += 1
+            if self.trial:
+                # The half-open trial failed: back out for longer.
+                self.cooldown = min(BREAKER_MAX_COOLDOWN, self.cooldown * 2)
+                self.open_until, self.trial = now + self.cooldown, False
+            elif self.consecutive_failures >= BREAKER_THRESHOLD and self.open_until == 0.0:
+                self.open_until = now + self.cooldown
+                print(f" - {self.name}: ejected for {self.cooldown:.0f}s after repeated failures", flush=True)
+
+    def stats(self, now):
+        with self._lock:
+            return {
+                "deployment": self.name,
+                "state": "closed" if not self.open_until else ("half_open" if now >= self.open_until else "open"),
+                "latency_s": round(self.latency, 2) if self.latency is not None else None,
+                "error_rate": round(self.error_rate, 3),
+                "in_flight": self.in_flight,
+                "calls": self.calls,
+                "failures": self.failures,
+            }
+
+
+_health = {}
+_health_lock = threading.Lock()
+
+
+def get_health(name) -> DeploymentHealth:
+    """The process-wide health record of a deployment, shared by every agent role."""
+    with _health_lock:
+        health = _health.get(name)
+        if health is None:
+            health = _health[name] = DeploymentHealth(name)
+        return health
+
+
+def deployment_stats():
+    now = time.monotonic()
+    with _health_lock:
+        records = list(_health.values())
+    return [health.stats(now) for health in records]
+
+
+# -------------------- Routed Client --------------------
+class Deployment:
+    def __init__(self, config, client):
+        self.config = config
+        self.client = client
+        self.name = deployment_key(config)
+        self.health = get_health(self.name)
+        self.limiter = getattr(client, "limiter", None)
+
+    def expected_seconds(self) -> float:
+        """
+        Expected time to finish one more call here: rate-limit queue wait plus the
+        observed latency, stretched by the calls already in flight and by the error rate.
+        """
+        headroom = self.limiter.headroom() if self.limiter is not None else 1.0
+        queue_wait = max(0.0, -headroom * 60)
+        # A deployment with no measurements yet is tried first, so it gets one.
+        latency = self.health.latency if self.health.latency is not None else 0.0
+        # Unused budget breaks ties between deployments that would both answer at once.
+        return (queue_wait + latency * (1 + self.health.in_flight) * (2 - max(0.0, headroom))) / max(
+            0.05, 1 - self.health.error_rate
+        )
+
+
+class RoutedClient:
+    """
+    ModelClient over every deployment in the config_list. Each call goes to the
+    deployment expected to answer soonest and fails over to the next one; a deployment
+    that keeps failing is ejected for a cooldown and then probed with a single call.
+    """
+
+    def __init__(self, deployments):
+        self.deployments = deployments
+
+    def _ranked(self):
+        now = time.monotonic()
+        return sorted((d for d in self.deployments if d.health.available(now)), key=lambda d: d.expected_seconds())
+
+    def _attempt(self, deployment, params):
+        """(response, None), or (None, error) when the deployment failed; the call is already counted in."""
+        started = time.monotonic()
+        try:
+            model = deployment.config.get("model", params.get("model"))
+            response = deployment.client.create({**params, "model": model})
+        except BadRequestError:
+            # The request itself is at fault; another deployment would reject it too.
+            deployment.health.released()
+            raise
+        except Exception as err:
+            deployment.health.failed(time.monotonic())
+            return None, err
+        deployment.health.succeeded(time.monotonic() - started)
+        response.deployment = deployment.name
+        return response, None
+
+    def create(self, params):
+        last_error, tried = None, False
+        for deployment in self._ranked():
+            if not deployment.health.try_start(time.monotonic()):
+                # Another call took its half-open trial since the ranking.
+                continue
+            tried = True
+            response, last_error = self._attempt(deployment, params)
+            if response is not None:
+                return response
+        if not tried:
+            # Everything is ejected: probe whichever comes back first rather than fail outright.
+            deployment = min(self.deployments, key=lambda d: d.health.open_until)
+            deployment.health.try_start(time.monotonic(), force=True)
+            response, last_error = self._attempt(deployment, params)
+            if response is not None:
+                return response
+        raise last_error
+
+    def message_retrieval(self, response):
+        return self.deployments[0].client.message_retrieval(response)
+
+    def cost(self, response) -> float:
+        return self.deployments[0].client.cost(response)
+
+    def get_usage(self, response):
+        return self.deployments[0].client.get_usage(response)
+
+
+def route_wrapper(wrapper):
+    """
+    Replace an OpenAIWrapper's try-in-order client list with one RoutedClient. The
+    wrapper's response cache still sits in front of it and keys on the first entry.
+    """
+    if len(wrapper._clients) > 1:
+        deployments = [Deployment(config, client) for config, client in zip(wrapper._config_list, wrapper._clients)]
+        for deployment in deployments:
+            if deployment.limiter is not None:
+                # A 429 fails over to another deployment instead of retrying in place.
+                deployment.client.max_attempts = 1
+        wrapper._clients = [RoutedClient(deployments)]
+        wrapper._config_list = wrapper._config_list[:1]
+    return wrapper
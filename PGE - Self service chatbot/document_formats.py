@@ -0,0 +1,133 @@
+import importlib
+import io
+import os
+import threading
+import zipfile
+
+from extraction_cache import default_extraction_cache, file_sha256, normalize_text
+
+UNSUPPORTED_FORMAT = "Unsupported file format. Please provide a valid TXT, DOCX, or PDF file."
+
+# Bytes read from the start of a document to recognise its format.
+SNIFF_BYTES = 1024
+
+
+# -------------------- Registry --------------------
+class DocumentFormat:
+    """
+    A document format: how to recognise it from its first bytes, and the "module:function"
+    that extracts its text from a path, bytes or BytesIO. The module is imported the first time a
+    document of the format is read, so its parser costs nothing until then.
+    """
+
+    def __init__(self, kind, loader, sniff, cached=True, version=1):
+        self.kind = kind
+        self.loader = loader
+        self.sniff = sniff
+        self.cached = cached
+        # Bump when the extractor's output changes, so cached text of the old reader is not served.
+        self.version = version
+        self._extractor = None
+        self._lock = threading.Lock()
+
+    @property
+    def cache_kind(self) -> str:
+        return f"{self.kind}/{self.version}"
+
+    def extract(self, source) -> str:
+        with self._lock:
+            if self._extractor is None:
+                module, function = self.loader.split(":")
+                self._extractor = getattr(importlib.import_module(module), function)
+        return self._extractor(source)
+
+
+FORMATS = []
+
+
+def register_format(document_format: DocumentFormat) -> DocumentFormat:
+    """Add a format; formats registered earlier are sniffed first."""
+    FORMATS.append(document_format)
+    return document_format
+
+
+def _is_pdf(head, source) -> bool:
+    # Readers accept junk before the header within the first KB.
+    return b"%PDF-" in head
+
+
+def _is_docx(head, source) -> bool:
+    # Any OOXML file is a zip; only a Word document has word/document.xml.
+    if not head.startswith(b"PK\x03\x04"):
+        return False
+    try:
+        with zipfile.ZipFile(io.BytesIO(source) if isinstance(source, bytes) else source) as archive:
+            return "word/document.xml" in archive.namelist()
+    except zipfile.BadZipFile:
+        return False
+
+
+def _is_text(head, source) -> bool:
+    if b"\x00" in head:
+        return False
+    try:
+        head.decode("utf-8")
+    except UnicodeDecodeError as err:
+        # A character cut off at the end of the sniffed bytes is not an error.
+        return err.start >= len(head) - 3 and len(head) == SNIFF_BYTES
+    return True
+
+
+def read_text(source) -> str:
+    if isinstance(source, bytes):
+        return source.decode("utf-8")
+    if isinstance(source, io.BytesIO):
+        with source.getbuffer() as data:
+            return str(data, "utf-8")
+    with open(source, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+register_format(DocumentFormat("pdf", "document_reader:extract_text_from_pdf", _is_pdf, version=2))
+register_format(DocumentFormat("docx", "document_reader:extract_text_from_docx", _is_docx, version=3))
+register_format(DocumentFormat("txt", "document_formats:read_text", _is_text, cached=False))
+
+
+# -------------------- Reading --------------------
+def detect_format(source):
+    """The registered format of a path, bytes or BytesIO, recognised from its content, or None."""
+    if isinstance(source, bytes):
+        head = source[:SNIFF_BYTES]
+    elif isinstance(source, io.BytesIO):
+        with source.getbuffer() as data, data[:SNIFF_BYTES] as first:
+            head = bytes(first)
+    else:
+        with open(source, "rb") as f:
+            head = f.read(SNIFF_BYTES)
+    for document_format in FORMATS:
+        if document_format.sniff(head, source):
+            return document_format
+    return None
+
+
+def extract_document(document_format, source, digest=None) -> str:
+    """
+    Text of a path, bytes or BytesIO, from the extraction cache when the format is cached and digest
+    is given. Cached formats are normalized the same way with the cache on or off.
+    """
+    cache = default_extraction_cache() if document_format.cached and digest else None
+    if cache is None:
+        text = document_format.extract(source)
+        return normalize_text(text or "") if document_format.cached else text
+    return cache.extract(digest, document_format.cache_kind, lambda: document_format.extract(source))["text"]
+
+
+def read_document(file_path):
+    """Text of the document at file_path, whatever its extension; None when there is no such file."""
+    if not file_path or not os.path.exists(file_path):
+        return None
+    document_format = detect_format(file_path)
+    if document_format is None:
+        return UNSUPPORTED_FORMAT
+    digest = file_sha256(file_path) if document_format.cached else None
+    return extract_document(document_format, file_path, digest)
@@ -0,0 +1,297 @@
+import asyncio
+import io
+import multiprocessing
+import os
+import re
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from xml.etree import ElementTree
+
+# Stop reading a document once this much text has been extracted (0 reads it all). Pages past
+# the limit are never parsed, so a long document does not hold up the first agent turn.
+DOCUMENT_MAX_CHARS = int(os.getenv("DOCUMENT_MAX_CHARS", "0"))
+# Processes that extract page ranges of large PDFs in parallel (0 or 1 keeps extraction in-process),
+# and the page count from which a PDF is worth splitting up.
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "40"))
+
+
+# -------------------- PDF --------------------
+def _open_pdf(pdf):
+    # Imported on first use, so reading only DOCX or text never loads PyPDF2.
+    from PyPDF2 import PdfReader
+
+    return PdfReader(io.BytesIO(pdf) if isinstance(pdf, bytes) else pdf)
+
+
+def _page_text(page, number) -> str:
+    try:
+        return page.extract_text() or ""
+    except Exception as err:
+        print(f" - iter_pdf_pages(): skipping page {number} ({err})", flush=True)
+        return ""
+
+
+def iter_pdf_pages(pdf):
+    """
+    Yield (page number, text) for each page of a PDF path, bytes or binary stream as it
+    is parsed. A page that fails to extract, or has no text layer, yields "" instead of
+    ending the document.
+    """
+    reader = _open_pdf(pdf)
+    for number, page in enumerate(reader.pages, start=1):
+        yield number, _page_text(page, number)
+
+
+# -------------------- Parallel PDF --------------------
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _process_pool(workers) -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: forking a threaded server can deadlock the children.
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+class _SharedPdf:
+    """An in-memory PDF handed to the worker processes through a shared memory block."""
+
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+
+
+# The document a worker process parsed last, so its later ranges skip re-reading the file.
+_worker_reader = (None, None)
+
+
+def _load_shared(pdf: _SharedPdf) -> bytes:
+    block = shared_memory.SharedMemory(name=pdf.name)
+    try:
+        return bytes(block.buf[: pdf.size])
+    finally:
+        block.close()
+
+
+def _extract_page_range(pdf, start, stop):
+    """Texts of pages start..stop-1 of a PDF path or _SharedPdf, run in a worker process."""
+    global _worker_reader
+    if isinstance(pdf, _SharedPdf):
+        key = pdf.name
+    else:
+        stat = os.stat(pdf)
+        key = (os.fspath(pdf), stat.st_mtime_ns, stat.st_size)
+    if _worker_reader[0] != key:
+        _worker_reader = (key, _open_pdf(_load_shared(pdf) if isinstance(pdf, _SharedPdf) else pdf))
+    reader = _worker_reader[1]
+    return [_page_text(reader.pages[index], index + 1) for index in range(start, stop)]
+
+
+def _page_count(pdf) -> int:
+    return len(_open_pdf(pdf).pages)
+
+
+def extract_pdf_pages_parallel(pdf, workers=PDF_WORKERS, count=None):
+    """
+    Texts of every page of a PDF path, bytes or BytesIO, in page order, extracted by a
+    pool of worker processes. Each worker parses its own copy of the file, so small PDFs
+    are faster in-process.
+    """
+    count = _page_count(pdf) if count is None else count
+    if isinstance(pdf, (bytes, io.BytesIO)):
+        # Copied once into shared memory, which each worker reads once: tasks carry only
+        # their page range, and an upload never touches the disk.
+        with memoryview(pdf) if isinstance(pdf, bytes) else pdf.getbuffer() as data:
+            block = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+            try:
+                block.buf[: len(data)] = data
+                return extract_pdf_pages_parallel(_SharedPdf(block.name, len(data)), workers, count)
+            finally:
+                block.close()
+                block.unlink()
+    # A few ranges per worker, so one slow range does not leave the others idle.
+    size = max(1, -(-count // (max(1, workers) * 4)))
+    ranges = [(start, min(count, start + size)) for start in range(0, count, size)]
+    pool = _process_pool(workers)
+    futures = [pool.submit(_extract_page_range, pdf, start, stop) for start, stop in ranges]
+    return [text for future in futures for text in future.result()]
+
+
+def extract_text_from_pdf(pdf, max_chars=DOCUMENT_MAX_CHARS, workers=PDF_WORKERS):
+    """
+    The text of the PDF's pages, up to max_chars when it is set. Large PDFs without a
+    character limit are split across worker processes; with a limit, pages are read
+    in order and reading stops at the limit.
+    """
+    # Workers open their own copy, so only paths and in-memory documents can be split up.
+    if not max_chars and workers > 1 and isinstance(pdf, (str, os.PathLike, bytes, io.BytesIO)):
+        count = _page_count(pdf)
+        if count >= PDF_PARALLEL_MIN_PAGES:
+            return "\n".join(text for text in extract_pdf_pages_parallel(pdf, workers, count) if text)
+    parts, size = [], 0
+    for _, text in iter_pdf_pages(pdf):
+        if not text:
+            continue
+        if max_chars and size + len(text) > max_chars:
+            parts.append(text[: max(0, max_chars - size)])
+            print(f" - extract_text_from_pdf(): stopped at {max_chars} characters", flush=True)
+            break
+        parts.append(text)
+        size += len(text) + 1
+    return "\n".join(parts)
+
+
+async def a_extract_text_from_pdf(pdf, max_chars=DOCUMENT_MAX_CHARS, workers=PDF_WORKERS):
+    """extract_text_from_pdf on the default executor, so the event loop keeps serving."""
+    return await asyncio.get_running_loop().run_in_executor(None, extract_text_from_pdf, pdf, max_chars, workers)
+
+
+# -------------------- DOCX --------------------
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_HEADING_STYLE = re.compile(r"heading\s*(\d)", re.IGNORECASE)
+# Formatting, and the copy of a drawing kept for older readers (mc:Fallback repeats the mc:Choice text).
+_SKIPPED = {
+    f"{_W}pPr",
+    f"{_W}rPr",
+    f"{_W}tcPr",
+    "{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback",
+}
+
+
+def _heading_levels(archive):
+    """Heading level of each paragraph style id, read from the style names ("heading 2", "Title")."""
+    try:
+        styles = ElementTree.fromstring(archive.read("word/styles.xml"))
+    except KeyError:
+        return {}
+    levels = {}
+    for style in styles.iter(f"{_W}style"):
+        name = style.find(f"{_W}name")
+        name = name.get(f"{_W}val", "") if name is not None else ""
+        match = _HEADING_STYLE.fullmatch(name.strip())
+        if match:
+            levels[style.get(f"{_W}styleId")] = int(match.group(1))
+        elif name.strip().lower() == "title":
+            levels[style.get(f"{_W}styleId")] = 1
+    return levels
+
+
+def _collect_text(element, parts) -> None:
+    for node in element:
+        if node.tag in _SKIPPED:
+            continue
+        if node.tag == f"{_W}t":
+            parts.append(node.text or "")
+        elif node.tag == f"{_W}tab":
+            parts.append(" ")
+        elif node.tag in (f"{_W}br", f"{_W}cr"):
+            parts.append("\n")
+        else:
+            # A paragraph nested in a text box or table cell is a line of its own.
+            nested = node.tag == f"{_W}p"
+            if nested:
+                parts.append("\n")
+            _collect_text(node, parts)
+            if nested:
+                parts.append("\n")
+
+
+def _run_text(element) -> str:
+    parts = []
+    _collect_text(element, parts)
+    return "\n".join(line.strip() for line in "".join(parts).split("\n") if line.strip())
+
+
+def _paragraph_markdown(paragraph, levels) -> str:
+    text = _run_text(paragraph)
+    properties = paragraph.find(f"{_W}pPr")
+    if not text or properties is None:
+        return text
+    style = properties.find(f"{_W}pStyle")
+    level = levels.get(style.get(f"{_W}val")) if style is not None else None
+    if level:
+        return f"{'#' * min(level, 6)} {text}"
+    numbering = properties.find(f"{_W}numPr")
+    if numbering is not None:
+        indent = numbering.find(f"{_W}ilvl")
+        depth = int(indent.get(f"{_W}val", "0")) if indent is not None else 0
+        return f"{'  ' * depth}- {text}"
+    return text
+
+
+def _table_markdown(table) -> str:
+    rows = []
+    for row in table.iter(f"{_W}tr"):
+        cells = []
+        for cell in row.findall(f"{_W}tc"):
+            cells.append(_run_text(cell).replace("\n", " ").replace("|", "\\|"))
+            # A merged cell spans several grid columns; keep the rest of the row in its columns.
+            span = cell.find(f"{_W}tcPr/{_W}gridSpan")
+            if span is not None:
+                cells.extend([""] * (int(span.get(f"{_W}val", "1")) - 1))
+        if any(cells):
+            rows.append(cells)
+    if not rows:
+        return ""
+    width = max(len(cells) for cells in rows)
+    lines = ["| " + " | ".join(cells + [""] * (width - len(cells))) + " |" for cells in rows]
+    lines.insert(1, "|" + "---|" * width)
+    return "\n".join(lines)
+
+
+def _open_docx(docx):
+    return zipfile.ZipFile(io.BytesIO(docx) if isinstance(docx, bytes) else docx)
+
+
+def iter_docx_blocks(docx):
+    """
+    Yield ("paragraph" | "table", markdown) for each top-level block of a DOCX path,
+    bytes or binary stream, in document order. document.xml is parsed as a stream and
+    each block is dropped once yielded, so memory stays flat however long the file is.
+    Headings become "#" lines, list items "- " lines and tables markdown tables.
+    """
+    with _open_docx(docx) as archive:
+        levels = _heading_levels(archive)
+        with archive.open("word/document.xml") as xml:
+            stack = []
+            for event, element in ElementTree.iterparse(xml, events=("start", "end")):
+                if event == "start":
+                    stack.append(element)
+                    continue
+                stack.pop()
+                if element.tag not in (f"{_W}p", f"{_W}tbl"):
+                    continue
+                # Paragraphs inside tables (or text boxes) are read with their container.
+                if any(parent.tag in (f"{_W}p", f"{_W}tbl") for parent in stack):
+                    continue
+                if element.tag == f"{_W}tbl":
+                    block = "table", _table_markdown(element)
+                else:
+                    block = "paragraph", _paragraph_markdown(element, levels)
+                stack[-1].remove(element)
+                if block[1]:
+                    yield block
+
+
+def extract_text_from_docx(docx, max_chars=DOCUMENT_MAX_CHARS):
+    """The DOCX's paragraphs and tables as compact markdown, up to max_chars when it is set."""
+    parts, size, previous = [], 0, None
+    for kind, text in iter_docx_blocks(docx):
+        # Blank lines around tables and before headings, so they stay separate paragraphs when chunked.
+        separator = "\n\n" if "table" in (kind, previous) or text.startswith("#") else "\n"
+        if parts:
+            text = separator + text
+        if max_chars and size + len(text) > max_chars:
+            parts.append(text[: max(0, max_chars - size)])
+            print(f" - extract_text_from_docx(): stopped at {max_chars} characters", flush=True)
+            break
+        parts.append(text)
+        size += len(text)
+        previous = kind
+    return "".join(parts)
@@ -0,0 +1,47 @@
+import json
+
+from autogen.io.base import IOStream
+
+# -------------------- Event Types --------------------
+# Every frame sent to the browser is one JSON object with a "type" field.
+AGENT_MESSAGE = "agent_message"  # {agent, message_id, content}
+STAGE = "stage"  # {stage}
+INPUT_REQUEST = "input_request"  # {}
+RESULT = "result"  # {data}
+TOKEN = "token"  # {agent, message_id, delta}
+TOKEN_END = "token_end"  # {agent, message_id}
+ERROR = "error"  # {error, ...}
+SESSION = "session"  # {session_id, resumed}
+
+STAGE_NAMES = {
+    "data_collection_agent": "data_collection",
+    "estimation_agent": "estimation",
+}
+
+
+class EventIOStream:
+    """
+    Session IOStream that only sends typed events to the client. Autogen's console
+    output (chat headers, separators, echoes of the user's own reply) stays on the server.
+    """
+
+    def __init__(self, transport):
+        self._transport = transport
+
+    def print(self, *objects, sep=" ", end="\n", flush=False) -> None:
+        pass
+
+    def emit(self, event_type: str, **fields) -> None:
+        self._transport.print(json.dumps({"type": event_type, **fields}), end="")
+
+    def input(self, prompt: str = "", *, password: bool = False) -> str:
+        self.emit(INPUT_REQUEST)
+        return self._transport.input("", password=password)
+
+
+def send_event(event_type: str, iostream=None, **fields) -> None:
+    """Emit an event on the current session stream; a no-op on plain console streams."""
+    iostream = iostream or IOStream.get_default()
+    emit = getattr(iostream, "emit", None)
+    if emit is not None:
+        emit(event_type, **fields)
@@ -0,0 +1,216 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from tokens import count_tokens
+
+# "on" reuses the text of documents parsed before, "off" parses every upload again.
+EXTRACTION_CACHE = os.getenv("EXTRACTION_CACHE", "on")
+EXTRACTION_CACHE_DB = os.getenv("EXTRACTION_CACHE_DB", "extraction_cache.db")
+EXTRACTION_CACHE_MAX_MB = float(os.getenv("EXTRACTION_CACHE_MAX_MB", "512"))
+EXTRACTION_CACHE_TTL_DAYS = float(os.getenv("EXTRACTION_CACHE_TTL_DAYS", "90"))
+# Upper bound on the tokens of one chunk of a document.
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "800"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    sha256 TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    text TEXT NOT NULL,
+    chunks TEXT NOT NULL,
+    chunk_tokens INTEGER NOT NULL,
+    tokens INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    PRIMARY KEY (sha256, kind)
+);
+CREATE INDEX IF NOT EXISTS documents_by_access ON documents (accessed_at);
+"""
+
+_SPACES = re.compile(r"[ \t\f\v\u00a0]+")
+_INDENT = re.compile(r"^[ \t]*")
+_BLANK_LINES = re.compile(r"\n\s*\n+")
+
+
+# -------------------- Chunking --------------------
+def _normalize_line(line) -> str:
+    # Leading indentation is kept: it carries the depth of nested list items.
+    indent = _INDENT.match(line).group()
+    return indent + _SPACES.sub(" ", line[len(indent):]).rstrip()
+
+
+def normalize_text(text) -> str:
+    """Collapse runs of spaces and blank lines, and drop trailing spaces; indentation is kept."""
+    lines = (_normalize_line(line) for line in text.replace("\r\n", "\n").replace("\r", "\n").split("\n"))
+    return _BLANK_LINES.sub("\n\n", "\n".join(lines)).strip("\n")
+
+
+def _pieces(paragraph, max_tokens):
+    # A paragraph over the limit is split on lines, then on words.
+    if count_tokens(paragraph) <= max_tokens:
+        return [paragraph]
+    units = paragraph.split("\n") if "\n" in paragraph else paragraph.split(" ")
+    if len(units) == 1:
+        step = max_tokens * 4
+        return [paragraph[i : i + step] for i in range(0, len(paragraph), step)]
+    separator = "\n" if "\n" in paragraph else " "
+    pieces, current = [], []
+    for unit in units:
+        candidate = separator.join(current + [unit])
+        if current and count_tokens(candidate) > max_tokens:
+            pieces.extend(_pieces(separator.join(current), max_tokens))
+            current = [unit]
+        else:
+            current.append(unit)
+    if current:
+        pieces.extend(_pieces(separator.join(current), max_tokens))
+    return pieces
+
+
+def chunk_text(text, max_tokens=CHUNK_TOKENS):
+    """Consecutive paragraphs of normalized text packed into chunks of at most max_tokens."""
+    chunks, current, current_tokens = [], [], 0
+    for paragraph in text.split("\n\n"):
+        for piece in _pieces(paragraph, max_tokens):
+            tokens = count_tokens(piece)
+            if current and current_tokens + tokens > max_tokens:
+                chunks.append({"text": "\n\n".join(current), "tokens": current_tokens})
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += tokens
+    if current:
+        chunks.append({"text": "\n\n".join(current), "tokens": current_tokens})
+    return chunks
+
+
+def file_sha256(path, block_size=1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# -------------------- Cache --------------------
+class ExtractionCache:
+    """
+    Extracted text of documents in one SQLite file, keyed by the SHA-256 of the file's
+    bytes and the kind of extraction, with the normalized chunks and their token
+    counts. Entries expire after ttl seconds and are evicted least-recently-used once
+    the file holds more than max_bytes.
+    """
+
+    def __init__(self, path=EXTRACTION_CACHE_DB, max_bytes=None, ttl=None, chunk_tokens=CHUNK_TOKENS):
+        self.path = path
+        self.max_bytes = max_bytes if max_bytes is not None else int(EXTRACTION_CACHE_MAX_MB * 1024 * 1024)
+        self.ttl = ttl if ttl is not None else EXTRACTION_CACHE_TTL_DAYS * 86400
+        self.chunk_tokens = chunk_tokens
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, digest, kind):
+        """The cached document as {sha256, text, chunks, tokens}, or None."""
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT text, chunks, chunk_tokens, tokens, created_at FROM documents WHERE sha256 = ? AND kind = ?",
+            (digest, kind),
+        ).fetchone()
+        now = time.time()
+        if row is not None and now - row[4] > self.ttl:
+            conn.execute("DELETE FROM documents WHERE sha256 = ? AND kind = ?", (digest, kind))
+            row = None
+        with self._lock:
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if row is None:
+            return None
+        text, chunks, chunk_tokens, tokens, _ = row
+        conn.execute("UPDATE documents SET accessed_at = ? WHERE sha256 = ? AND kind = ?", (now, digest, kind))
+        if chunk_tokens != self.chunk_tokens:
+            # Chunk size changed since: re-chunk the cached text, which is far cheaper than parsing.
+            return self.put(digest, kind, text)
+        return {"sha256": digest, "text": text, "chunks": json.loads(chunks), "tokens": tokens}
+
+    def put(self, digest, kind, text):
+        text = normalize_text(text or "")
+        chunks = chunk_text(text, self.chunk_tokens)
+        tokens = sum(chunk["tokens"] for chunk in chunks)
+        encoded = json.dumps(chunks)
+        now = time.time()
+        self._connect().execute(
+            "INSERT OR REPLACE INTO documents (sha256, kind, text, chunks, chunk_tokens, tokens, size, created_at, accessed_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (digest, kind, text, encoded, self.chunk_tokens, tokens, len(text) + len(encoded), now, now),
+        )
+        self.evict()
+        return {"sha256": digest, "text": text, "chunks": chunks, "tokens": tokens}
+
+    def extract(self, digest, kind, extractor):
+        """The document with this digest, calling extractor() for its text only on a miss."""
+        document = self.get(digest, kind)
+        if document is not None:
+            print(f" - ExtractionCache: {kind} {digest[:12]} served from cache ({document['tokens']} tokens)", flush=True)
+            return document
+        return self.put(digest, kind, extractor())
+
+    def evict(self) -> int:
+        """Drop expired entries, then the least recently used ones until under max_bytes."""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            removed = conn.execute("DELETE FROM documents WHERE created_at < ?", (time.time() - self.ttl,)).rowcount
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM documents").fetchone()[0]
+            if total > self.max_bytes:
+                for digest, kind, size in conn.execute(
+                    "SELECT sha256, kind, size FROM documents ORDER BY accessed_at"
+                ).fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    conn.execute("DELETE FROM documents WHERE sha256 = ? AND kind = ?", (digest, kind))
+                    total -= size
+                    removed += 1
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return removed
+
+    def stats(self):
+        entries, size = self._connect().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM documents").fetchone()
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        return {"entries": entries, "bytes": size, "max_bytes": self.max_bytes, "hits": hits, "misses": misses}
+
+
+_default_cache = None
+
+
+def default_extraction_cache():
+    """The process-wide cache configured by EXTRACTION_CACHE*, or None when it is off."""
+    global _default_cache
+    if EXTRACTION_CACHE == "off":
+        return None
+    if _default_cache is None:
+        _default_cache = ExtractionCache()
+    return _default_cache
+
@@ -0,0 +1,261 @@
+import os
+import threading
+import time
+import weakref
+
+from autogen.io.base import IOStream
+
+from events import STAGE_NAMES
+
+# Upper bounds of the latency histograms, in seconds.
+LATENCY_BUCKETS = (0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 40.0, 80.0)
+# "prompt,completion" dollars per 1K tokens, for deployments autogen has no price for (e.g. "0.0025,0.01").
+LLM_PRICE_PER_1K_TOKENS = os.getenv("LLM_PRICE_PER_1K_TOKENS")
+
+# The user proxy only calls the model to summarize the interview.
+_STAGES = {**STAGE_NAMES, "user_proxy": "summary"}
+
+COUNTERS = {
+    "llm_calls_total": "LLM calls, response cache hits included.",
+    "llm_cache_hits_total": "LLM calls answered from the response cache.",
+    "llm_errors_total": "LLM calls that raised.",
+    "llm_retries_total": "Extra model requests made by retries and failovers.",
+    "llm_prompt_tokens_total": "Prompt tokens sent to the model (cache hits excluded).",
+    "llm_completion_tokens_total": "Completion tokens received from the model (cache hits excluded).",
+    "llm_cost_dollars_total": "Estimated model spend in dollars (cache hits excluded).",
+}
+HISTOGRAMS = {
+    "llm_latency_seconds": "Wall time of an LLM call, response cache included.",
+    "llm_time_to_first_token_seconds": "Time until the first streamed chunk, or the whole reply when not streamed.",
+}
+
+
+# -------------------- Registry --------------------
+class LLMMetrics:
+    """Counters and histograms of LLM calls, labelled by agent and pipeline stage."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def _inc(self, name, labels, value=1) -> None:
+        key = (name, labels)
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def _observe(self, name, labels, value) -> None:
+        histogram = self._histograms.setdefault((name, labels), [[0] * len(self.buckets), 0, 0.0])
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                histogram[0][i] += 1
+        histogram[1] += 1
+        histogram[2] += value
+
+    def record(self, call) -> None:
+        labels = (call["agent"], call["stage"])
+        with self._lock:
+            self._inc("llm_calls_total", labels)
+            self._inc("llm_retries_total", labels, max(0, call["attempts"] - 1))
+            self._observe("llm_latency_seconds", labels, call["latency"])
+            if call.get("error"):
+                self._inc("llm_errors_total", labels)
+                return
+            if call["cache_hit"]:
+                self._inc("llm_cache_hits_total", labels)
+                return
+            self._inc("llm_prompt_tokens_total", labels, call["prompt_tokens"])
+            self._inc("llm_completion_tokens_total", labels, call["completion_tokens"])
+            self._inc("llm_cost_dollars_total", labels, call["cost"])
+            self._observe("llm_time_to_first_token_seconds", labels, call["ttft"])
+
+    def render(self) -> str:
+        """The metrics in the Prometheus text exposition format."""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (list(value[0]), value[1], value[2]) for key, value in self._histograms.items()}
+        lines = []
+        for name, help_text in COUNTERS.items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_labels(labels)} {_number(value)}")
+        for name, help_text in HISTOGRAMS.items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+            for (metric, labels), (counts, count, total) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{name}_bucket{_labels(labels, le=bound)} {bucket_count}")
+                lines.append(f"{name}_bucket{_labels(labels, le='+Inf')} {count}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(total)}")
+                lines.append(f"{name}_count{_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels, le=None) -> str:
+    agent, stage = labels
+    pairs = [("agent", agent), ("stage", stage)] + ([("le", le)] if le is not None else [])
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value) -> str:
+    return repr(round(value, 6)) if isinstance(value, float) else str(value)
+
+
+llm_metrics = LLMMetrics()
+
+
+# -------------------- Per-Session Cost --------------------
+class SessionCost:
+    """Tokens, calls and estimated spend of one session, per agent."""
+
+    def __init__(self):
+        self._agents = {}
+        self._lock = threading.Lock()
+
+    def add(self, call) -> None:
+        with self._lock:
+            totals = self._agents.setdefault(
+                call["agent"],
+                {"calls": 0, "cache_hits": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0},
+            )
+            totals["calls"] += 1
+            if call["cache_hit"]:
+                totals["cache_hits"] += 1
+            elif not call.get("error"):
+                totals["prompt_tokens"] += call["prompt_tokens"]
+                totals["completion_tokens"] += call["completion_tokens"]
+                totals["cost"] += call["cost"]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._agents = {}
+
+    def snapshot(self):
+        with self._lock:
+            agents = {name: dict(totals) for name, totals in self._agents.items()}
+        for totals in agents.values():
+            totals["cost"] = round(totals["cost"], 6)
+        return {
+            "calls": sum(totals["calls"] for totals in agents.values()),
+            "prompt_tokens": sum(totals["prompt_tokens"] for totals in agents.values()),
+            "completion_tokens": sum(totals["completion_tokens"] for totals in agents.values()),
+            "cost": round(sum(totals["cost"] for totals in agents.values()), 6),
+            "agents": agents,
+        }
+
+
+# Session cost of each agent; the agents are pooled, so the rollup is reset with the session.
+_session_costs = weakref.WeakKeyDictionary()
+
+
+def track_session_cost(agents, cost: SessionCost) -> SessionCost:
+    for agent in agents:
+        _session_costs[agent] = cost
+    return cost
+
+
+# -------------------- Client Instrumentation --------------------
+_local = threading.local()
+
+
+class _FirstChunkIOStream:
+    """Passes streamed chunks through and notes when the first one arrived."""
+
+    def __init__(self, iostream, call):
+        self._iostream = iostream
+        self._call = call
+
+    def print(self, *objects, **kwargs) -> None:
+        if self._call["first_token"] is None:
+            self._call["first_token"] = time.perf_counter()
+        self._iostream.print(*objects, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._iostream, name)
+
+
+class _ModelRequestProbe:
+    """Innermost ModelClient layer: counts the requests a call makes and times its first chunk."""
+
+    def __init__(self, client):
+        self._client = client
+
+    def create(self, params):
+        call = getattr(_local, "call", None)
+        if call is None:
+            return self._client.create(params)
+        call["attempts"] += 1
+        if not params.get("stream"):
+            return self._client.create(params)
+        with IOStream.set_default(_FirstChunkIOStream(IOStream.get_default(), call)):
+            return self._client.create(params)
+
+    def message_retrieval(self, response):
+        return self._client.message_retrieval(response)
+
+    def cost(self, response) -> float:
+        return self._client.cost(response)
+
+    def get_usage(self, response):
+        return self._client.get_usage(response)
+
+
+def _cost(response, prompt_tokens, completion_tokens) -> float:
+    if LLM_PRICE_PER_1K_TOKENS:
+        prompt_price, completion_price = (float(price) for price in LLM_PRICE_PER_1K_TOKENS.split(","))
+        return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+    return float(getattr(response, "cost", 0) or 0)
+
+
+def instrument_wrapper(wrapper, role):
+    """
+    Record latency, time to first token, tokens, retries, cache hits and cost of every
+    create() call on the OpenAIWrapper. Apply it before the rate limiter and router so
+    the probe sits under them and sees each retry.
+    """
+    wrapper._clients = [
+        client if isinstance(client, _ModelRequestProbe) else _ModelRequestProbe(client) for client in wrapper._clients
+    ]
+    create = wrapper.create
+
+    def instrumented_create(**config):
+        agent = config.get("agent")
+        name = agent.name if agent is not None else role
+        call = {"agent": name, "stage": _STAGES.get(name, name), "attempts": 0, "first_token": None}
+        _local.call = call
+        started = time.perf_counter()
+        try:
+            response = create(**config)
+        except Exception:
+            call.update(latency=time.perf_counter() - started, cache_hit=False, error=True)
+            llm_metrics.record(call)
+            raise
+        finally:
+            _local.call = None
+        finished = time.perf_counter()
+        usage = getattr(response, "usage", None)
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        call.update(
+            latency=finished - started,
+            # Answered by the response cache: no request reached the model.
+            cache_hit=call["attempts"] == 0,
+            ttft=(call["first_token"] or finished) - started,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            cost=_cost(response, prompt_tokens, completion_tokens),
+        )
+        llm_metrics.record(call)
+        session_cost = _session_costs.get(agent) if agent is not None else None
+        if session_cost is not None:
+            session_cost.add(call)
+        return response
+
+    wrapper.create = instrumented_create
+    return wrapper
@@ -0,0 +1,137 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from tokens import _encoder
+
+# Provider prompt caching starts at 1024 prompt tokens and extends in 128-token steps.
+CACHE_MIN_TOKENS = 1024
+CACHE_INCREMENT = 128
+# Cached prefixes are evicted after a few minutes without use.
+CACHE_TTL = 300.0
+
+
+def render_prompt(messages) -> str:
+    """The prompt as the model sees it, close enough for prefix comparisons."""
+    return "".join(
+        f"<|{message.get('role')}|>{message.get('name') or ''}\n{message.get('content') or ''}<|end|>\n"
+        for message in messages
+    )
+
+
+def prompt_units(text):
+    """Token ids of the prompt, or 4-character chunks when tiktoken is unavailable."""
+    encoding = _encoder()
+    if encoding is not None:
+        return encoding.encode(text, disallowed_special=())
+    return [text[i : i + 4] for i in range(0, len(text), 4)]
+
+
+class PromptPrefixMeter:
+    """
+    Estimates how many prompt tokens of each call the provider can serve from its
+    prompt cache: the longest cache-aligned prefix an earlier call in the last few
+    minutes already sent. Prints the split per call and keeps running totals.
+    """
+
+    def __init__(self, ttl=CACHE_TTL, max_prefixes=100_000):
+        self.ttl = ttl
+        self.max_prefixes = max_prefixes
+        self._prefixes = OrderedDict()
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.reported_cached_tokens = 0
+
+    def _boundary_hashes(self, units):
+        # Chained digests: each hash covers the whole prefix up to its boundary.
+        digest = hashlib.sha256()
+        position = 0
+        for boundary in range(CACHE_MIN_TOKENS, len(units) + 1, CACHE_INCREMENT):
+            digest.update(repr(units[position:boundary]).encode("utf-8"))
+            position = boundary
+            yield boundary, digest.copy().hexdigest()
+
+    def measure(self, messages):
+        """(prompt tokens, tokens expected to be served from the provider cache) for a call."""
+        units = prompt_units(render_prompt(messages))
+        now = time.monotonic()
+        cached = 0
+        with self._lock:
+            for boundary, key in self._boundary_hashes(units):
+                seen = self._prefixes.get(key)
+                if seen is not None and now - seen <= self.ttl:
+                    cached = boundary
+                self._prefixes[key] = now
+                self._prefixes.move_to_end(key)
+            while len(self._prefixes) > self.max_prefixes:
+                self._prefixes.popitem(last=False)
+        return len(units), cached
+
+    def record(self, label, prompt_tokens, cached_tokens, reported=None) -> None:
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.cached_tokens += cached_tokens
+            self.reported_cached_tokens += reported or 0
+        provider = f", provider reported {reported}" if reported is not None else ""
+        print(
+            f" - {label}: prompt {prompt_tokens} tokens, {cached_tokens} cached / "
+            f"{prompt_tokens - cached_tokens} uncached{provider}",
+            flush=True,
+        )
+
+    def stats(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "prompt_tokens": self.prompt_tokens,
+                "cached_tokens": self.cached_tokens,
+                "uncached_tokens": self.prompt_tokens - self.cached_tokens,
+                "cached_ratio": round(self.cached_tokens / self.prompt_tokens, 3) if self.prompt_tokens else 0.0,
+                "provider_reported_cached_tokens": self.reported_cached_tokens,
+            }
+
+
+prompt_meter = PromptPrefixMeter()
+
+
+def _reported_cached_tokens(response):
+    details = getattr(getattr(response, "usage", None), "prompt_tokens_details", None)
+    if details is None:
+        return None
+    return details.get("cached_tokens") if isinstance(details, dict) else getattr(details, "cached_tokens", None)
+
+
+class MeteredClient:
+    """ModelClient that reports each call's cached vs uncached prompt tokens to the meter."""
+
+    def __init__(self, client, label, meter: PromptPrefixMeter = prompt_meter):
+        self._client = client
+        self.label = label
+        self.meter = meter
+
+    def create(self, params):
+        prompt_tokens, cached_tokens = self.meter.measure(params.get("messages", []))
+        response = self._client.create(params)
+        self.meter.record(self.label, prompt_tokens, cached_tokens, _reported_cached_tokens(response))
+        return response
+
+    def message_retrieval(self, response):
+        return self._client.message_retrieval(response)
+
+    def cost(self, response) -> float:
+        return self._client.cost(response)
+
+    def get_usage(self, response):
+        return self._client.get_usage(response)
+
+
+def meter_wrapper(wrapper, label):
+    """Report prompt cache usage for every model call the OpenAIWrapper makes."""
+    wrapper._clients = [
+        client if isinstance(client, MeteredClient) else MeteredClient(client, label) for client in wrapper._clients
+    ]
+    return wrapper
@@ -0,0 +1,295 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from urllib.parse import urlparse
+
+from openai import InternalServerError, RateLimitError
+
+RATE_LIMIT_DB = os.getenv("RATE_LIMIT_DB", "rate_limits.db")
+
+# Budgets of the Azure deployment; set them to the quota shown in the Azure portal.
+DEPLOYMENT_RPM = int(os.getenv("AZURE_OPENAI_RPM", "60"))
+DEPLOYMENT_TPM = int(os.getenv("AZURE_OPENAI_TPM", "60000"))
+
+# Completion tokens reserved for a call that does not set max_tokens; settled against the real usage.
+DEFAULT_COMPLETION_TOKENS = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rate_buckets (
+    deployment TEXT PRIMARY KEY,
+    requests REAL NOT NULL,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    blocked_until REAL NOT NULL DEFAULT 0
+);
+"""
+
+
+def deployment_key(config) -> str:
+    """
+    Name of the deployment a config_list entry calls: "model@host". Azure deployments on
+    different resources often share a name, and each has its own quota and health.
+    """
+    model = config.get("model") or "default"
+    endpoint = config.get("base_url") or config.get("azure_endpoint")
+    if not endpoint:
+        return model
+    return f"{model}@{urlparse(str(endpoint)).netloc or endpoint}"
+
+
+def estimate_tokens(params) -> int:
+    """Rough prompt + completion size of a chat completion call (4 characters per token)."""
+    prompt = sum(len(str(message.get("content") or "")) // 4 + 4 for message in params.get("messages", []))
+    return prompt + (params.get("max_tokens") or DEFAULT_COMPLETION_TOKENS)
+
+
+# -------------------- Token Bucket --------------------
+class TokenBucketLimiter:
+    """
+    Requests-per-minute and tokens-per-minute budgets for one deployment, shared by
+    every thread and worker process that uses the same database file.
+
+    Each call reserves its share up front and may drive the buckets negative; it then
+    sleeps until the buckets have refilled past its reservation. Calls are therefore
+    served in the order they arrived, across processes, and a big call cannot be
+    starved by a stream of small ones.
+    """
+
+    def __init__(self, deployment, rpm=DEPLOYMENT_RPM, tpm=DEPLOYMENT_TPM, path=RATE_LIMIT_DB, wait_window=500):
+        self.deployment = deployment
+        self.rpm = rpm
+        self.tpm = tpm
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._waits = deque(maxlen=wait_window)
+        self._waiting = {}
+        self.throttled = 0
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _transact(self, fn):
+        """Run fn(requests, tokens, blocked_until, now) on the refilled buckets and store what it returns."""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = conn.execute(
+                "SELECT requests, tokens, updated_at, blocked_until FROM rate_buckets WHERE deployment = ?",
+                (self.deployment,),
+            ).fetchone()
+            if row is None:
+                requests, tokens, blocked_until = float(self.rpm), float(self.tpm), 0.0
+            else:
+                requests, tokens, updated_at, blocked_until = row
+                elapsed = max(0.0, now - updated_at)
+                requests = min(float(self.rpm), requests + elapsed * self.rpm / 60)
+                tokens = min(float(self.tpm), tokens + elapsed * self.tpm / 60)
+            requests, tokens, blocked_until, result = fn(requests, tokens, blocked_until, now)
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_buckets (deployment, requests, tokens, updated_at, blocked_until)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (self.deployment, requests, tokens, now, blocked_until),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+    def _wait_for(self, requests, tokens, blocked_until, now) -> float:
+        return max(0.0, -requests * 60 / self.rpm, -tokens * 60 / self.tpm, blocked_until - now)
+
+    def acquire(self, cost: int) -> float:
+        """Reserve one request and `cost` tokens, block until they are available, return the wait."""
+        cost = min(cost, self.tpm)
+
+        def reserve(requests, tokens, blocked_until, now):
+            requests, tokens = requests - 1, tokens - cost
+            return requests, tokens, blocked_until, self._wait_for(requests, tokens, blocked_until, now)
+
+        started = time.monotonic()
+        wait = self._transact(reserve)
+        ticket = object()
+        while wait > 0:
+            with self._lock:
+                self._waiting[ticket] = time.monotonic() + wait
+            time.sleep(wait)
+            # A 429 seen by any worker while we slept pushes everyone back.
+            wait = self._transact(lambda r, t, b, now: (r, t, b, max(0.0, b - now)))
+        with self._lock:
+            self._waiting.pop(ticket, None)
+            waited = time.monotonic() - started
+            self._waits.append(waited)
+        return waited
+
+    def settle(self, reserved: int, used: int) -> None:
+        """Correct a reservation once the real token usage is known."""
+        delta = min(reserved, self.tpm) - used
+        if delta:
+            self._transact(lambda r, t, b, now: (r, min(float(self.tpm), t + delta), b, None))
+
+    def penalize(self, retry_after: float) -> None:
+        """Hold back every caller of this deployment after a 429."""
+        with self._lock:
+            self.throttled += 1
+        self._transact(lambda r, t, b, now: (r, t, max(b, now + retry_after), None))
+
+    def _snapshot(self):
+        """(requests, tokens, blocked_until, now) of the refilled buckets, read without writing."""
+        row = self._connect().execute(
+            "SELECT requests, tokens, updated_at, blocked_until FROM rate_buckets WHERE deployment = ?",
+            (self.deployment,),
+        ).fetchone()
+        now = time.time()
+        if row is None:
+            return float(self.rpm), float(self.tpm), 0.0, now
+        requests, tokens, updated_at, blocked_until = row
+        elapsed = max(0.0, now - updated_at)
+        requests = min(float(self.rpm), requests + elapsed * self.rpm / 60)
+        tokens = min(float(self.tpm), tokens + elapsed * self.tpm / 60)
+        return requests, tokens, blocked_until, now
+
+    def headroom(self) -> float:
+        """Fraction of the tighter budget still free: 1.0 when idle, negative while calls queue."""
+        requests, tokens, blocked_until, now = self._snapshot()
+        if blocked_until > now:
+            return -1.0
+        return min(requests / self.rpm, tokens / self.tpm)
+
+    def projected_wait(self) -> float:
+        """How long a new one-request call would queue right now."""
+        requests, tokens, blocked_until, now = self._snapshot()
+        return self._wait_for(requests - 1, tokens, blocked_until, now)
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            waits = sorted(self._waits)
+            waiting = [deadline - now for deadline in self._waiting.values()]
+            throttled = self.throttled
+        stats = {
+            "deployment": self.deployment,
+            "rpm": self.rpm,
+            "tpm": self.tpm,
+            "waiting": len(waiting),
+            "longest_wait_s": round(max(waiting, default=0.0), 2),
+            "queue_wait_s": round(self.projected_wait(), 2),
+            "throttled_429": throttled,
+        }
+        if waits:
+            stats["wait_p50_s"] = round(waits[len(waits) // 2], 2)
+            stats["wait_p95_s"] = round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 2)
+        return stats
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(deployment, **kwargs) -> TokenBucketLimiter:
+    """The process-wide limiter for a deployment."""
+    with _limiters_lock:
+        limiter = _limiters.get(deployment)
+        if limiter is None:
+            limiter = _limiters[deployment] = TokenBucketLimiter(deployment, **kwargs)
+        return limiter
+
+
+def limiter_stats():
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return [limiter.stats() for limiter in limiters]
+
+
+# -------------------- Model Client --------------------
+def _retry_after(err, attempt) -> float:
+    headers = getattr(getattr(err, "response", None), "headers", None) or {}
+    for name in ("retry-after-ms", "retry-after"):
+        value = headers.get(name)
+        if value:
+            try:
+                return float(value) / (1000 if name.endswith("-ms") else 1)
+            except ValueError:
+                pass
+    return min(60.0, 2.0**attempt)
+
+
+class RateLimitedClient:
+    """
+    ModelClient that passes every call through the deployment's limiter. Cache hits
+    never reach it. 429s hold back all callers for the Retry-After the service asked
+    for; the OpenAI SDK's own retries should be off (max_retries=0) so they do not
+    add to the load.
+    """
+
+    def __init__(self, client, limiter: TokenBucketLimiter, max_attempts=5):
+        self._client = client
+        self.limiter = limiter
+        self.max_attempts = max_attempts
+
+    def create(self, params):
+        reserved = estimate_tokens(params)
+        for attempt in range(1, self.max_attempts + 1):
+            waited = self.limiter.acquire(reserved)
+            if waited >= 1:
+                print(f" - {self.limiter.deployment}: queued {waited:.1f}s for rate limit", flush=True)
+            try:
+                response = self._client.create(params)
+            except (RateLimitError, InternalServerError) as err:
+                # Nothing was generated; hand the reservation back before retrying.
+                self.limiter.settle(reserved, 0)
+                if isinstance(err, RateLimitError):
+                    self.limiter.penalize(_retry_after(err, attempt))
+                if attempt == self.max_attempts:
+                    raise
+                if not isinstance(err, RateLimitError):
+                    time.sleep(_retry_after(err, attempt))
+                continue
+            usage = self._client.get_usage(response) or {}
+            self.limiter.settle(reserved, usage.get("total_tokens") or reserved)
+            return response
+
+    def message_retrieval(self, response):
+        return self._client.message_retrieval(response)
+
+    def cost(self, response) -> float:
+        return self._client.cost(response)
+
+    def get_usage(self, response):
+        return self._client.get_usage(response)
+
+
+def rate_limit_wrapper(wrapper, **limiter_kwargs):
+    """
+    Route every client of an OpenAIWrapper through its deployment's limiter. Azure
+    configs name the deployment in "model", on the resource in "base_url".
+    """
+    for i, config in enumerate(wrapper._config_list):
+        client = wrapper._clients[i]
+        if not isinstance(client, RateLimitedClient):
+            wrapper._clients[i] = RateLimitedClient(client, get_limiter(deployment_key(config), **limiter_kwargs))
+    return wrapper
+
+
+def rate_limit_agents(*agents, **limiter_kwargs) -> None:
+    """rate_limit_wrapper for agents built directly from an llm_config."""
+    for agent in agents:
+        if agent.client is not None:
+            rate_limit_wrapper(agent.client, **limiter_kwargs)
+
+
+def without_sdk_retries(llm_config):
+    """llm_config whose OpenAI clients leave retrying to the limiter."""
+    return {**llm_config, "max_retries": 0}
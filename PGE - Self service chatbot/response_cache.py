@@ -0,0 +1,190 @@
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+# "on" caches temperature-0 completions, "replay" serves only from the cache and never
+# calls the model (for offline runs), "off" disables caching altogether.
+RESPONSE_CACHE = os.getenv("RESPONSE_CACHE", "on")
+RESPONSE_CACHE_DB = os.getenv("RESPONSE_CACHE_DB", "response_cache.db")
+RESPONSE_CACHE_MAX_MB = float(os.getenv("RESPONSE_CACHE_MAX_MB", "256"))
+RESPONSE_CACHE_TTL_DAYS = float(os.getenv("RESPONSE_CACHE_TTL_DAYS", "30"))
+
+# Request fields that do not change the completion: a streamed and a plain call share one entry.
+IGNORED_PARAMS = ("stream",)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_by_access ON responses (accessed_at);
+"""
+
+
+class ReplayMiss(LookupError):
+    """Raised in replay-only mode when a request has no cached response."""
+
+
+class ResponseCache:
+    """
+    Content-addressed completion cache in one SQLite file, usable as the "cache" of an
+    llm_config. Entries are keyed on the full request (model, messages and every
+    parameter), expire after ttl seconds and are evicted least-recently-used once the
+    file holds more than max_bytes. Only temperature-0 requests are cached.
+    """
+
+    def __init__(self, path=RESPONSE_CACHE_DB, max_bytes=None, ttl=None, replay_only=False):
+        self.path = path
+        self.max_bytes = max_bytes if max_bytes is not None else int(RESPONSE_CACHE_MAX_MB * 1024 * 1024)
+        self.ttl = ttl if ttl is not None else RESPONSE_CACHE_TTL_DAYS * 86400
+        self.replay_only = replay_only
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # The llm_config holding this cache is deep-copied for every agent; they all share it.
+    def __deepcopy__(self, memo):
+        return self
+
+    def __copy__(self):
+        return self
+
+    # autogen opens the cache with a `with` block around every lookup and store.
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return None
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    @staticmethod
+    def _digest(key):
+        """sha256 of the request, or None when it is not deterministic enough to cache."""
+        try:
+            params = json.loads(key)
+        except (TypeError, ValueError):
+            params = None
+        if isinstance(params, dict):
+            if params.get("temperature", 1) != 0:
+                return None
+            for name in IGNORED_PARAMS:
+                params.pop(name, None)
+            key = json.dumps(params, sort_keys=True)
+        return hashlib.sha256(str(key).encode("utf-8")).hexdigest()
+
+    def get(self, key, default=None):
+        digest = self._digest(key)
+        if digest is None:
+            return default
+        conn = self._connect()
+        row = conn.execute("SELECT value, created_at FROM responses WHERE key = ?", (digest,)).fetchone()
+        now = time.time()
+        if row is not None and now - row[1] > self.ttl:
+            conn.execute("DELETE FROM responses WHERE key = ?", (digest,))
+            row = None
+        if row is None:
+            with self._lock:
+                self.misses += 1
+            if self.replay_only:
+                raise ReplayMiss(f"No cached response for request {digest[:12]} (RESPONSE_CACHE=replay)")
+            return default
+        conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, digest))
+        with self._lock:
+            self.hits += 1
+        return pickle.loads(row[0])
+
+    def set(self, key, value) -> None:
+        if self.replay_only:
+            return
+        digest = self._digest(key)
+        if digest is None:
+            return
+        try:
+            blob = pickle.dumps(value)
+        except Exception as err:
+            print(f" - ResponseCache: not caching response ({err})", flush=True)
+            return
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO responses (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+            (digest, blob, len(blob), now, now),
+        )
+        self.evict()
+
+    def evict(self) -> int:
+        """Drop expired entries, then the least recently used ones until under max_bytes."""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            removed = conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl,)).rowcount
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                for key, size in conn.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    total -= size
+                    removed += 1
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return removed
+
+    def stats(self):
+        entries, size = self._connect().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        return {
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "hits": hits,
+            "misses": misses,
+            "replay_only": self.replay_only,
+        }
+
+
+_default_cache = None
+
+
+def default_response_cache():
+    """The process-wide cache configured by RESPONSE_CACHE*, or None when it is off."""
+    global _default_cache
+    if RESPONSE_CACHE == "off":
+        return None
+    if _default_cache is None:
+        _default_cache = ResponseCache(replay_only=RESPONSE_CACHE == "replay")
+    return _default_cache
+
+
+def response_cache_config():
+    """llm_config entries that route completions through the response cache."""
+    # cache_seed=None turns off autogen's own per-seed disk cache; ours replaces it.
+    cache = default_response_cache()
+    return {"cache": cache, "cache_seed": None} if cache is not None else {"cache_seed": None}
@@ -0,0 +1,147 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Upper bound on the carried-over summary, in tokens of the summarizer's reply.
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "400"))
+
+SUMMARY_PROMPT = """You maintain a compact running summary of a requirements interview between a technical architect and a customer.
+Update the current summary with the new exchanges. Keep these sections, as short bullet points:
+Problem statement; Users and volumetrics; Functional scope; Tech stack and hosting; Integrations; Constraints and assumptions; Open questions.
+Keep every concrete fact, number and decision; drop pleasantries and repeated questions. Reply with the updated summary only, in at most {words} words."""
+
+# Summary updates of all sessions share these threads; each session runs at most one at a time.
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="running-summary")
+
+
+class RunningSummary:
+    """
+    Structured summary of one interview, folded forward in the background after each
+    turn so it is ready when the next stage starts. Pass summary_method as the chat's
+    summary_method; it never waits on the model.
+    """
+
+    def __init__(self, client, max_tokens=SUMMARY_MAX_TOKENS):
+        self.client = client
+        self.max_tokens = max_tokens
+        # The agent the summary's model calls are attributed to.
+        self.agent = None
+        # Called with (summary, summarized) after each update, to checkpoint the summary.
+        self.on_update = None
+        self._turns = []
+        self._summarized = 0
+        self._summary = ""
+        self._running = False
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @property
+    def generation(self) -> int:
+        """Changes whenever the summary is reset for a new session."""
+        return self._generation
+
+    def reset(self) -> None:
+        with self._lock:
+            self._turns, self._summarized, self._summary = [], 0, ""
+            self._generation += 1
+            self._running = False
+        self.on_update = None
+
+    def restore(self, turns, summary="", summarized=0) -> None:
+        """
+        Load checkpointed (speaker, content) turns with the summary checkpointed by
+        on_update, which already covers the first `summarized` of them. Only the turns
+        after those are left to fold in; a count past the loaded turns covers the next
+        ones added, such as a last turn that is sent again.
+        """
+        with self._lock:
+            self._turns.extend(
+                (speaker, content) for speaker, content in turns if isinstance(content, str) and content.strip()
+            )
+            self._summary = summary or ""
+            self._summarized = summarized if self._summary else 0
+
+    def add_turn(self, speaker, content) -> None:
+        if not isinstance(content, str) or not content.strip():
+            return
+        with self._lock:
+            self._turns.append((speaker, content))
+            if self._running:
+                return
+            self._running = True
+            generation = self._generation
+        _executor.submit(self._drain, generation)
+
+    def _drain(self, generation) -> None:
+        # Fold every turn recorded so far into the summary; turns that arrive meanwhile
+        # are picked up by the next pass, so updates never overlap or reorder.
+        while True:
+            with self._lock:
+                if generation != self._generation:
+                    return
+                batch = self._turns[self._summarized :]
+                if not batch:
+                    self._running = False
+                    return
+                summary = self._summary
+            try:
+                updated = self._update(summary, batch)
+            except Exception as err:
+                print(f" - RunningSummary: update failed ({err}); keeping raw turns", flush=True)
+                with self._lock:
+                    if generation == self._generation:
+                        self._running = False
+                return
+            with self._lock:
+                if generation != self._generation:
+                    return
+                self._summary = updated
+                self._summarized += len(batch)
+                summarized, on_update = self._summarized, self.on_update
+            if on_update is not None:
+                try:
+                    on_update(updated, summarized)
+                except Exception as err:
+                    print(f" - RunningSummary: checkpoint failed ({err})", flush=True)
+
+    def _update(self, summary, turns) -> str:
+        exchanges = "\n\n".join(f"{speaker}: {content}" for speaker, content in turns)
+        response = self.client.create(
+            messages=[
+                {"role": "system", "content": SUMMARY_PROMPT.format(words=int(self.max_tokens * 0.75))},
+                {"role": "user", "content": f"Current summary:\n{summary or '(empty)'}\n\nNew exchanges:\n{exchanges}"},
+            ],
+            max_tokens=self.max_tokens,
+            agent=self.agent,
+        )
+        return self.client.extract_text_or_completion_object(response)[0] or summary
+
+    def current(self, exclude=()) -> str:
+        """
+        The summary so far, followed by any turns the background update has not folded
+        in yet, except those whose content is in `exclude` (already shown verbatim).
+        """
+        with self._lock:
+            summary, tail = self._summary, self._turns[self._summarized :]
+        tail = [(speaker, content) for speaker, content in tail if content not in exclude]
+        if not tail:
+            return summary
+        exchanges = "\n\n".join(f"{speaker}: {content}" for speaker, content in tail)
+        return f"{summary}\n\nLatest exchanges:\n{exchanges}" if summary else exchanges
+
+    def summary_method(self, sender, recipient, summary_args) -> str:
+        return self.current()
+
+
+def attach_running_summary(summary: RunningSummary, user_proxy, agent) -> RunningSummary:
+    """Record every message exchanged between user_proxy and agent as a summary turn."""
+
+    def record(sender, message, recipient, silent):
+        if {sender, recipient} == {user_proxy, agent}:
+            summary.add_turn(sender.name, message.get("content") if isinstance(message, dict) else message)
+        return message
+
+    summary.agent = user_proxy
+    user_proxy.register_hook("process_message_before_send", record)
+    agent.register_hook("process_message_before_send", record)
+    return summary
@@ -0,0 +1,253 @@
+import asyncio
+import hashlib
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+import weakref
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from autogen import Agent
+
+SEMANTIC_CACHE = os.getenv("SEMANTIC_CACHE", "on")
+SEMANTIC_CACHE_DB = os.getenv("SEMANTIC_CACHE_DB", "semantic_cache.db")
+# Cosine similarity an opening message needs to reuse a cached reply.
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.9"))
+# Replies are served while the user has sent at most this many messages in the conversation
+# (the pipeline's intro message plus the user's problem statement).
+SEMANTIC_CACHE_TURNS = int(os.getenv("SEMANTIC_CACHE_TURNS", "2"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "5000"))
+SEMANTIC_CACHE_TTL_DAYS = float(os.getenv("SEMANTIC_CACHE_TTL_DAYS", "30"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS openings (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    context TEXT NOT NULL,
+    message TEXT NOT NULL,
+    vector TEXT NOT NULL,
+    reply TEXT NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS openings_by_context ON openings (context);
+CREATE INDEX IF NOT EXISTS openings_by_age ON openings (created_at);
+"""
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+# -------------------- Hashing Vectorizer --------------------
+def embed(text, dims=2**18):
+    """L2-normalised hashed unigram + bigram vector of the text, as {index: weight}."""
+    words = _WORD.findall(text.lower())
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    counts = Counter(
+        int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little") % dims
+        for feature in features
+    )
+    weights = {index: 1 + math.log(count) for index, count in counts.items()}
+    norm = math.sqrt(sum(weight * weight for weight in weights.values())) or 1.0
+    return {index: weight / norm for index, weight in weights.items()}
+
+
+def cosine(a, b) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(weight * b.get(index, 0.0) for index, weight in a.items())
+
+
+# -------------------- Cache --------------------
+class SemanticCache:
+    """
+    Opening replies of an agent, looked up by similarity of the user's latest message.
+    Everything before that message (system prompt, intro, earlier replies) must match
+    exactly, so only the free-text problem statement is compared approximately. Entries
+    expire after ttl seconds and the oldest are evicted once there are more than
+    max_entries, which also bounds the rows a lookup compares.
+    """
+
+    def __init__(
+        self,
+        path=SEMANTIC_CACHE_DB,
+        threshold=SEMANTIC_CACHE_THRESHOLD,
+        max_turns=SEMANTIC_CACHE_TURNS,
+        max_entries=SEMANTIC_CACHE_MAX_ENTRIES,
+        ttl=None,
+    ):
+        self.path = path
+        self.threshold = threshold
+        self.max_turns = max_turns
+        self.max_entries = max_entries
+        self.ttl = ttl if ttl is not None else SEMANTIC_CACHE_TTL_DAYS * 86400
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def key(self, agent, messages):
+        """(context hash, latest user message) for an opening turn, or None past the opening."""
+        if not messages or messages[-1].get("role") != "user":
+            return None
+        if sum(1 for message in messages if message.get("role") == "user") > self.max_turns:
+            return None
+        latest = messages[-1].get("content")
+        if not isinstance(latest, str) or not latest.strip():
+            return None
+        context = json.dumps(
+            [agent.system_message] + [[m.get("role"), m.get("content")] for m in messages[:-1]], default=str
+        )
+        return hashlib.sha256(context.encode("utf-8")).hexdigest(), latest
+
+    def lookup(self, context, message):
+        """Best cached reply for the message at or above the threshold, with its similarity."""
+        vector = embed(message)
+        best, best_score = None, self.threshold
+        for entry_id, stored, reply in self._connect().execute(
+            "SELECT id, vector, reply FROM openings WHERE context = ? AND created_at >= ?",
+            (context, time.time() - self.ttl),
+        ):
+            score = cosine(vector, {int(index): weight for index, weight in json.loads(stored).items()})
+            if score >= best_score:
+                best, best_score = (entry_id, reply), score
+        with self._lock:
+            if best is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if best is None:
+            return None, 0.0
+        self._connect().execute("UPDATE openings SET hits = hits + 1 WHERE id = ?", (best[0],))
+        return best[1], best_score
+
+    def record(self, context, message, reply) -> None:
+        self._connect().execute(
+            "INSERT INTO openings (context, message, vector, reply, created_at) VALUES (?, ?, ?, ?, ?)",
+            (context, message, json.dumps(embed(message)), reply, time.time()),
+        )
+        self.evict()
+
+    def evict(self) -> int:
+        """Drop expired entries, then the oldest ones until at most max_entries are left."""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            removed = conn.execute("DELETE FROM openings WHERE created_at < ?", (time.time() - self.ttl,)).rowcount
+            excess = conn.execute("SELECT COUNT(*) FROM openings").fetchone()[0] - self.max_entries
+            if excess > 0:
+                removed += conn.execute(
+                    "DELETE FROM openings WHERE id IN (SELECT id FROM openings ORDER BY created_at LIMIT ?)", (excess,)
+                ).rowcount
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return removed
+
+    def stats(self):
+        entries = self._connect().execute("SELECT COUNT(*) FROM openings").fetchone()[0]
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hits": hits,
+            "misses": misses,
+            "threshold": self.threshold,
+        }
+
+
+_default_cache = None
+
+
+def default_semantic_cache():
+    """The process-wide cache configured by SEMANTIC_CACHE*, or None when it is off."""
+    global _default_cache
+    if SEMANTIC_CACHE == "off":
+        return None
+    if _default_cache is None:
+        _default_cache = SemanticCache()
+    return _default_cache
+
+
+# -------------------- Agent Wiring --------------------
+# Opening turns the agent answered with the model, waiting for their reply to be recorded.
+_pending = weakref.WeakKeyDictionary()
+# Messages the async reply function already looked up, so the sync one after it does not.
+_checked = weakref.WeakKeyDictionary()
+# Recording a reply embeds it and writes the database, off the replying (event loop) thread.
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="semantic-cache")
+
+
+def _record(cache, context, message, reply) -> None:
+    try:
+        cache.record(context, message, reply)
+    except Exception as err:
+        print(f" - SemanticCache: could not record an opening reply ({err})", flush=True)
+
+
+def enable_semantic_first_turn(agent, cache: SemanticCache) -> None:
+    """
+    Answer the agent's opening turns from the cache when a near-duplicate problem
+    statement has been seen before, and record the model's reply when it has not.
+    """
+
+    def served(recipient, sender, key, reply, score):
+        if reply is None:
+            _pending[recipient] = (key, sender, len(recipient.chat_messages[sender]))
+            return False, None
+        print(f" - {recipient.name}: opening reply served from semantic cache (similarity {score:.2f})", flush=True)
+        return True, reply
+
+    def cached_opening_reply(recipient, messages=None, sender=None, config=None):
+        messages = messages if messages is not None else recipient.chat_messages[sender]
+        if _checked.pop(recipient, None) is messages:
+            return False, None
+        key = cache.key(recipient, messages)
+        if key is None:
+            return False, None
+        return served(recipient, sender, key, *cache.lookup(*key))
+
+    async def a_cached_opening_reply(recipient, messages=None, sender=None, config=None):
+        messages = messages if messages is not None else recipient.chat_messages[sender]
+        key = cache.key(recipient, messages)
+        if key is None:
+            return False, None
+        # Embedding and scanning the stored vectors would stall every other session.
+        final, reply = served(recipient, sender, key, *await asyncio.to_thread(cache.lookup, *key))
+        if not final:
+            _checked[recipient] = messages
+        return final, reply
+
+    def record_opening_reply(sender, message, recipient, silent):
+        pending = _pending.pop(sender, None)
+        if pending is None:
+            return message
+        key, peer, length = pending
+        content = message.get("content") if isinstance(message, dict) else message
+        # Only the reply to the very turn that missed, not one after a failed or abandoned call.
+        if peer is not recipient or len(sender.chat_messages[recipient]) != length:
+            return message
+        if isinstance(content, str) and content.strip():
+            _writer.submit(_record, cache, *key, content)
+        return message
+
+    # Registered last so they sit in front of the (streaming) LLM reply functions. Async
+    # chats run both variants, the async one first; the sync one is for sync chats.
+    agent.register_reply([Agent, None], cached_opening_reply)
+    agent.register_reply([Agent, None], a_cached_opening_reply, ignore_async_in_sync_chat=True)
+    agent.register_hook("process_message_before_send", record_opening_reply)
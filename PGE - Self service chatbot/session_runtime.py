@@ -0,0 +1,455 @@
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import websockets
+from autogen import UserProxyAgent
+from autogen.io.base import IOStream
+
+from agent_factory import ESTIMATION_REQUEST, AgentFactory, AgentPool
+from context_window import CONTEXT_TOKEN_BUDGET
+from events import ERROR, INPUT_REQUEST, RESULT, SESSION, EventIOStream, send_event
+from semantic_cache import default_semantic_cache
+from session_store import SessionStore
+
+# Number of threads available for in-flight LLM calls. Autogen's async reply path runs the
+# blocking OpenAI client in the loop's default executor; sessions waiting on the user hold none.
+LLM_CALL_WORKERS = 64
+
+# Seconds a session may wait on the user before the reaper checkpoints and closes it.
+SESSION_IDLE_TIMEOUT = float(os.getenv("SESSION_IDLE_TIMEOUT", "900"))
+REAPER_INTERVAL = float(os.getenv("REAPER_INTERVAL", "30"))
+
+# Per-session caps on the conversation history kept in memory (0 disables a cap).
+MAX_HISTORY_MESSAGES = int(os.getenv("MAX_HISTORY_MESSAGES", "200"))
+MAX_HISTORY_CHARS = int(os.getenv("MAX_HISTORY_CHARS", "400000"))
+
+_CLOSED = object()
+_IDLE = object()
+
+
+class SessionClosed(Exception):
+    """Raised inside a session when the client disconnects."""
+
+    status = "disconnected"
+
+
+class SessionIdle(SessionClosed):
+    """Raised inside a session that the reaper closed for waiting on the user too long."""
+
+    status = "idle"
+
+
+# -------------------- Session IO --------------------
+class QueueIOStream:
+    """
+    Transport stream that hands frames to the session's outbox queue instead of
+    writing to the socket directly. Safe to call from executor threads.
+    """
+
+    def __init__(self, outbox: asyncio.Queue, loop: asyncio.AbstractEventLoop):
+        self._outbox = outbox
+        self._loop = loop
+
+    def print(self, *objects, sep=" ", end="\n", flush=False) -> None:
+        msg = sep.join(map(str, objects)) + end
+        self._loop.call_soon_threadsafe(self._outbox.put_nowait, msg)
+
+    def input(self, prompt: str = "", *, password: bool = False) -> str:
+        raise RuntimeError("Async sessions read human input through a_get_human_input().")
+
+
+class AsyncHumanProxyAgent(UserProxyAgent):
+    """UserProxyAgent that awaits the next client message instead of blocking a thread."""
+
+    def __init__(self, inbox: asyncio.Queue = None, **kwargs):
+        super().__init__(**kwargs)
+        self._inbox = inbox
+        self.waiting_since = None
+
+    def bind(self, inbox: asyncio.Queue) -> None:
+        self._inbox = inbox
+
+    async def a_get_human_input(self, prompt: str) -> str:
+        send_event(INPUT_REQUEST)
+        self.waiting_since = time.monotonic()
+        try:
+            reply = await self._inbox.get()
+        finally:
+            self.waiting_since = None
+        if reply is _CLOSED:
+            raise SessionClosed()
+        if reply is _IDLE:
+            raise SessionIdle()
+        self._human_input.append(reply)
+        return reply
+
+
+# -------------------- Live Sessions --------------------
+class LiveSession:
+    """A connected client: its inbox, and its agents once the pipeline has started."""
+
+    def __init__(self, remote_address, inbox: asyncio.Queue):
+        self.remote_address = remote_address
+        self.inbox = inbox
+        self.connected_at = time.monotonic()
+        self.session = None
+        self.session_id = None
+        self.reaped = False
+
+    def idle_seconds(self, now=None):
+        """Seconds spent waiting on the user; 0 while an agent is working."""
+        now = now or time.monotonic()
+        if self.session is None:
+            return now - self.connected_at
+        waiting_since = self.session.user_proxy.waiting_since
+        return 0.0 if waiting_since is None else now - waiting_since
+
+
+class SessionRegistry:
+    """The sessions served by this worker, and the reaper that closes idle ones."""
+
+    def __init__(self, idle_timeout=SESSION_IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self._live = set()
+        self._reaper = None
+
+    def register(self, remote_address, inbox: asyncio.Queue) -> LiveSession:
+        live = LiveSession(remote_address, inbox)
+        self._live.add(live)
+        return live
+
+    def unregister(self, live: LiveSession) -> None:
+        self._live.discard(live)
+
+    def holds(self, session_id) -> bool:
+        """Whether a connection of this worker is still running the session."""
+        return any(live.session_id == session_id for live in list(self._live))
+
+    def reap(self) -> int:
+        """
+        Close sessions idle past the timeout. Their turns are already checkpointed, so
+        the pipeline only records the status and returns its agents to the pool. They
+        stay registered until run_session() ends, so the session cannot be resumed
+        before its pipeline has let go of it.
+        """
+        now = time.monotonic()
+        stale = [live for live in self._live if not live.reaped and live.idle_seconds(now) > self.idle_timeout]
+        for live in stale:
+            live.reaped = True
+            live.inbox.put_nowait(_IDLE)
+        return len(stale)
+
+    async def reap_forever(self, interval=REAPER_INTERVAL) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            reaped = self.reap()
+            if reaped:
+                print(f" - SessionRegistry: Closed {reaped} idle session(s).", flush=True)
+
+    def start_reaper(self, interval=REAPER_INTERVAL) -> None:
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.create_task(self.reap_forever(interval))
+
+    def snapshot(self):
+        """Per-session idle time and history size, for the status endpoint."""
+        now = time.monotonic()
+        sessions = []
+        for live in list(self._live):
+            entry = {
+                "session_id": live.session_id,
+                "remote_address": str(live.remote_address),
+                "connected_seconds": round(now - live.connected_at, 1),
+                "idle_seconds": round(live.idle_seconds(now), 1),
+            }
+            if live.session is not None:
+                entry["stage"] = live.session.stage
+                entry.update(live.session.history_size())
+                if live.session.cost is not None:
+                    entry["cost"] = live.session.cost.snapshot()
+            sessions.append(entry)
+        return {
+            "live": len(sessions),
+            "idle_timeout": self.idle_timeout,
+            "history_messages": sum(entry.get("messages", 0) for entry in sessions),
+            "history_bytes": sum(entry.get("bytes", 0) for entry in sessions),
+            "sessions": sessions,
+        }
+
+
+live_sessions = SessionRegistry()
+
+
+# -------------------- Pipeline --------------------
+def build_chat_queue(data_collection_agent, estimation_agent, summary_method="last_msg"):
+    """The data_collection -> estimation chat queue used by on_connect."""
+    return [
+        {
+            "chat_id": 1,
+            "recipient": data_collection_agent,
+            "message": "You are a Technical architect. Your job is to arrive at the tech stack for a problem statement and also arrive at estimates for the application in scope.",
+            "clear_history": True,
+            "silent": False,
+            # A RunningSummary kept up to date during the interview, so the hand-off
+            # carryover needs no extra model call.
+            "summary_method": summary_method,
+        },
+        {
+            "chat_id": 2,
+            "prerequisites": [1],
+            "recipient": estimation_agent,
+            "message": ESTIMATION_REQUEST,
+            # Autogen summarizes on the calling thread, so "reflection_with_llm" here
+            # would block the event loop for every other session.
+            "summary_method": "last_msg",
+        },
+    ]
+
+
+def _track(session, store: SessionStore, session_id) -> None:
+    """Checkpoint every message and stage change of the session to the store."""
+    session.on_stage = lambda stage: store.update(session_id, stage=stage)
+    session.on_message = lambda sender, recipient, content: store.append_turn(session_id, sender, recipient, content)
+    if session.summary is not None:
+        session.summary.on_update = lambda summary, summarized: store.update(
+            session_id, state={"summary": {"text": summary, "summarized": summarized}}
+        )
+
+
+async def _finish(session, store: SessionStore = None, session_id=None):
+    final_data = session.final_data()
+    send_event(RESULT, data=final_data)
+    state = {"result": final_data}
+    if session.cost is not None:
+        state["cost"] = cost = session.cost.snapshot()
+        print(
+            f" - session cost: ${cost['cost']:.4f} over {cost['calls']} LLM call(s), "
+            f"{cost['prompt_tokens']} prompt + {cost['completion_tokens']} completion tokens",
+            flush=True,
+        )
+    if store is not None:
+        store.update(session_id, status="completed", state=state, owner=os.getpid())
+    return final_data
+
+
+async def run_pipeline(
+    initial_msg, inbox, pool: AgentPool, connected_at=None, store: SessionStore = None, live: LiveSession = None
+):
+    """Drive the data_collection -> estimation pipeline with the async chat APIs."""
+    print(f" - run_pipeline(): Initiating chat using message '{initial_msg}'", flush=True)
+    session = pool.acquire(connected_at)
+    session.user_proxy.bind(inbox)
+    session_id = None
+    if store is not None:
+        session_id = store.create_session(initial_msg)
+        _track(session, store, session_id)
+        send_event(SESSION, session_id=session_id, resumed=False)
+    if live is not None:
+        live.session, live.session_id = session, session_id
+    try:
+        chat_results = await session.user_proxy.a_initiate_chats(
+            build_chat_queue(session.data_collection_agent, session.estimation_agent, session.summary_method())
+        )
+        await _finish(session, store, session_id)
+        return chat_results
+    except SessionClosed as closed:
+        if store is not None:
+            store.update(session_id, status=closed.status, owner=os.getpid())
+        raise
+    finally:
+        pool.release(session)
+
+
+async def resume_pipeline(
+    session_id, inbox, pool: AgentPool, store: SessionStore, connected_at=None, live: LiveSession = None
+):
+    """
+    Continue a checkpointed session, claimed by this worker, on fresh agents. Their
+    histories are rebuilt from the stored turns, so no model call that already
+    completed is made again.
+    """
+    send_event(SESSION, session_id=session_id, resumed=True)
+    turns = store.load_turns(session_id)
+    print(f" - resume_pipeline(): Resuming session {session_id} after {len(turns)} turn(s)", flush=True)
+    session = pool.acquire(connected_at)
+    session.user_proxy.bind(inbox)
+    _track(session, store, session_id)
+    if live is not None:
+        live.session, live.session_id = session, session_id
+    chat_queue = build_chat_queue(session.data_collection_agent, session.estimation_agent, session.summary_method())
+    try:
+        if turns:
+            *history, last = turns
+            session.load_history(history)
+            if session.summary is not None:
+                interview = {session.user_proxy.name, session.data_collection_agent.name}
+                # The checkpointed summary covers its first turns, which are not summarized again.
+                checkpoint = (store.get(session_id) or {}).get("state", {}).get("summary") or {}
+                session.summary.restore(
+                    (
+                        (turn["sender"], turn["content"])
+                        for turn in history
+                        if {turn["sender"], turn["recipient"]} == interview
+                    ),
+                    summary=checkpoint.get("text", ""),
+                    summarized=checkpoint.get("summarized", 0),
+                )
+            agents = {agent.name: agent for agent in session}
+            sender, recipient = agents[last["sender"]], agents[last["recipient"]]
+            peer = recipient if sender is session.user_proxy else sender
+            # Same setup a_initiate_chat does for a new chat, minus clearing history.
+            session.user_proxy._prepare_chat(peer, clear_history=False)
+            # Re-send the last checkpointed message: an agent question goes back to the
+            # client and waits for the reply, a user reply is answered by the agent.
+            session.skip_checkpoints = 1
+            await sender.a_send(last["content"], recipient, request_reply=True)
+            if peer is session.data_collection_agent:
+                if session.summary is not None:
+                    carryover = session.summary.current()
+                else:
+                    carryover = session.user_proxy.last_message(peer)["content"]
+                chat_queue = [{**chat, "carryover": carryover} for chat in chat_queue[1:]]
+                for chat in chat_queue:
+                    chat.pop("prerequisites", None)
+            else:
+                chat_queue = []
+        if chat_queue:
+            await session.user_proxy.a_initiate_chats(chat_queue)
+        await _finish(session, store, session_id)
+    except SessionClosed as closed:
+        store.update(session_id, status=closed.status, owner=os.getpid())
+        raise
+    finally:
+        pool.release(session)
+
+
+def _parse_resume(msg):
+    """The session id of a {"type": "resume", "session_id": ...} frame, else None."""
+    try:
+        frame = json.loads(msg)
+    except ValueError:
+        return None
+    if isinstance(frame, dict) and frame.get("type") == "resume":
+        return frame.get("session_id")
+    return None
+
+
+# -------------------- Websocket Transport --------------------
+async def _pump_outbox(websocket, outbox: asyncio.Queue) -> None:
+    while True:
+        msg = await outbox.get()
+        if msg is _CLOSED:
+            return
+        await websocket.send(msg)
+
+
+async def _pump_inbox(websocket, inbox: asyncio.Queue) -> None:
+    try:
+        async for msg in websocket:
+            inbox.put_nowait(msg.decode() if isinstance(msg, bytes) else msg)
+    except websockets.ConnectionClosed:
+        pass
+    finally:
+        inbox.put_nowait(_CLOSED)
+
+
+async def run_session(
+    websocket, pool: AgentPool, store: SessionStore = None, registry: SessionRegistry = live_sessions
+) -> None:
+    """Serve one client connection as a task on the event loop."""
+    connected_at = time.monotonic()
+    loop = asyncio.get_running_loop()
+    inbox: asyncio.Queue = asyncio.Queue()
+    outbox: asyncio.Queue = asyncio.Queue()
+    live = registry.register(websocket.remote_address, inbox)
+    reader = asyncio.create_task(_pump_inbox(websocket, inbox))
+    writer = asyncio.create_task(_pump_outbox(websocket, outbox))
+    print(f" - run_session(): Connected to client {websocket.remote_address}", flush=True)
+    idle = False
+    try:
+        with IOStream.set_default(EventIOStream(QueueIOStream(outbox, loop))):
+            while True:
+                initial_msg = await inbox.get()
+                if initial_msg is _CLOSED:
+                    return
+                if initial_msg is _IDLE:
+                    raise SessionIdle()
+                session_id = _parse_resume(initial_msg)
+                if session_id is None:
+                    await run_pipeline(initial_msg, inbox, pool, connected_at, store, live)
+                    return
+                record = store.get(session_id) if store is not None else None
+                if record is not None and record["status"] == "completed":
+                    # Nothing left to run: hand back the stored result without claiming it.
+                    send_event(SESSION, session_id=session_id, resumed=True)
+                    send_event(RESULT, data=record["state"].get("result", {}))
+                    return
+                # A reconnect while this worker still runs the session (e.g. mid-reply) must
+                # not start a second pipeline on it.
+                if record is not None and not registry.holds(session_id) and store.claim(session_id):
+                    await resume_pipeline(session_id, inbox, pool, store, connected_at, live)
+                    return
+                # Unknown session, or still held by a worker: start a new one instead.
+                send_event(ERROR, error="resume_failed", session_id=session_id)
+    except SessionIdle:
+        idle = True
+        print(" - run_session(): Closing idle session.", flush=True)
+        outbox.put_nowait(json.dumps({"type": ERROR, "error": "idle_timeout", "session_id": live.session_id}))
+    except SessionClosed:
+        print(" - run_session(): Client disconnected.", flush=True)
+    finally:
+        registry.unregister(live)
+        outbox.put_nowait(_CLOSED)
+        reader.cancel()
+        await asyncio.gather(writer, return_exceptions=True)
+        if idle:
+            await websocket.close(code=1001, reason="idle timeout")
+
+
+def create_session_pool(
+    llm_config=None, size=8, stream=True, max_history_messages=MAX_HISTORY_MESSAGES, max_history_chars=MAX_HISTORY_CHARS
+) -> AgentPool:
+    """Warm pool of session agents whose human proxy reads from the websocket."""
+    factory = AgentFactory(
+        llm_config,
+        user_proxy_cls=AsyncHumanProxyAgent,
+        stream=stream,
+        max_history_messages=max_history_messages or None,
+        max_history_chars=max_history_chars or None,
+        rate_limit=True,
+        route=True,
+        semantic_cache=default_semantic_cache(),
+        running_summary=True,
+        context_budget=CONTEXT_TOKEN_BUDGET,
+        meter_prompts=True,
+        speculate=True,
+        instrument=True,
+    )
+    return AgentPool(factory, size=size)
+
+
+def serve_sessions(pool: AgentPool, host="0.0.0.0", port=8080, store: SessionStore = None, reuse_port=False, **serve_kwargs):
+    """
+    Return an async context manager that serves run_session() on the running loop.
+    Use as `async with serve_sessions(pool, port=8080): ...`.
+
+    With reuse_port=True every worker process binds the same port (SO_REUSEPORT) and
+    the kernel spreads connections across them; a websocket stays on the worker that
+    accepted it, and session records go to the shared store.
+    """
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=LLM_CALL_WORKERS))
+    if store is not None:
+        orphaned = store.recover_orphans()
+        if orphaned:
+            print(f" - serve_sessions(): Marked sessions of {orphaned} stopped worker(s) as orphaned.", flush=True)
+    if reuse_port:
+        serve_kwargs["reuse_port"] = True
+    live_sessions.start_reaper()
+
+    async def handler(websocket, *args):
+        await run_session(websocket, pool, store)
+
+    print(f" - serve_sessions(): Worker {os.getpid()} listening on port {port}.", flush=True)
+    return websockets.serve(handler, host, port, **serve_kwargs)
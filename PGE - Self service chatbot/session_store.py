@@ -0,0 +1,184 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+SESSION_DB = os.getenv("SESSION_DB", "sessions.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    worker_pid INTEGER,
+    status TEXT NOT NULL,
+    stage TEXT,
+    initial_message TEXT,
+    state TEXT NOT NULL DEFAULT '{}',
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_by_worker ON sessions (worker_pid, status);
+CREATE TABLE IF NOT EXISTS turns (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    sender TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    content TEXT,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (session_id, seq)
+);
+"""
+
+# Sessions in these states belong to a live worker; anything else can be picked up by any worker.
+LIVE_STATUSES = ("active",)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SessionStore:
+    """
+    Session records shared by all worker processes on this host, kept in one SQLite
+    database in WAL mode so readers never block the worker that is writing.
+    """
+
+    def __init__(self, path=SESSION_DB):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 connections are per thread; LLM calls and the event loop run on different ones.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def create_session(self, initial_message=None, session_id=None) -> str:
+        session_id = session_id or uuid.uuid4().hex
+        now = time.time()
+        self._connect().execute(
+            "INSERT INTO sessions (session_id, worker_pid, status, initial_message, created_at, updated_at)"
+            " VALUES (?, ?, 'active', ?, ?, ?)",
+            (session_id, os.getpid(), initial_message, now, now),
+        )
+        return session_id
+
+    def get(self, session_id):
+        row = self._connect().execute("SELECT * FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        if row is None:
+            return None
+        record = dict(row)
+        record["state"] = json.loads(record["state"])
+        return record
+
+    def update(self, session_id, state=None, owner=None, **fields) -> bool:
+        """
+        Update status/stage columns and merge `state` into the session's JSON state.
+        With owner set, only while that worker still holds the session; returns whether
+        the record was updated.
+        """
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT state, worker_pid FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            if row is None or (owner is not None and row["worker_pid"] != owner):
+                conn.execute("ROLLBACK")
+                return False
+            if state:
+                fields["state"] = json.dumps({**json.loads(row["state"]), **state})
+            fields["updated_at"] = time.time()
+            columns = ", ".join(f"{name} = ?" for name in fields)
+            conn.execute(f"UPDATE sessions SET {columns} WHERE session_id = ?", (*fields.values(), session_id))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return True
+
+    def claim(self, session_id) -> bool:
+        """
+        Take ownership of a session for this worker. Fails while another live
+        worker is still serving it, which keeps each interview on one process, and
+        for completed sessions, which have nothing left to run. Check and takeover
+        are one conditional UPDATE, so of two workers claiming the same session only
+        one succeeds. The caller must not claim a session this worker still runs.
+        """
+        pid = os.getpid()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT status, worker_pid FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            owners = [pid]
+            if row is not None and row["status"] in LIVE_STATUSES and not _pid_alive(row["worker_pid"]):
+                # Its worker stopped without recover_orphans() having run since.
+                owners.append(row["worker_pid"])
+            claimed = conn.execute(
+                f"UPDATE sessions SET worker_pid = ?, status = 'active', updated_at = ?"
+                f" WHERE session_id = ? AND status != 'completed' AND (status NOT IN ({', '.join('?' * len(LIVE_STATUSES))})"
+                f" OR worker_pid IN ({', '.join('?' * len(owners))}))",
+                (pid, time.time(), session_id, *LIVE_STATUSES, *owners),
+            ).rowcount
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return claimed == 1
+
+    def recover_orphans(self) -> int:
+        """Mark sessions owned by workers that are no longer running as resumable."""
+        conn = self._connect()
+        rows = conn.execute(
+            f"SELECT DISTINCT worker_pid FROM sessions WHERE status IN ({', '.join('?' * len(LIVE_STATUSES))})",
+            LIVE_STATUSES,
+        ).fetchall()
+        dead = [row["worker_pid"] for row in rows if row["worker_pid"] is not None and not _pid_alive(row["worker_pid"])]
+        for pid in dead:
+            conn.execute(
+                "UPDATE sessions SET status = 'orphaned', updated_at = ? WHERE worker_pid = ? AND status = 'active'",
+                (time.time(), pid),
+            )
+        return len(dead)
+
+    # -------------------- Turn Checkpoints --------------------
+    def append_turn(self, session_id, sender, recipient, content) -> int:
+        """Append one message to the session's checkpoint log; rows are never rewritten."""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            seq = conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) + 1 FROM turns WHERE session_id = ?", (session_id,)
+            ).fetchone()[0]
+            conn.execute(
+                "INSERT INTO turns (session_id, seq, sender, recipient, content, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (session_id, seq, sender, recipient, content, time.time()),
+            )
+            conn.execute("UPDATE sessions SET updated_at = ? WHERE session_id = ?", (time.time(), session_id))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return seq
+
+    def load_turns(self, session_id):
+        rows = self._connect().execute(
+            "SELECT seq, sender, recipient, content FROM turns WHERE session_id = ? ORDER BY seq", (session_id,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def counts(self):
+        rows = self._connect().execute("SELECT status, COUNT(*) AS n FROM sessions GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
@@ -0,0 +1,162 @@
+import asyncio
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from autogen import Agent
+
+# Data collection messages that end the interview. Only TERMINATE marks it reliably: the prompt
+# also mentions the estimation agent mid-interview, and every false start is a paid completion.
+SPECULATION_TRIGGER = re.compile(os.getenv("SPECULATION_TRIGGER", r"\bTERMINATE\b"))
+
+# Speculative estimates of all sessions share these threads.
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="speculative-estimate")
+
+_stats = {"started": 0, "served": 0, "cancelled": 0, "failed": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(event) -> None:
+    with _stats_lock:
+        _stats[event] += 1
+
+
+def speculation_stats():
+    """Speculative estimates started, served to a confirmed interview, cancelled by an amendment, or failed."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+class SpeculativeEstimate:
+    """
+    The estimation agent's reply, computed in the background from the interview summary
+    before the user has confirmed it. The estimation chat is answered from it when the
+    user confirms; any further message to the data collection agent cancels it.
+    """
+
+    def __init__(self, agent, request, client=None):
+        self.agent = agent
+        self.request = request
+        # A non-streaming client for the agent's deployment; the agent's own client streams.
+        self.client = client if client is not None else agent.client
+        self._future = None
+        self._carryover = None
+        self._lock = threading.Lock()
+
+    @property
+    def carryover(self):
+        """The carryover the pending speculative run was started from, or None."""
+        with self._lock:
+            return self._carryover
+
+    def _prompt(self, carryover) -> str:
+        # The same first message the estimation chat sends: its request plus the carryover.
+        return f"{self.request}\nContext: \n{carryover}"
+
+    def start(self, carryover) -> None:
+        prompt = self._prompt(carryover)
+        with self._lock:
+            previous, self._future = self._future, _executor.submit(self._generate, prompt)
+            self._carryover = carryover
+        if previous is not None:
+            previous.cancel()
+        _count("started")
+        print(f" - {self.agent.name}: speculative estimate started", flush=True)
+
+    def _generate(self, prompt):
+        # Nobody is watching yet, so self.client does not stream. The response cache ignores
+        # "stream", so a confirmed run of the same prompt would hit the same entry.
+        response = self.client.create(
+            messages=self.agent._oai_system_message + [{"role": "user", "content": prompt}],
+            agent=self.agent,
+        )
+        return self.client.extract_text_or_completion_object(response)[0]
+
+    def cancel(self) -> None:
+        future = self.take()
+        if future is not None:
+            # A call already in flight runs to completion; its result is dropped.
+            future.cancel()
+            _count("cancelled")
+            print(f" - {self.agent.name}: speculative estimate cancelled", flush=True)
+
+    def take(self):
+        with self._lock:
+            future, self._future, self._carryover = self._future, None, None
+        return future
+
+    def _served(self, reply):
+        if reply is None:
+            return False, None
+        _count("served")
+        print(f" - {self.agent.name}: estimate served from the speculative run", flush=True)
+        return True, reply
+
+    def reply(self, recipient, messages=None, sender=None, config=None):
+        future = self._first_turn_future(messages)
+        if future is None:
+            return False, None
+        try:
+            return self._served(future.result())
+        except Exception as err:
+            return self._failed(err)
+
+    async def a_reply(self, recipient, messages=None, sender=None, config=None):
+        future = self._first_turn_future(messages)
+        if future is None:
+            return False, None
+        try:
+            return self._served(await asyncio.wrap_future(future))
+        except Exception as err:
+            return self._failed(err)
+
+    def _first_turn_future(self, messages):
+        with self._lock:
+            future, carryover = self._future, self._carryover
+            self._future = self._carryover = None
+        if future is None:
+            return None
+        if not messages or len(messages) != 1 or messages[0].get("content") != self._prompt(carryover):
+            # Not the estimation request the speculative run answered.
+            future.cancel()
+            _count("cancelled")
+            print(f" - {self.agent.name}: estimation request differs from the speculative run; generating it now", flush=True)
+            return None
+        return future
+
+    def _failed(self, err):
+        _count("failed")
+        print(f" - {self.agent.name}: speculative estimate failed ({err}); generating it now", flush=True)
+        return False, None
+
+
+def enable_speculative_estimate(session, request, client=None) -> SpeculativeEstimate:
+    """
+    Start the estimation stage as soon as the data collection agent ends the interview.
+    request is the estimation chat's opening message; the carryover is the session's
+    running summary when it has one, otherwise the final message itself (last_msg).
+    client should be a non-streaming wrapper for the estimation agent's deployment.
+    """
+    speculation = SpeculativeEstimate(session.estimation_agent, request, client)
+    interviewer, user_proxy = session.data_collection_agent, session.user_proxy
+
+    def on_interviewer_message(sender, message, recipient, silent):
+        content = message.get("content") if isinstance(message, dict) else message
+        if recipient is user_proxy and isinstance(content, str) and SPECULATION_TRIGGER.search(content):
+            carryover = session.summary.current() if session.summary is not None else content
+            speculation.start(carryover)
+        return message
+
+    def on_user_message(sender, message, recipient, silent):
+        # The user answered the summary instead of confirming it: the interview goes on.
+        if recipient is interviewer:
+            speculation.cancel()
+        return message
+
+    interviewer.register_hook("process_message_before_send", on_interviewer_message)
+    user_proxy.register_hook("process_message_before_send", on_user_message)
+    # Same pairing as the streaming reply functions: the async variant is skipped in sync chats.
+    session.estimation_agent.register_reply([Agent, None], speculation.reply)
+    session.estimation_agent.register_reply([Agent, None], speculation.a_reply, ignore_async_in_sync_chat=True)
+    return speculation
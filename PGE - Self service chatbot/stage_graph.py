@@ -0,0 +1,134 @@
+import asyncio
+import inspect
+import os
+import time
+
+# Stages that may run at once; stages that talk to the user should run with 1.
+STAGE_CONCURRENCY = int(os.getenv("STAGE_CONCURRENCY", "8"))
+
+
+def with_carryover(message, upstream) -> str:
+    """The stage's message followed by its inputs' outputs, laid out like autogen's carryover."""
+    outputs = [output for output in upstream.values() if output]
+    if not outputs:
+        return message
+    return message + "\nContext: \n" + "\n".join(str(output) for output in outputs)
+
+
+class Stage:
+    """
+    One step of a pipeline: run(upstream) gets {input stage name: output} for the
+    stages listed in after and returns this stage's output. run may be a plain
+    function (called on a worker thread) or a coroutine function.
+    """
+
+    def __init__(self, name, run, after=()):
+        self.name = name
+        self.run = run
+        self.after = tuple(after)
+
+
+class StageGraph:
+    """
+    Runs stages as soon as the stages they depend on have finished, at most
+    max_concurrency at a time, and keeps per-stage timings for report().
+    """
+
+    def __init__(self, stages):
+        self.stages = {}
+        for stage in stages:
+            if stage.name in self.stages:
+                raise ValueError(f"Duplicate stage {stage.name!r}")
+            self.stages[stage.name] = stage
+        for stage in self.stages.values():
+            unknown = [name for name in stage.after if name not in self.stages]
+            if unknown:
+                raise ValueError(f"Stage {stage.name!r} depends on unknown stages {unknown}")
+        self._check_acyclic()
+        self.timings = {}
+        self.started_at = None
+        self.finished_at = None
+
+    def _check_acyclic(self) -> None:
+        state = {}
+
+        def visit(name, path):
+            if state.get(name) == "done":
+                return
+            if state.get(name) == "visiting":
+                raise ValueError(f"Stage dependency cycle: {' -> '.join(path + [name])}")
+            state[name] = "visiting"
+            for dependency in self.stages[name].after:
+                visit(dependency, path + [name])
+            state[name] = "done"
+
+        for name in self.stages:
+            visit(name, [])
+
+    async def _run_stage(self, stage, tasks, semaphore):
+        upstream = {name: await tasks[name] for name in stage.after}
+        ready = time.perf_counter()
+        async with semaphore:
+            started = time.perf_counter()
+            if inspect.iscoroutinefunction(stage.run):
+                output = await stage.run(upstream)
+            else:
+                output = await asyncio.to_thread(stage.run, upstream)
+            finished = time.perf_counter()
+        self.timings[stage.name] = {"ready": ready, "started": started, "finished": finished}
+        print(f" - {stage.name}: finished in {finished - started:.1f}s", flush=True)
+        return output
+
+    async def a_run(self, max_concurrency=STAGE_CONCURRENCY):
+        """Outputs of every stage, in the order the stages were declared."""
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        self.timings = {}
+        self.started_at = time.perf_counter()
+        tasks = {}
+        # Declared order, so with a concurrency of 1 the stages run in that order.
+        for name, stage in self.stages.items():
+            tasks[name] = asyncio.ensure_future(self._run_stage(stage, tasks, semaphore))
+        try:
+            outputs = await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            raise
+        finally:
+            self.finished_at = time.perf_counter()
+        return dict(zip(tasks, outputs))
+
+    def run(self, max_concurrency=STAGE_CONCURRENCY):
+        return asyncio.run(self.a_run(max_concurrency))
+
+    def critical_path(self):
+        """Stage names on the chain of dependencies that finished last."""
+        if not self.timings:
+            return []
+        name = max(self.timings, key=lambda stage: self.timings[stage]["finished"])
+        path = [name]
+        while self.stages[name].after:
+            name = max(self.stages[name].after, key=lambda stage: self.timings[stage]["finished"])
+            path.append(name)
+        return path[::-1]
+
+    def report(self) -> str:
+        """Per-stage start, duration and queueing time, relative to the start of the run, and the critical path."""
+        if not self.timings:
+            return "No stages have run."
+        wall = self.finished_at - self.started_at
+        busy = sum(timing["finished"] - timing["started"] for timing in self.timings.values())
+        width = max(len(name) for name in self.timings)
+        lines = [f"Stage timings (wall {wall:.1f}s, {busy:.1f}s of stage time):"]
+        for name, timing in sorted(self.timings.items(), key=lambda item: item[1]["started"]):
+            start = timing["started"] - self.started_at
+            duration = timing["finished"] - timing["started"]
+            queued = timing["started"] - timing["ready"]
+            waited = f", queued {queued:.1f}s" if queued >= 0.05 else ""
+            lines.append(f"  {name:<{width}}  {start:6.1f}s +{duration:6.1f}s{waited}")
+        path = self.critical_path()
+        steps = " -> ".join(
+            f"{name} ({self.timings[name]['finished'] - self.timings[name]['started']:.1f}s)" for name in path
+        )
+        lines.append(f"Critical path: {steps}")
+        return "\n".join(lines)
@@ -0,0 +1,95 @@
+import asyncio
+import re
+import uuid
+import weakref
+
+from autogen import Agent
+from autogen.io.base import IOStream
+
+from events import TOKEN, TOKEN_END
+
+# The OpenAI client wraps streamed output in terminal colour codes; those never reach the browser.
+_ANSI = re.compile(r"\x1b\[[0-9;]*m")
+
+
+# Message id of the completion each agent streamed last, so its agent_message event can
+# point the client at the bubble the tokens went into.
+_streamed_message_ids = weakref.WeakKeyDictionary()
+
+
+class TokenIOStream:
+    """
+    Wraps a session IOStream while one completion is streaming and sends each chunk
+    as a token event tagged with the agent and message it belongs to. On plain
+    console streams the chunks are printed as they are.
+    """
+
+    def __init__(self, iostream, agent_name: str, message_id: str = None):
+        self._iostream = iostream
+        self._emit = getattr(iostream, "emit", None)
+        self.agent_name = agent_name
+        self.message_id = message_id or uuid.uuid4().hex
+        self.started = False
+
+    def print(self, *objects, sep=" ", end="\n", flush=False) -> None:
+        if self._emit is None:
+            self._iostream.print(*objects, sep=sep, end=end, flush=flush)
+            return
+        text = sep.join(map(str, objects)) + end
+        delta = _ANSI.sub("", text)
+        # Content chunks are printed bare, whitespace-only ones included. A print that carried
+        # colour codes is the client's framing around the completion ("\033[0m\n" closes it).
+        if not delta or (delta != text and not delta.strip()):
+            return
+        self.started = True
+        self._emit(TOKEN, agent=self.agent_name, message_id=self.message_id, delta=delta)
+
+    def input(self, prompt: str = "", *, password: bool = False) -> str:
+        return self._iostream.input(prompt, password=password)
+
+    def end(self) -> None:
+        if self.started:
+            self._emit(TOKEN_END, agent=self.agent_name, message_id=self.message_id)
+
+
+def pop_streamed_message_id(agent):
+    """Message id of the agent's last streamed completion, or None if it was not streamed."""
+    return _streamed_message_ids.pop(agent, None)
+
+
+# -------------------- Streaming Reply Functions --------------------
+def stream_oai_reply(recipient, messages=None, sender=None, config=None):
+    """generate_oai_reply with the completion's chunks forwarded as token frames."""
+    stream = TokenIOStream(IOStream.get_default(), recipient.name)
+    with IOStream.set_default(stream):
+        final, reply = recipient.generate_oai_reply(messages=messages, sender=sender)
+    stream.end()
+    if stream.started:
+        _streamed_message_ids[recipient] = stream.message_id
+    return final, reply
+
+
+async def a_stream_oai_reply(recipient, messages=None, sender=None, config=None):
+    """Async stream_oai_reply; the blocking client call runs in the default executor."""
+    iostream = IOStream.get_default()
+
+    def _run():
+        with IOStream.set_default(iostream):
+            return stream_oai_reply(recipient, messages=messages, sender=sender)
+
+    return await asyncio.get_running_loop().run_in_executor(None, _run)
+
+
+def enable_token_streaming(agent) -> None:
+    """
+    Route the agent's LLM replies through the streaming reply functions. The agent's
+    client must be built from an llm_config with "stream": True.
+    """
+    # Same pairing autogen uses for generate_oai_reply: the async variant sits in front
+    # and is skipped in sync chats, where the sync variant answers instead.
+    agent.register_reply([Agent, None], stream_oai_reply)
+    agent.register_reply([Agent, None], a_stream_oai_reply, ignore_async_in_sync_chat=True)
+
+
+def streaming_llm_config(llm_config):
+    return {**llm_config, "stream": True}
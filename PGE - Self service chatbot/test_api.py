@@ -1,4 +1,5 @@
 import autogen
+from response_cache import response_cache_config
 from datetime import datetime
 from tempfile import TemporaryDirectory
 
@@ -15,6 +16,7 @@ llm_config = {
         "OAI_CONFIG_LIST"
     ),
     "temperature": 0,
+    **response_cache_config(),
 }
 
 def on_connect(iostream: IOWebsockets) -> None:
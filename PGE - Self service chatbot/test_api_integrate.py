@@ -1,4 +1,5 @@
 import autogen
+from response_cache import response_cache_config
 from datetime import datetime
 from tempfile import TemporaryDirectory
 from websockets.sync.client import connect as ws_connect
@@ -8,8 +9,6 @@ import os
 import json
 from langchain_openai import AzureChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
-from docx import Document as DocxDocument
-from PyPDF2 import PdfReader
 from dotenv import load_dotenv
 from autogen import AssistantAgent, UserProxyAgent
 import autogen
@@ -29,6 +28,7 @@ llm_config = {
         "OAI_CONFIG_LIST"
     ),
     "temperature": 0,
+    **response_cache_config(),
 }
 
 def on_connect(iostream: IOWebsockets) -> None:
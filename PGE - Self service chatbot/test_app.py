@@ -1,16 +1,31 @@
 import os
 import json
+import hashlib
+import io
 from dotenv import load_dotenv
-from docx import Document as DocxDocument
-from PyPDF2 import PdfReader
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, File, UploadFile
-from fastapi.responses import HTMLResponse
-from autogen import AssistantAgent, UserProxyAgent
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Request
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse
+from autogen.io.base import IOStream
 import autogen
 import uvicorn
 from contextlib import asynccontextmanager
 import asyncio
 
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart before 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+from agent_factory import ESTIMATION_REQUEST, AgentFactory
+from document_formats import detect_format, extract_document
+from events import ERROR, RESULT, EventIOStream
+from metrics import llm_metrics
+from rate_limiter import limiter_stats
+from response_cache import response_cache_config
+from semantic_cache import default_semantic_cache
+from speculation import speculation_stats
+from worker_pool import BoundedSessionExecutor, ServerBusy, WebSocketBridgeIOStream
+
 # -------------------- Load Environment Variables --------------------
 load_dotenv()
 
@@ -27,67 +42,140 @@ llm_config = {
     "timeout": 600,
     "config_list": autogen.config_list_from_json("OAI_CONFIG_LIST"),
     "temperature": 0,
+    **response_cache_config(),
 }
 
 # Initialize FastAPI app
 app = FastAPI()
 
-# -------------------- Initialize Autogen Agents --------------------
-data_collection_agent = AssistantAgent(
-    name="data_collection_agent",
-    system_message="""You are a Technical architect. Your job is to arrive at the tech stack for a problem statement and also arrive at estimates for the application in scope. 
+# -------------------- Autogen Agent Prototypes --------------------
+# Every session gets its own agents (and chat_messages); only the OpenAI clients are shared.
+agent_prototypes = {
+    "data_collection_agent": {
+        "system_message": """You are a Technical architect. Your job is to arrive at the tech stack for a problem statement and also arrive at estimates for the application in scope. 
     You interact with the customer in a chat format and obtain information necessary to come up with estimates. 
     Ask a series of questions covering the application overview, tech stack involved, integration points, and develop a work breakdown of the complex problem statement. 
     Provide justifications for each estimate and list assumptions. If certain information is not provided, make assumptions and arrive at estimates. 
     Always suggest leading open-source frameworks wherever possible and call out the reasons for it. 
     Decide technologies and tech stacks based on volume. All infra hosting will incur cost, and while giving an estimate, take into account the cost of hosting as well.
     You should ask questions one by one as this will be the best experience for the user. Don't ask all your questions at once.""",
-    llm_config=llm_config,
-)
-
-estimation_agent = AssistantAgent(
-    name="estimation_agent",
-    system_message="""You are a Technical architect. Your job is to generate high-level functionalities/modules, tech stack, volumetrics, feasibility, 
+    },
+    "estimation_agent": {
+        "system_message": """You are a Technical architect. Your job is to generate high-level functionalities/modules, tech stack, volumetrics, feasibility, 
     convert conversation to high-level requirements, WBS, high-level functionalities, costing, assumptions, timeline, resources, and TCO based on the data 
     collected by the data collection agent.""",
-    llm_config=llm_config,
-    human_input_mode="NEVER",
-)
+        "human_input_mode": "NEVER",
+    },
+}
 
-user_proxy = UserProxyAgent(
-    name="user_proxy",
-    human_input_mode="ALWAYS",
-    llm_config=llm_config,
-    code_execution_config=False,
-    system_message="You are a helpful assistant."
+agent_factory = AgentFactory(
+    llm_config,
+    prototypes=agent_prototypes,
+    max_history_messages=int(os.getenv("MAX_HISTORY_MESSAGES", "200")) or None,
+    max_history_chars=int(os.getenv("MAX_HISTORY_CHARS", "400000")) or None,
+    rate_limit=True,
+    route=True,
+    semantic_cache=default_semantic_cache(),
+    running_summary=True,
+    context_budget=int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000")),
+    meter_prompts=True,
+    speculate=True,
+    instrument=True,
 )
 
+# Seconds a /ws session may wait on the user before its worker is freed
+SESSION_IDLE_TIMEOUT = float(os.getenv("SESSION_IDLE_TIMEOUT", "900"))
+
+# -------------------- Session Admission --------------------
+MAX_SESSION_WORKERS = int(os.getenv("MAX_SESSION_WORKERS", "4"))
+MAX_SESSION_QUEUE = int(os.getenv("MAX_SESSION_QUEUE", "8"))
+
+session_executor = BoundedSessionExecutor(max_workers=MAX_SESSION_WORKERS, max_queue=MAX_SESSION_QUEUE)
+
+# -------------------- Uploads --------------------
+MAX_UPLOAD_MB = float(os.getenv("MAX_UPLOAD_MB", "25"))
+MAX_UPLOAD_BYTES = int(MAX_UPLOAD_MB * 1024 * 1024)
+# Form field of the upload form that carries the document.
+UPLOAD_FIELD = "file"
+# Room for the multipart boundaries and part headers around the document.
+UPLOAD_OVERHEAD_BYTES = 64 * 1024
+
 # -------------------- Helper Functions --------------------
-def extract_text_from_docx(docx_path):
-    doc = DocxDocument(docx_path)
-    return "\n".join([para.text for para in doc.paragraphs])
-
-def extract_text_from_pdf(pdf_path):
-    reader = PdfReader(pdf_path)
-    return "\n".join(page.extract_text() for page in reader.pages)
-
-async def read_uploaded_document(file: UploadFile):
-    if file.filename.endswith(".txt"):
-        return (await file.read()).decode("utf-8")
-    elif file.filename.endswith(".docx"):
-        with TemporaryDirectory() as temp_dir:
-            temp_path = os.path.join(temp_dir, file.filename)
-            with open(temp_path, "wb") as f:
-                f.write(await file.read())
-            return extract_text_from_docx(temp_path)
-    elif file.filename.endswith(".pdf"):
-        with TemporaryDirectory() as temp_dir:
-            temp_path = os.path.join(temp_dir, file.filename)
-            with open(temp_path, "wb") as f:
-                f.write(await file.read())
-            return extract_text_from_pdf(temp_path)
-    else:
+def _too_large():
+    return HTTPException(status_code=413, detail=f"Upload exceeds {MAX_UPLOAD_MB:g} MB")
+
+
+async def _receive_upload(request: Request):
+    """
+    The uploaded document of a multipart/form-data request as a BytesIO, with its SHA-256.
+    The body is parsed as it arrives, so the size limit and the hash apply while receiving
+    and nothing is spooled first. Bodies whose declared length is over MAX_UPLOAD_MB are
+    refused before any of it is read.
+    """
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in options:
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data upload")
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > MAX_UPLOAD_BYTES + UPLOAD_OVERHEAD_BYTES:
+        raise _too_large()
+
+    digest, buffer = hashlib.sha256(), io.BytesIO()
+    part = {"header": b"", "value": b"", "disposition": b"", "document": False, "found": False}
+
+    def on_part_begin():
+        part.update(header=b"", value=b"", disposition=b"", document=False)
+
+    def on_header_field(data, start, end):
+        part["header"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        part["value"] += data[start:end]
+
+    def on_header_end():
+        if part["header"].lower() == b"content-disposition":
+            part["disposition"] = part["value"]
+        part["header"], part["value"] = b"", b""
+
+    def on_headers_finished():
+        _, params = parse_options_header(part["disposition"])
+        part["document"] = not part["found"] and params.get(b"name") == UPLOAD_FIELD.encode() and b"filename" in params
+        part["found"] = part["found"] or part["document"]
+
+    def on_part_data(data, start, end):
+        if not part["document"]:
+            return
+        if buffer.tell() + end - start > MAX_UPLOAD_BYTES:
+            raise _too_large()
+        chunk = memoryview(data)[start:end]
+        digest.update(chunk)
+        buffer.write(chunk)
+
+    parser = MultipartParser(
+        options[b"boundary"],
+        {
+            "on_part_begin": on_part_begin,
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+            "on_part_data": on_part_data,
+        },
+    )
+    async for chunk in request.stream():
+        parser.write(chunk)
+    parser.finalize()
+    if not part["found"]:
+        raise HTTPException(status_code=400, detail=f"No file in the {UPLOAD_FIELD!r} form field")
+    buffer.seek(0)
+    return buffer, digest.hexdigest()
+
+async def read_uploaded_document(request: Request):
+    """Text of an upload, recognised from its content and parsed in memory off the event loop."""
+    buffer, digest = await _receive_upload(request)
+    document_format = detect_format(buffer)
+    if document_format is None:
         return "Unsupported file format. Please upload TXT, DOCX, or PDF."
+    return await asyncio.to_thread(extract_document, document_format, buffer, digest)
 
 # HTML content for document upload
 html_content = """
@@ -111,9 +199,24 @@ html_content = """
         <script>
             var ws = new WebSocket("ws://localhost:8080/ws");
             ws.onmessage = function(event) {
+                var frame = JSON.parse(event.data)
+                var text
+                if (frame.type === "agent_message") {
+                    text = frame.content
+                } else if (frame.type === "result") {
+                    text = JSON.stringify(frame.data)
+                } else if (frame.type === "error" && frame.error === "busy") {
+                    text = "Server busy, retry in " + frame.retry_after + "s"
+                } else if (frame.type === "error" && frame.error === "idle_timeout") {
+                    text = "Session closed after waiting too long for a reply. Reload to start again."
+                } else if (frame.type === "error") {
+                    text = "Error: " + frame.error
+                } else {
+                    return
+                }
                 var messages = document.getElementById('messages')
                 var message = document.createElement('li')
-                var content = document.createTextNode(event.data)
+                var content = document.createTextNode(text)
                 message.appendChild(content)
                 messages.appendChild(message)
             };
@@ -133,15 +236,40 @@ async def get_html():
     return HTMLResponse(html_content)
 
 @app.post("/upload")
-async def upload_document(file: UploadFile = File(...)):
-    content = await read_uploaded_document(file)
-    final_data = analyze_and_start_autogen_qa(content)
+async def upload_document(request: Request):
+    content = await read_uploaded_document(request)
+    try:
+        final_data = await session_executor.submit(analyze_and_start_autogen_qa, content)
+    except ServerBusy as busy:
+        return JSONResponse(
+            {"message": "Server busy, retry later", "retry_after": busy.retry_after},
+            status_code=503,
+            headers={"Retry-After": str(busy.retry_after)},
+        )
     return {"message": "Document processed successfully", "data": final_data}
 
-def analyze_and_start_autogen_qa(content):
-    """Use Autogen to analyze content and initiate Q&A."""
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(llm_metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/sessions")
+async def session_stats():
+    return {**session_executor.stats(), "rate_limit": limiter_stats(), "speculation": speculation_stats()}
+
+def analyze_and_start_autogen_qa(content, iostream=None):
+    """Use Autogen to analyze content and initiate Q&A.
+
+    Runs on a session worker thread with its own agents; iostream, when given,
+    carries agent output and human input for this session only.
+    """
+    if iostream is not None:
+        with IOStream.set_default(iostream):
+            return analyze_and_start_autogen_qa(content)
+
     user_input = content
     conversation_history = []  # Store the entire conversation
+    session = agent_factory.new_session()
+    data_collection_agent, estimation_agent, user_proxy = session
 
     # Start sequential chat between agents using initiate_chats
     chat_results = user_proxy.initiate_chats(
@@ -151,40 +279,42 @@ def analyze_and_start_autogen_qa(content):
                 "message": user_input,
                 "clear_history": True,
                 "silent": False,
-                "summary_method": "last_msg",
+                "summary_method": session.summary_method(),
             },
             {
                 "recipient": estimation_agent,
-                "message": "Please generate estimates based on the collected information.",
-                "summary_method": "reflection_with_llm",
+                "message": ESTIMATION_REQUEST,
+                "summary_method": "last_msg",
             },
         ]
     )
 
-    # Extract specific messages from each agent
-    final_data = {}
-
-    # Retrieve messages from data_collection_agent
-    data_collection_messages = data_collection_agent.chat_messages[user_proxy]
-    if data_collection_messages:
-        final_data["data_collection_response"] = data_collection_messages[-1]["content"]  # Last meaningful message
-
-    # Retrieve messages from estimation_agent
-    estimation_messages = estimation_agent.chat_messages[user_proxy]
-    if estimation_messages:
-        final_data["estimation_response"] = estimation_messages[-1]["content"]  # Last meaningful message
+    print(f"Session cost: {session.cost.snapshot()}", flush=True)
 
-    return final_data
+    # Last meaningful message from each agent
+    return session.final_data()
 
 # -------------------- WebSocket Connection Handling --------------------
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
+    iostream = EventIOStream(WebSocketBridgeIOStream(websocket, asyncio.get_running_loop(), SESSION_IDLE_TIMEOUT))
     try:
         while True:
             data = await websocket.receive_text()
-            final_data = analyze_and_start_autogen_qa(data)
-            await websocket.send_text(json.dumps(final_data))
+            try:
+                pending = session_executor.submit(analyze_and_start_autogen_qa, data, iostream)
+            except ServerBusy as busy:
+                await websocket.send_text(json.dumps({"type": ERROR, "error": "busy", "retry_after": busy.retry_after}))
+                await websocket.close(code=1013)  # Try Again Later
+                return
+            try:
+                final_data = await pending
+            except TimeoutError:
+                await websocket.send_text(json.dumps({"type": ERROR, "error": "idle_timeout"}))
+                await websocket.close(code=1001)
+                return
+            await websocket.send_text(json.dumps({"type": RESULT, "data": final_data}))
     except WebSocketDisconnect:
         pass
 
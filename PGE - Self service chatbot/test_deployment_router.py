@@ -0,0 +1,125 @@
+import threading
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+openai = pytest.importorskip("openai")
+httpx = pytest.importorskip("httpx")
+
+from deployment_router import (
+    BREAKER_COOLDOWN,
+    BREAKER_THRESHOLD,
+    Deployment,
+    DeploymentHealth,
+    RoutedClient,
+)
+
+
+def _open(health, now=0.0):
+    for _ in range(BREAKER_THRESHOLD):
+        assert health.try_start(now)
+        health.failed(now)
+    return now + BREAKER_COOLDOWN
+
+
+class FakeClient:
+    def __init__(self, error=None):
+        self.error = error
+        self.calls = 0
+
+    def create(self, params):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return SimpleNamespace(model=params["model"])
+
+
+def _deployment(client):
+    # Health records are process-wide per deployment name; keep each test's apart.
+    return Deployment({"model": "gpt-4o", "base_url": f"https://{uuid.uuid4().hex}.test"}, client)
+
+
+def _bad_request():
+    request = httpx.Request("POST", "https://example.test/chat/completions")
+    return openai.BadRequestError("bad request", response=httpx.Response(400, request=request), body=None)
+
+
+def test_breaker_opens_after_repeated_failures():
+    health = DeploymentHealth("d")
+    reopens = _open(health)
+    assert not health.available(reopens - 1)
+    assert not health.try_start(reopens - 1)
+    assert health.stats(reopens - 1)["state"] == "open"
+    assert health.available(reopens)
+
+
+def test_only_one_caller_gets_the_half_open_trial():
+    health = DeploymentHealth("d")
+    reopens = _open(health)
+    barrier = threading.Barrier(20)
+    started = []
+
+    def call():
+        barrier.wait()
+        started.append(health.try_start(reopens))
+
+    threads = [threading.Thread(target=call) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert started.count(True) == 1
+    assert health.trial
+
+
+def test_released_trial_lets_the_next_call_probe():
+    health = DeploymentHealth("d")
+    reopens = _open(health)
+    assert health.try_start(reopens)
+    # The trial call was rejected as a bad request, which says nothing about the deployment.
+    health.released()
+    assert not health.trial
+    assert health.available(reopens)
+    assert health.try_start(reopens)
+
+
+def test_failed_trial_doubles_the_cooldown_and_success_closes():
+    health = DeploymentHealth("d")
+    reopens = _open(health)
+    assert health.try_start(reopens)
+    health.failed(reopens)
+    assert health.open_until == reopens + 2 * BREAKER_COOLDOWN
+    assert health.try_start(health.open_until)
+    health.succeeded(0.5)
+    assert health.open_until == 0.0 and health.cooldown == BREAKER_COOLDOWN
+    assert health.stats(0)["state"] == "closed"
+
+
+def test_routed_client_fails_over_to_the_next_deployment():
+    failing, healthy = FakeClient(RuntimeError("502")), FakeClient()
+    routed = RoutedClient([_deployment(failing), _deployment(healthy)])
+    # Both are unmeasured, so ranking keeps their order.
+    response = routed.create({"model": "ignored", "messages": []})
+    assert failing.calls == 1 and healthy.calls == 1
+    assert response.deployment == routed.deployments[1].name
+    assert routed.deployments[0].health.failures == 1
+
+
+def test_bad_request_is_not_retried_elsewhere_and_releases_the_call():
+    rejecting, healthy = FakeClient(_bad_request()), FakeClient()
+    routed = RoutedClient([_deployment(rejecting), _deployment(healthy)])
+    with pytest.raises(openai.BadRequestError):
+        routed.create({"model": "ignored", "messages": []})
+    assert healthy.calls == 0
+    health = routed.deployments[0].health
+    assert health.in_flight == 0 and health.failures == 0
+
+
+def test_all_ejected_probes_the_first_to_come_back():
+    client = FakeClient()
+    deployment = _deployment(client)
+    _open(deployment.health, now=10**9)
+    response = RoutedClient([deployment]).create({"model": "ignored", "messages": []})
+    assert response.deployment == deployment.name
+    assert deployment.health.open_until == 0.0
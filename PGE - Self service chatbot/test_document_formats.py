@@ -0,0 +1,124 @@
+import io
+import zipfile
+
+import pytest
+
+import document_formats
+from document_formats import SNIFF_BYTES, UNSUPPORTED_FORMAT, detect_format, extract_document, read_document
+from extraction_cache import ExtractionCache
+
+W = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+
+DOCUMENT_XML = f"""<w:document xmlns:w="{W}"><w:body>
+<w:p><w:pPr><w:pStyle w:val="Heading1"/></w:pPr><w:r><w:t>Scope</w:t></w:r></w:p>
+<w:p><w:r><w:t>Outage reporting portal.</w:t></w:r></w:p>
+<w:tbl>
+<w:tr><w:tc><w:p><w:r><w:t>Users</w:t></w:r></w:p></w:tc><w:tc><w:p><w:r><w:t>Volume</w:t></w:r></w:p></w:tc></w:tr>
+<w:tr><w:tc><w:p><w:r><w:t>Customers</w:t></w:r></w:p></w:tc><w:tc><w:p><w:r><w:t>5000</w:t></w:r></w:p></w:tc></w:tr>
+</w:tbl>
+</w:body></w:document>"""
+
+STYLES_XML = f"""<w:styles xmlns:w="{W}">
+<w:style w:styleId="Heading1"><w:name w:val="heading 1"/></w:style>
+</w:styles>"""
+
+
+def _zip(files):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, content in files.items():
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def docx():
+    return _zip({"word/document.xml": DOCUMENT_XML, "word/styles.xml": STYLES_XML})
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = ExtractionCache(path=str(tmp_path / "extraction_cache.db"))
+    monkeypatch.setattr(document_formats, "default_extraction_cache", lambda: cache)
+    return cache
+
+
+@pytest.mark.parametrize(
+    "head, kind",
+    [
+        (b"%PDF-1.7\n", "pdf"),
+        (b"\xef\xbb\xbfjunk before the header %PDF-1.4\n", "pdf"),
+        ("A portal for the customers, 5000 users.\n".encode(), "txt"),
+        (b"PK\x03\x04\x14\x00\x00\x00 truncated zip", None),
+        (b"\x89PNG\r\n\x1a\n\x00\x00", None),
+    ],
+)
+def test_formats_are_recognised_from_their_content(head, kind):
+    document_format = detect_format(head)
+    assert (document_format.kind if document_format else None) == kind
+
+
+def test_a_character_cut_off_by_the_sniff_is_still_text():
+    text = ("a" * (SNIFF_BYTES - 1) + "é").encode()
+    assert detect_format(text).kind == "txt"
+
+
+def test_docx_is_recognised_by_its_document_part(docx):
+    assert detect_format(docx).kind == "docx"
+    assert detect_format(_zip({"xl/workbook.xml": "<workbook/>"})) is None
+
+
+def test_bytes_bytesio_and_paths_read_the_same(tmp_path, docx):
+    path = tmp_path / "requirements.docx"
+    path.write_bytes(docx)
+    buffer = io.BytesIO(docx)
+    texts = [extract_document(detect_format(source), source) for source in (docx, buffer, str(path))]
+    assert texts[0] == texts[1] == texts[2]
+    assert texts[0].startswith("# Scope\nOutage reporting portal.\n\n| Users | Volume |")
+    assert "| Customers | 5000 |" in texts[0]
+    # No view of the upload buffer outlives the read, so it can still be resized.
+    buffer.seek(0, io.SEEK_END)
+    buffer.write(b"\0")
+
+
+def test_text_is_returned_as_is():
+    source = "Requirements\n    - indented item\n\n\nend".encode()
+    assert extract_document(detect_format(source), source) == source.decode()
+    assert extract_document(detect_format(io.BytesIO(source)), io.BytesIO(source)) == source.decode()
+
+
+def test_cached_formats_are_served_from_the_extraction_cache(cache, docx):
+    document_format = detect_format(docx)
+    first = extract_document(document_format, docx, digest="d" * 64)
+    second = extract_document(document_format, b"not parsed again", digest="d" * 64)
+    assert first == second
+    assert cache.stats()["entries"] == 1 and cache.stats()["hits"] == 1
+    assert cache.get("d" * 64, document_format.cache_kind)["text"] == first
+
+
+def test_read_document_handles_missing_and_unsupported_files(tmp_path, cache):
+    assert read_document(None) is None
+    assert read_document(str(tmp_path / "missing.pdf")) is None
+    image = tmp_path / "scan.png"
+    image.write_bytes(b"\x89PNG\r\n\x1a\n\x00\x00")
+    assert read_document(str(image)) == UNSUPPORTED_FORMAT
+    notes = tmp_path / "notes.txt"
+    notes.write_text("Portal for outage reports.", encoding="utf-8")
+    assert read_document(str(notes)) == "Portal for outage reports."
+
+
+def test_pdf_text_is_extracted_from_bytes_and_bytesio():
+    pytest.importorskip("PyPDF2")
+    canvas = pytest.importorskip("reportlab.pdfgen.canvas")
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer)
+    for page in range(3):
+        pdf.drawString(72, 720, f"Page {page + 1} of the requirements")
+        pdf.showPage()
+    pdf.save()
+    data = buffer.getvalue()
+    document_format = detect_format(data)
+    assert document_format.kind == "pdf"
+    text = extract_document(document_format, data)
+    assert text == extract_document(document_format, io.BytesIO(data))
+    assert [line for line in text.splitlines() if line] == [f"Page {page} of the requirements" for page in (1, 2, 3)]
@@ -0,0 +1,87 @@
+import sqlite3
+import time
+
+import pytest
+
+pytest.importorskip("openai")
+
+from rate_limiter import TokenBucketLimiter, deployment_key, estimate_tokens, without_sdk_retries
+
+
+@pytest.fixture
+def limiter(tmp_path):
+    return TokenBucketLimiter("gpt-4o@test", rpm=6, tpm=6000, path=str(tmp_path / "rate_limits.db"))
+
+
+def _stored(limiter):
+    conn = sqlite3.connect(limiter.path)
+    try:
+        return conn.execute("SELECT requests, tokens, updated_at FROM rate_buckets").fetchall()
+    finally:
+        conn.close()
+
+
+def test_deployment_key_names_model_and_host():
+    assert deployment_key({"model": "gpt-4o"}) == "gpt-4o"
+    assert deployment_key({"model": "gpt-4o", "base_url": "https://east.openai.azure.com/"}) == "gpt-4o@east.openai.azure.com"
+    assert deployment_key({"azure_endpoint": "https://west.openai.azure.com"}) == "default@west.openai.azure.com"
+
+
+def test_estimate_tokens_reserves_the_completion():
+    params = {"messages": [{"content": "x" * 400}], "max_tokens": 50}
+    assert estimate_tokens(params) == 100 + 4 + 50
+    assert estimate_tokens({"messages": []}) > 0
+
+
+def test_without_sdk_retries_turns_off_sdk_retries():
+    config = {"temperature": 0, "max_retries": 2}
+    assert without_sdk_retries(config) == {"temperature": 0, "max_retries": 0}
+    assert config["max_retries"] == 2
+
+
+def test_idle_limiter_has_full_headroom(limiter):
+    assert limiter.headroom() == 1.0
+    assert limiter.projected_wait() == 0.0
+
+
+def test_drained_bucket_projects_a_wait(limiter):
+    for _ in range(limiter.rpm):
+        assert limiter.acquire(10) < 1
+    # One request refills every 10 s at 6 RPM.
+    assert 9 < limiter.projected_wait() <= 10
+    assert limiter.headroom() < 0.01
+    assert 9 < limiter.stats()["queue_wait_s"] <= 10
+
+
+def test_projected_wait_does_not_write(limiter):
+    limiter.acquire(10)
+    before = _stored(limiter)
+    limiter.projected_wait()
+    limiter.stats()
+    assert _stored(limiter) == before
+
+
+def test_stats_are_read_while_another_worker_holds_the_write_lock(limiter):
+    limiter.acquire(10)
+    other = sqlite3.connect(limiter.path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    try:
+        started = time.monotonic()
+        limiter.stats()
+        assert time.monotonic() - started < 1
+    finally:
+        other.execute("ROLLBACK")
+        other.close()
+
+
+def test_penalize_holds_back_every_caller(limiter):
+    limiter.penalize(5)
+    assert limiter.headroom() == -1.0
+    assert 4 < limiter.projected_wait() <= 5
+    assert limiter.stats()["throttled_429"] == 1
+
+
+def test_settle_returns_unused_tokens(limiter):
+    limiter.acquire(3000)
+    limiter.settle(3000, 1000)
+    assert _stored(limiter)[0][1] == pytest.approx(5000, abs=10)
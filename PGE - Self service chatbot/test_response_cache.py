@@ -0,0 +1,69 @@
+import json
+import time
+
+import pytest
+
+from response_cache import ReplayMiss, ResponseCache
+
+
+def _key(content, **params):
+    # autogen keys its cache on the JSON of the request parameters.
+    return json.dumps({"model": "gpt-4o", "temperature": 0, "messages": [{"role": "user", "content": content}], **params})
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(path=str(tmp_path / "response_cache.db"))
+
+
+def test_roundtrip_and_hit_counts(cache):
+    assert cache.get(_key("hi")) is None
+    cache.set(_key("hi"), {"reply": "hello"})
+    assert cache.get(_key("hi")) == {"reply": "hello"}
+    assert cache.stats()["entries"] == 1
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (1, 1)
+
+
+def test_streamed_and_plain_requests_share_an_entry(cache):
+    cache.set(_key("hi", stream=True), "hello")
+    assert cache.get(_key("hi")) == "hello"
+
+
+def test_sampled_requests_are_not_cached(cache):
+    key = _key("hi", temperature=0.7)
+    cache.set(key, "hello")
+    assert cache.get(key, "missing") == "missing"
+    assert cache.stats()["entries"] == 0
+
+
+def test_expired_entries_are_not_served(tmp_path):
+    cache = ResponseCache(path=str(tmp_path / "response_cache.db"), ttl=0.01)
+    cache.set(_key("hi"), "hello")
+    time.sleep(0.05)
+    assert cache.get(_key("hi")) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entries_are_evicted_past_max_bytes(tmp_path):
+    cache = ResponseCache(path=str(tmp_path / "response_cache.db"), max_bytes=2500)
+    cache.set(_key("old"), "x" * 1000)
+    time.sleep(0.01)
+    cache.set(_key("used"), "y" * 1000)
+    time.sleep(0.01)
+    cache.get(_key("old"))
+    time.sleep(0.01)
+    cache.set(_key("new"), "z" * 1000)
+    assert cache.get(_key("used")) is None
+    assert cache.get(_key("old")) == "x" * 1000
+    assert cache.get(_key("new")) == "z" * 1000
+
+
+def test_replay_mode_raises_on_a_miss_and_never_writes(tmp_path):
+    path = str(tmp_path / "response_cache.db")
+    ResponseCache(path=path).set(_key("recorded"), "hello")
+    replay = ResponseCache(path=path, replay_only=True)
+    assert replay.get(_key("recorded")) == "hello"
+    with pytest.raises(ReplayMiss):
+        replay.get(_key("new"))
+    replay.set(_key("new"), "ignored")
+    assert replay.stats()["entries"] == 1
@@ -0,0 +1,126 @@
+import threading
+import time
+
+import pytest
+
+from running_summary import RunningSummary
+
+
+class FakeClient:
+    """Summarizes by appending the new exchanges to the summary; can be held to keep an update in flight."""
+
+    def __init__(self):
+        self.requests = []
+        self.release = threading.Event()
+        self.release.set()
+        self.error = None
+
+    def create(self, messages, **kwargs):
+        self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+        self.requests.append(messages[-1]["content"])
+        current, exchanges = messages[-1]["content"].removeprefix("Current summary:\n").split("\n\nNew exchanges:\n")
+        return exchanges if current == "(empty)" else f"{current}\n{exchanges}"
+
+    def extract_text_or_completion_object(self, response):
+        return [response]
+
+
+def _settle(summary):
+    deadline = time.monotonic() + 5
+    while summary._running and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not summary._running
+
+
+@pytest.fixture
+def client():
+    return FakeClient()
+
+
+def test_turns_are_folded_in_the_background(client):
+    summary = RunningSummary(client)
+    summary.add_turn("customer", "A portal for 5000 users.")
+    summary.add_turn("architect", "Which cloud?")
+    _settle(summary)
+    assert "A portal for 5000 users." in summary.current()
+    assert "Latest exchanges" not in summary.current()
+    assert summary.summary_method(None, None, {}) == summary.current()
+
+
+def test_unfolded_turns_are_appended_and_can_be_excluded(client):
+    summary = RunningSummary(client)
+    client.release.clear()
+    summary.add_turn("customer", "A portal.")
+    summary.add_turn("architect", "Which cloud?")
+    assert summary.current() == "customer: A portal.\n\narchitect: Which cloud?"
+    assert summary.current(exclude={"Which cloud?"}) == "customer: A portal."
+    client.release.set()
+    _settle(summary)
+
+
+def test_blank_turns_are_ignored(client):
+    summary = RunningSummary(client)
+    summary.add_turn("customer", "   ")
+    summary.add_turn("customer", None)
+    assert summary.current() == "" and not client.requests
+
+
+def test_failed_update_keeps_the_raw_turns(client):
+    summary = RunningSummary(client)
+    client.error = RuntimeError("timeout")
+    summary.add_turn("customer", "A portal.")
+    _settle(summary)
+    assert summary.current() == "customer: A portal."
+
+
+def test_reset_drops_an_update_in_flight(client):
+    summary = RunningSummary(client)
+    summary.on_update = lambda text, summarized: pytest.fail("checkpointed a reset summary")
+    client.release.clear()
+    summary.add_turn("customer", "Old session.")
+    summary.reset()
+    client.release.set()
+    time.sleep(0.1)
+    assert summary.current() == "" and summary.on_update is None
+
+
+def test_each_update_is_checkpointed(client):
+    summary = RunningSummary(client)
+    checkpoints = []
+    summary.on_update = lambda text, summarized: checkpoints.append((text, summarized))
+    summary.add_turn("customer", "A portal.")
+    _settle(summary)
+    summary.add_turn("architect", "Which cloud?")
+    _settle(summary)
+    assert [summarized for _, summarized in checkpoints] == [1, 2]
+    assert checkpoints[-1][0] == summary.current()
+
+
+def test_restore_does_not_fold_the_checkpointed_history_again(client):
+    turns = [("customer", "A portal."), ("architect", "Which cloud?"), ("customer", "Azure.")]
+    summary = RunningSummary(client)
+    summary.restore(turns, summary="Portal on Azure.", summarized=2)
+    # Only the turn after the checkpoint is left raw.
+    assert summary.current() == "Portal on Azure.\n\nLatest exchanges:\ncustomer: Azure."
+    summary.add_turn("architect", "How many users?")
+    _settle(summary)
+    assert len(client.requests) == 1
+    assert "A portal." not in client.requests[0]
+    assert "Current summary:\nPortal on Azure." in client.requests[0]
+
+
+def test_restore_past_the_loaded_turns_skips_a_resent_turn(client):
+    summary = RunningSummary(client)
+    summary.restore([("customer", "A portal.")], summary="Portal.", summarized=2)
+    # The last checkpointed turn was folded in before the crash and is sent again on resume.
+    summary.add_turn("architect", "Which cloud?")
+    _settle(summary)
+    assert not client.requests and summary.current() == "Portal."
+
+
+def test_restore_without_a_summary_keeps_the_turns_raw(client):
+    summary = RunningSummary(client)
+    summary.restore([("customer", "A portal."), ("architect", "")], summarized=5)
+    assert summary.current() == "customer: A portal."
@@ -0,0 +1,104 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+autogen = pytest.importorskip("autogen")
+
+import semantic_cache
+from semantic_cache import SemanticCache, cosine, embed, enable_semantic_first_turn
+
+STATEMENT = "We need a customer portal for 5000 users to track outage reports and billing on Azure."
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return SemanticCache(path=str(tmp_path / "semantic_cache.db"))
+
+
+def _user(content):
+    return {"role": "user", "content": content}
+
+
+def _agents(cache, reply="What integrations do you need?"):
+    interviewer = autogen.ConversableAgent(
+        "interviewer",
+        system_message="You are an architect.",
+        llm_config=False,
+        default_auto_reply=reply,
+        human_input_mode="NEVER",
+    )
+    customer = autogen.ConversableAgent("customer", llm_config=False, human_input_mode="NEVER", max_consecutive_auto_reply=0)
+    enable_semantic_first_turn(interviewer, cache)
+    return interviewer, customer
+
+
+def _flush():
+    semantic_cache._writer.submit(lambda: None).result()
+
+
+def test_embedding_is_normalised_and_order_aware():
+    vector = embed(STATEMENT)
+    assert cosine(vector, vector) == pytest.approx(1.0)
+    assert cosine(vector, embed(STATEMENT.upper())) == pytest.approx(1.0)
+    assert cosine(embed("portal for outage reports"), embed("reports outage for portal")) < 0.9
+
+
+def test_near_duplicates_hit_and_other_contexts_miss(cache):
+    cache.record("ctx", STATEMENT, "reply")
+    reply, score = cache.lookup("ctx", STATEMENT + " Thanks!")
+    assert reply == "reply" and score >= cache.threshold
+    assert cache.lookup("other", STATEMENT) == (None, 0.0)
+    assert cache.lookup("ctx", "A mobile game with leaderboards.") == (None, 0.0)
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+
+def test_only_opening_turns_have_a_key(cache):
+    agent = SimpleNamespace(system_message="system")
+    assert cache.key(agent, [_user("intro"), _user(STATEMENT)])[1] == STATEMENT
+    assert cache.key(agent, [_user("intro"), _user(STATEMENT), _user("more")]) is None
+    assert cache.key(agent, [_user("intro"), {"role": "assistant", "content": "hi"}]) is None
+    assert cache.key(agent, [_user("   ")]) is None
+
+
+def test_expired_entries_are_neither_served_nor_kept(tmp_path):
+    cache = SemanticCache(path=str(tmp_path / "semantic_cache.db"), ttl=0.01)
+    cache.record("ctx", STATEMENT, "reply")
+    time.sleep(0.05)
+    assert cache.lookup("ctx", STATEMENT) == (None, 0.0)
+    assert cache.evict() == 1
+
+
+def test_oldest_entries_are_evicted_past_max_entries(tmp_path):
+    cache = SemanticCache(path=str(tmp_path / "semantic_cache.db"), max_entries=2)
+    for n in range(3):
+        cache.record("ctx", f"{STATEMENT} Variant {n}.", f"reply {n}")
+        time.sleep(0.01)
+    assert cache.stats()["entries"] == 2
+    assert cache.lookup("ctx", f"{STATEMENT} Variant 0.")[0] != "reply 0"
+    assert cache.lookup("ctx", f"{STATEMENT} Variant 2.")[0] == "reply 2"
+
+
+def test_sync_chat_records_the_reply_and_serves_it_next_time(cache):
+    interviewer, customer = _agents(cache)
+    customer.send(STATEMENT, interviewer, request_reply=True)
+    _flush()
+    assert cache.stats()["entries"] == 1
+
+    interviewer, customer = _agents(cache, reply="never used")
+    customer.send(STATEMENT, interviewer, request_reply=True)
+    assert customer.last_message(interviewer)["content"] == "What integrations do you need?"
+
+
+def test_async_chat_looks_up_once_per_turn(cache):
+    interviewer, customer = _agents(cache)
+    asyncio.run(customer.a_send(STATEMENT, interviewer, request_reply=True))
+    _flush()
+    # The sync reply function after the async one does not look the turn up again.
+    assert cache.stats()["misses"] == 1 and cache.stats()["entries"] == 1
+
+    interviewer, customer = _agents(cache, reply="never used")
+    asyncio.run(customer.a_send(STATEMENT, interviewer, request_reply=True))
+    assert customer.last_message(interviewer)["content"] == "What integrations do you need?"
+    assert cache.stats()["hits"] == 1
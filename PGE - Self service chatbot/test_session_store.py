@@ -0,0 +1,78 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from session_store import SessionStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SessionStore(path=str(tmp_path / "sessions.db"))
+
+
+@pytest.fixture
+def dead_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def _owned_by(store, session_id, pid, status="active"):
+    store._connect().execute("UPDATE sessions SET worker_pid = ?, status = ? WHERE session_id = ?", (pid, status, session_id))
+
+
+def test_update_merges_state_and_sets_columns(store):
+    session_id = store.create_session("hello")
+    assert store.update(session_id, stage="interview", state={"summary": {"text": "a", "summarized": 1}})
+    assert store.update(session_id, state={"cost": {"calls": 2}})
+    record = store.get(session_id)
+    assert record["stage"] == "interview" and record["initial_message"] == "hello"
+    assert record["state"] == {"summary": {"text": "a", "summarized": 1}, "cost": {"calls": 2}}
+    assert store.get("missing") is None
+    assert not store.update("missing", stage="x")
+
+
+def test_update_with_owner_only_applies_for_the_holding_worker(store):
+    session_id = store.create_session()
+    assert not store.update(session_id, status="completed", owner=os.getpid() + 1)
+    assert store.get(session_id)["status"] == "active"
+    assert store.update(session_id, status="completed", owner=os.getpid())
+
+
+def test_claim_refuses_a_session_a_live_worker_serves(store):
+    session_id = store.create_session()
+    _owned_by(store, session_id, os.getppid())
+    assert not store.claim(session_id)
+
+
+def test_claim_takes_over_from_a_dead_worker(store, dead_pid):
+    session_id = store.create_session()
+    _owned_by(store, session_id, dead_pid)
+    assert store.claim(session_id)
+    assert store.get(session_id)["worker_pid"] == os.getpid()
+
+
+def test_claim_refuses_completed_sessions(store, dead_pid):
+    session_id = store.create_session()
+    _owned_by(store, session_id, dead_pid, status="completed")
+    assert not store.claim(session_id)
+
+
+def test_recover_orphans_frees_sessions_of_dead_workers(store, dead_pid):
+    mine, orphan = store.create_session(), store.create_session()
+    _owned_by(store, orphan, dead_pid)
+    assert store.recover_orphans() == 1
+    assert store.get(orphan)["status"] == "orphaned"
+    assert store.get(mine)["status"] == "active"
+
+
+def test_turns_are_appended_in_order(store):
+    session_id = store.create_session()
+    assert store.append_turn(session_id, "user_proxy", "agent", "hi") == 1
+    assert store.append_turn(session_id, "agent", "user_proxy", "hello") == 2
+    assert [(turn["seq"], turn["sender"], turn["content"]) for turn in store.load_turns(session_id)] == [
+        (1, "user_proxy", "hi"),
+        (2, "agent", "hello"),
+    ]
@@ -0,0 +1,69 @@
+import asyncio
+import time
+
+import pytest
+
+from stage_graph import Stage, StageGraph, with_carryover
+
+
+def test_with_carryover_matches_autogen_layout():
+    assert with_carryover("Estimate.", {}) == "Estimate."
+    assert with_carryover("Estimate.", {"a": "", "b": None}) == "Estimate."
+    assert with_carryover("Estimate.", {"a": "one", "b": "two"}) == "Estimate.\nContext: \none\ntwo"
+
+
+def test_stages_get_their_dependencies_outputs():
+    graph = StageGraph(
+        [
+            Stage("wbs", lambda upstream: "wbs"),
+            Stage("cost", lambda upstream: f"cost({upstream['wbs']})", after=["wbs"]),
+            Stage("tco", lambda upstream: f"tco({upstream['cost']}, {upstream['wbs']})", after=["cost", "wbs"]),
+        ]
+    )
+    outputs = graph.run()
+    assert outputs == {"wbs": "wbs", "cost": "cost(wbs)", "tco": "tco(cost(wbs), wbs)"}
+    assert graph.critical_path() == ["wbs", "cost", "tco"]
+    assert "Critical path: wbs" in graph.report()
+
+
+def test_independent_stages_run_concurrently():
+    async def slow(upstream):
+        await asyncio.sleep(0.2)
+        return "done"
+
+    graph = StageGraph([Stage(name, slow) for name in ("a", "b", "c")])
+    started = time.perf_counter()
+    graph.run(max_concurrency=3)
+    assert time.perf_counter() - started < 0.5
+
+
+def test_concurrency_of_one_runs_stages_in_declared_order():
+    order = []
+
+    def record(name):
+        return lambda upstream: order.append(name)
+
+    StageGraph([Stage(name, record(name)) for name in ("c", "a", "b")]).run(max_concurrency=1)
+    assert order == ["c", "a", "b"]
+
+
+@pytest.mark.parametrize(
+    "stages, message",
+    [
+        ([Stage("a", None), Stage("a", None)], "Duplicate stage"),
+        ([Stage("a", None, after=["missing"])], "unknown stages"),
+        ([Stage("a", None, after=["b"]), Stage("b", None, after=["a"])], "cycle"),
+    ],
+)
+def test_invalid_graphs_are_rejected(stages, message):
+    with pytest.raises(ValueError, match=message):
+        StageGraph(stages)
+
+
+def test_a_failing_stage_fails_the_run():
+    def fail(upstream):
+        raise RuntimeError("model down")
+
+    graph = StageGraph([Stage("a", fail), Stage("b", lambda upstream: "never", after=["a"])])
+    with pytest.raises(RuntimeError, match="model down"):
+        graph.run()
@@ -0,0 +1,42 @@
+import pytest
+
+pytest.importorskip("autogen")
+
+from events import TOKEN, TOKEN_END
+from streaming import TokenIOStream
+
+
+class EventStream:
+    def __init__(self):
+        self.events = []
+
+    def emit(self, event, **fields):
+        self.events.append((event, fields))
+
+
+def _stream_completion(chunks):
+    # What the OpenAI client prints around a streamed completion.
+    events = EventStream()
+    stream = TokenIOStream(events, "estimation_agent", message_id="m1")
+    stream.print("\033[32m", end="")
+    for chunk in chunks:
+        stream.print(chunk, end="", flush=True)
+    stream.print("\033[0m\n")
+    stream.end()
+    return events.events
+
+
+def test_whitespace_only_deltas_reach_the_client():
+    events = _stream_completion(["Tech", " ", "stack", "\n\n", "- Python"])
+    deltas = [fields["delta"] for event, fields in events if event == TOKEN]
+    assert "".join(deltas) == "Tech stack\n\n- Python"
+    assert events[-1] == (TOKEN_END, {"agent": "estimation_agent", "message_id": "m1"})
+
+
+def test_colour_codes_are_stripped_from_content():
+    events = _stream_completion(["\033[32mgreen", " text"])
+    assert [fields["delta"] for event, fields in events if event == TOKEN] == ["green", " text"]
+
+
+def test_nothing_streamed_sends_no_end_event():
+    assert _stream_completion([]) == []
@@ -0,0 +1,35 @@
+import os
+
+try:
+    import tiktoken
+except ImportError:  # counts fall back to a 4-characters-per-token estimate
+    tiktoken = None
+
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "cl100k_base")
+
+# Framing tokens the chat format adds around each message.
+TOKENS_PER_MESSAGE = 4
+
+_encoding = None
+
+
+def _encoder():
+    global _encoding
+    if _encoding is None and tiktoken is not None:
+        _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+    return _encoding
+
+
+def count_tokens(text) -> int:
+    if not text:
+        return 0
+    text = text if isinstance(text, str) else str(text)
+    encoding = _encoder()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages) -> int:
+    """Prompt tokens of a list of chat messages."""
+    return sum(count_tokens(message.get("content")) + TOKENS_PER_MESSAGE for message in messages) + 3
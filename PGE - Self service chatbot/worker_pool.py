@@ -0,0 +1,104 @@
+import asyncio
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+
+class ServerBusy(Exception):
+    """Raised when a session cannot be admitted; retry_after is in seconds."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Server busy, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+# -------------------- Bounded Session Executor --------------------
+class BoundedSessionExecutor:
+    """
+    Runs blocking Q&A sessions on a fixed pool of worker threads, off the event loop.
+    At most max_workers sessions run at once and at most max_queue wait for a worker;
+    anything beyond that is rejected immediately with ServerBusy.
+    """
+
+    def __init__(self, max_workers=4, max_queue=8, expected_duration=120.0):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="qa-session")
+        self._pending = 0
+        self._avg_duration = expected_duration
+        self._lock = threading.Lock()
+
+    def retry_after(self) -> int:
+        """Rough wait until a worker frees up, from the moving average session duration."""
+        with self._lock:
+            queued = max(0, self._pending - self.max_workers)
+            avg = self._avg_duration
+        return max(1, math.ceil(avg * (queued + 1) / self.max_workers))
+
+    def submit(self, fn, *args, **kwargs) -> asyncio.Future:
+        """Admit a session and return an awaitable for its result, or raise ServerBusy."""
+        with self._lock:
+            admitted = self._pending < self.max_workers + self.max_queue
+            if admitted:
+                self._pending += 1
+        if not admitted:
+            raise ServerBusy(self.retry_after())
+
+        def run():
+            started = time.monotonic()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._pending -= 1
+                    self._avg_duration = 0.8 * self._avg_duration + 0.2 * (time.monotonic() - started)
+
+        try:
+            return asyncio.wrap_future(self._executor.submit(run))
+        except RuntimeError:
+            with self._lock:
+                self._pending -= 1
+            raise
+
+    def stats(self):
+        with self._lock:
+            return {
+                "running": min(self._pending, self.max_workers),
+                "queued": max(0, self._pending - self.max_workers),
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "avg_session_seconds": round(self._avg_duration, 1),
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# -------------------- Session IO --------------------
+class WebSocketBridgeIOStream:
+    """
+    IOStream for a session running in a worker thread: output and human input
+    are forwarded to the FastAPI websocket that lives on the event loop. With an
+    idle_timeout, waiting on the user longer than that raises TimeoutError and
+    frees the worker.
+    """
+
+    def __init__(self, websocket, loop: asyncio.AbstractEventLoop, idle_timeout=None):
+        self._websocket = websocket
+        self._loop = loop
+        self.idle_timeout = idle_timeout
+
+    def print(self, *objects, sep=" ", end="\n", flush=False) -> None:
+        msg = sep.join(map(str, objects)) + end
+        asyncio.run_coroutine_threadsafe(self._websocket.send_text(msg), self._loop).result()
+
+    def input(self, prompt: str = "", *, password: bool = False) -> str:
+        if prompt:
+            self.print(prompt)
+        pending = asyncio.run_coroutine_threadsafe(self._websocket.receive_text(), self._loop)
+        try:
+            return pending.result(timeout=self.idle_timeout)
+        except FutureTimeoutError:
+            pending.cancel()
+            raise TimeoutError(f"No reply from the user within {self.idle_timeout}s") from None
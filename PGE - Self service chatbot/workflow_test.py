@@ -1,4 +1,5 @@
 import autogen
+from response_cache import response_cache_config
 import json
 from autogen import AssistantAgent, UserProxyAgent
 from pypdf import PdfReader
@@ -14,6 +15,7 @@ llm_config = {
         "OAI_CONFIG_LIST"
     ),
     "temperature": 0,
+    **response_cache_config(),
 }
 
 input_assistant = AssistantAgent(
@@ -61,8 +61,15 @@ def extract_text_from_docx(docx_path):
     return "\n".join([para.text for para in doc.paragraphs])
 
 def extract_text_from_pdf(pdf_path):
+    # Page by page: a page that fails to extract or has no text layer is skipped, not fatal.
     reader = PdfReader(pdf_path)
-    return "\n".join(page.extract_text() for page in reader.pages)
+    pages = []
+    for number, page in enumerate(reader.pages, start=1):
+        try:
+            pages.append(page.extract_text() or "")
+        except Exception as err:
+            print(f"Skipping page {number} of {pdf_path}: {err}")
+    return "\n".join(text for text in pages if text)
 
 def read_document(file_path):
     if not file_path or not os.path.exists(file_path):